@@ -0,0 +1,199 @@
+import asyncio
+import time
+import traceback
+from collections import deque
+from config import ALLOCATION_RECONCILE_INTERVAL
+from request_scheduler import BACKGROUND, request_priority
+
+# Reservations older than this are assumed abandoned and dropped on the next rebuild
+RESERVATION_TIMEOUT = 600
+# Minimum seconds between rebuilds triggered by lookups of unknown allocation IDs
+MISS_REBUILD_INTERVAL = 30
+
+class AllocationIndex:
+    """In-memory index of free allocations per node, kept up to date on create and delete"""
+    def __init__(self, api):
+        self.api = api
+        self.nodes = {}          # Format: {node_id: node_attributes}
+        self.allocations = {}    # Format: {allocation_id: allocation_attributes}
+        self.node_of = {}        # Format: {allocation_id: node_id}
+        self.free = {}           # Format: {node_id: {allocation_id: allocation_attributes}}
+        self.built_at = None
+
+        # Nodes that still have free allocations, in round-robin order
+        self._rotation = deque()
+        self._in_rotation = set()
+
+        # Allocations handed out for a create that has not finished yet
+        self._reserved = {}  # Format: {allocation_id: reserved_at}
+        # Last local change per allocation, so a reconcile that started earlier can't undo it
+        self._changed = {}
+
+        self._build_lock = None
+        self._reconcile_task = None
+
+    def _lock(self):
+        # Created lazily so it binds to the bot's running loop
+        if self._build_lock is None:
+            self._build_lock = asyncio.Lock()
+        return self._build_lock
+
+    async def build(self):
+        """Load every node and its allocations from the panel and rebuild the index"""
+        async with self._lock():
+            await self._build()
+
+    async def ensure_built(self):
+        """Build the index if it has not been built yet"""
+        if self.built_at is None:
+            async with self._lock():
+                # Another caller may have built it while we waited for the lock
+                if self.built_at is None:
+                    await self._build()
+
+    async def _build(self):
+        # Caller must hold the build lock
+        started = time.monotonic()
+        self._reserved = {k: v for k, v in self._reserved.items() if started - v < RESERVATION_TIMEOUT}
+        nodes = await self.api.get_nodes(fresh=True)
+        if not nodes and self.nodes:
+            print("No nodes returned by the panel, keeping the current allocation index")
+            return
+
+        node_allocations = await asyncio.gather(
+            *(self.api.get_node_allocations(node['attributes']['id']) for node in nodes)
+        )
+
+        new_nodes = {}
+        new_allocations = {}
+        new_node_of = {}
+        new_free = {}
+        for node, allocations in zip(nodes, node_allocations):
+            node_id = node['attributes']['id']
+            new_nodes[node_id] = node['attributes']
+            new_free[node_id] = {}
+
+            if allocations is None:
+                # The fetch failed, so keep what the index knew about this node rather than dropping it
+                print(f"Keeping the indexed allocations of node {node_id}, they could not be fetched")
+                for allocation_id, attributes in self.allocations.items():
+                    if self.node_of.get(allocation_id) == node_id:
+                        new_allocations[allocation_id] = attributes
+                        new_node_of[allocation_id] = node_id
+                new_free[node_id] = dict(self.free.get(node_id, {}))
+                continue
+
+            for allocation in allocations:
+                # Copied, since the decoded response may be shared with other callers and is read-only
+                attributes = dict(allocation['attributes'])
+                allocation_id = attributes['id']
+
+                # Keep local state for allocations changed after this fetch started
+                if self._changed.get(allocation_id, 0) >= started and allocation_id in self.allocations:
+                    attributes['assigned'] = self.allocations[allocation_id]['assigned']
+
+                new_allocations[allocation_id] = attributes
+                new_node_of[allocation_id] = node_id
+                if not attributes['assigned'] and allocation_id not in self._reserved:
+                    new_free[node_id][allocation_id] = attributes
+
+        self.nodes = new_nodes
+        self.allocations = new_allocations
+        self.node_of = new_node_of
+        self.free = new_free
+        self._rotation = deque(node_id for node_id, free in new_free.items() if free)
+        self._in_rotation = set(self._rotation)
+        self._changed = {k: v for k, v in self._changed.items() if v >= started}
+        self.built_at = time.monotonic()
+
+        free_count = sum(len(free) for free in new_free.values())
+        print(f"Allocation index built: {len(new_nodes)} nodes, {len(new_allocations)} allocations, {free_count} free")
+
+    def lookup(self, allocation_id):
+        """Get an allocation with its node ID in O(1), or None if it is not indexed"""
+        allocation = self.allocations.get(allocation_id)
+        if allocation is None:
+            return None
+        return {**allocation, 'node': self.node_of[allocation_id]}
+
+    async def resolve(self, allocation_id):
+        """Look up an allocation, rebuilding once if the ID is unknown and the index is not fresh"""
+        await self.ensure_built()
+        allocation = self.lookup(allocation_id)
+
+        if allocation is None and time.monotonic() - self.built_at >= MISS_REBUILD_INTERVAL:
+            async with self._lock():
+                # Concurrent misses share one rebuild: the others find it fresh once they get the lock
+                if time.monotonic() - self.built_at >= MISS_REBUILD_INTERVAL:
+                    await self._build()
+            allocation = self.lookup(allocation_id)
+
+        return allocation
+
+    def pop(self):
+        """Take a free allocation, rotating between nodes to spread servers evenly"""
+        while self._rotation:
+            node_id = self._rotation[0]
+            free = self.free.get(node_id)
+
+            if not free:
+                self._rotation.popleft()
+                self._in_rotation.discard(node_id)
+                continue
+
+            self._rotation.rotate(-1)
+            allocation_id, allocation = free.popitem()
+            self._reserved[allocation_id] = self._changed[allocation_id] = time.monotonic()
+
+            return {
+                'node': self.nodes[node_id],
+                'allocation': allocation
+            }
+
+        return None
+
+    def confirm(self, allocation_id):
+        """Mark a reserved allocation as assigned after the server was created"""
+        self._reserved.pop(allocation_id, None)
+        self._changed[allocation_id] = time.monotonic()
+
+        allocation = self.allocations.get(allocation_id)
+        if allocation:
+            allocation['assigned'] = True
+
+    def discard(self, allocation_id):
+        """Drop a reserved allocation the panel refused; the next reconcile decides if it is free"""
+        self._reserved.pop(allocation_id, None)
+
+    def release(self, allocation_id):
+        """Return an allocation to the free pool (unused reservation or deleted server)"""
+        self._reserved.pop(allocation_id, None)
+        self._changed[allocation_id] = time.monotonic()
+
+        allocation = self.allocations.get(allocation_id)
+        node_id = self.node_of.get(allocation_id)
+        if allocation is None or node_id is None:
+            return
+
+        allocation['assigned'] = False
+        self.free.setdefault(node_id, {})[allocation_id] = allocation
+        if node_id not in self._in_rotation:
+            self._rotation.append(node_id)
+            self._in_rotation.add(node_id)
+
+    async def _reconcile_loop(self):
+        """Periodically rebuild the index to pick up changes made outside the bot"""
+        # This task's panel requests yield to interactive ones
+        request_priority.set(BACKGROUND)
+        while True:
+            await asyncio.sleep(ALLOCATION_RECONCILE_INTERVAL)
+            try:
+                await self.build()
+            except Exception as e:
+                print(f"Exception reconciling allocation index: {str(e)}")
+                traceback.print_exc()
+
+    def start(self):
+        """Start the background reconcile task"""
+        if self._reconcile_task is None or self._reconcile_task.done():
+            self._reconcile_task = asyncio.ensure_future(self._reconcile_loop())
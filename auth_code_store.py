@@ -0,0 +1,161 @@
+import heapq
+import threading
+import time
+from collections.abc import MutableMapping
+import persistence
+
+class AuthCodeStore(MutableMapping):
+    """Auth codes that expire, kept in a min-heap ordered by expiry
+
+    Behaves like {auth_code: discord_user_id}. Expired codes are dropped lazily on lookup,
+    on every issue and by an optional purger thread, so memory and the stored data stay
+    proportional to the live codes. Each Discord user keeps at most per_user_limit codes.
+    """
+    def __init__(self, ttl, per_user_limit, records=None):
+        self.ttl = ttl
+        self.per_user_limit = per_user_limit
+        self._codes = {}    # Format: {auth_code: (discord_user_id, expires_at)}
+        self._by_user = {}  # Format: {discord_user_id: [auth_code, ...]} oldest first
+        self._heap = []     # Format: [(expires_at, auth_code)], may hold entries already removed
+        self._lock = threading.RLock()
+        self._purger = None
+
+        # Records are {auth_code: {'discord_id': ..., 'expires_at': ...}}; older plain-ID entries never expire, so drop them
+        now = time.time()
+        dropped = []
+        for code, record in (records or {}).items():
+            if isinstance(record, dict) and record.get('expires_at', 0) > now:
+                self._insert(code, str(record['discord_id']), record['expires_at'])
+            else:
+                dropped.append(code)
+        if dropped:
+            persistence.remove_auth_codes(dropped)
+            print(f"Dropped {len(dropped)} expired auth codes")
+
+    def _insert(self, code, discord_id, expires_at):
+        self._codes[code] = (discord_id, expires_at)
+        self._by_user.setdefault(discord_id, []).append(code)
+        heapq.heappush(self._heap, (expires_at, code))
+
+    def _remove(self, code):
+        discord_id, _ = self._codes.pop(code)
+        codes = self._by_user[discord_id]
+        codes.remove(code)
+        if not codes:
+            del self._by_user[discord_id]
+
+    def _purge_expired(self, now):
+        """Drop expired codes from the top of the heap; returns the dropped codes"""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, code = heapq.heappop(self._heap)
+            record = self._codes.get(code)
+            # Skip heap entries for codes already removed or re-issued
+            if record is not None and record[1] == expires_at:
+                self._remove(code)
+                expired.append(code)
+
+        # Rebuild the heap once removed codes make up most of it
+        if len(self._heap) > 2 * len(self._codes) + 16:
+            self._heap = [(expires_at, code) for code, (_, expires_at) in self._codes.items()]
+            heapq.heapify(self._heap)
+        return expired
+
+    def issue(self, code, discord_id, ttl=None):
+        """Store a new code for a Discord user, evicting the user's oldest code past the cap; returns its expiry time"""
+        discord_id = str(discord_id)
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.ttl)
+
+        with self._lock:
+            removed = self._purge_expired(now)
+            if code in self._codes:
+                self._remove(code)
+
+            codes = self._by_user.get(discord_id, [])
+            while len(codes) >= self.per_user_limit:
+                oldest = codes[0]
+                self._remove(oldest)
+                removed.append(oldest)
+
+            self._insert(code, discord_id, expires_at)
+
+        if removed:
+            persistence.remove_auth_codes(removed)
+        persistence.add_auth_code(code, discord_id, expires_at)
+        return expires_at
+
+    def track(self, code, discord_id, expires_at):
+        """Add a code issued by another process, without storing it again"""
+        with self._lock:
+            if code in self._codes:
+                self._remove(code)
+            if expires_at > time.time():
+                self._insert(code, str(discord_id), expires_at)
+
+    def forget(self, code):
+        """Drop a code removed by another process, without storing the removal again"""
+        with self._lock:
+            if code in self._codes:
+                self._remove(code)
+
+    def purge(self):
+        """Drop every expired code now; returns how many were dropped"""
+        with self._lock:
+            expired = self._purge_expired(time.time())
+        if expired:
+            persistence.remove_auth_codes(expired)
+        return len(expired)
+
+    def _purge_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.purge()
+            except Exception as e:
+                print(f"Error purging auth codes: {e}")
+
+    def start_purger(self, interval):
+        """Start a background thread purging expired codes every interval seconds"""
+        if self._purger is None or not self._purger.is_alive():
+            self._purger = threading.Thread(target=self._purge_loop, args=(interval,), name="auth-code-purger", daemon=True)
+            self._purger.start()
+
+    def expires_at(self, code):
+        """Get a live code's expiry time, or None if it is unknown or expired"""
+        with self._lock:
+            record = self._codes.get(code)
+            if record is None or record[1] <= time.time():
+                return None
+            return record[1]
+
+    def __getitem__(self, code):
+        with self._lock:
+            record = self._codes.get(code)
+            if record is None:
+                raise KeyError(code)
+            if record[1] > time.time():
+                return record[0]
+            # Lazy expiry
+            self._remove(code)
+        persistence.remove_auth_codes([code])
+        raise KeyError(code)
+
+    def __setitem__(self, code, discord_id):
+        self.issue(code, discord_id)
+
+    def __delitem__(self, code):
+        with self._lock:
+            if code not in self._codes:
+                raise KeyError(code)
+            self._remove(code)
+        persistence.remove_auth_codes([code])
+
+    def __iter__(self):
+        self.purge()
+        with self._lock:
+            return iter(list(self._codes))
+
+    def __len__(self):
+        self.purge()
+        return len(self._codes)
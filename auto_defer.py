@@ -0,0 +1,127 @@
+import asyncio
+import functools
+import time
+from collections import deque
+from config import AUTO_DEFER_BUDGET, AUTO_DEFER_PERCENTILE
+
+# Time-to-first-response samples kept per command and code path, and how many are needed before predicting
+LATENCY_SAMPLE_SIZE = 100
+LATENCY_MIN_SAMPLES = 5
+
+# Path recorded for commands that never name one
+DEFAULT_PATH = 'default'
+
+class CommandLatency:
+    """Rolling time-to-first-response samples per command and code path"""
+    def __init__(self, percentile):
+        self.percentile = percentile
+        self._samples = {}  # Format: {(command, path): deque of seconds}
+
+    def record(self, command, path, seconds):
+        samples = self._samples.get((command, path))
+        if samples is None:
+            samples = self._samples[(command, path)] = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        samples.append(seconds)
+
+    def predict(self, command, path):
+        """Seconds a path is expected to take before its first response, or None with too few samples"""
+        samples = self._samples.get((command, path), ())
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+class Responder:
+    """Answers one interaction inline, or with followups once it has been deferred
+
+    The interaction is deferred as soon as the path the command takes is predicted to
+    need more than the budget before its first response, and in any case once the budget
+    runs out without a response, so Discord's 3 second acknowledgement is never missed.
+    """
+    def __init__(self, interaction, command, latency, budget, ephemeral):
+        self.interaction = interaction
+        self.command = command
+        self.latency = latency
+        self.budget = budget
+        self.ephemeral = ephemeral
+        self.path = DEFAULT_PATH
+        self.started = time.monotonic()
+        self.responded = False
+        self.deferred = False
+        self._lock = asyncio.Lock()
+        self._watchdog = None
+
+    async def follow_path(self, path):
+        """Name the code path the command takes; defers right away if it is predicted to be slow"""
+        self.path = path
+        predicted = self.latency.predict(self.command, path)
+        if predicted is not None and predicted > self.budget:
+            await self.defer()
+
+    async def defer(self):
+        """Acknowledge the interaction now; the next send fills the placeholder and later ones are followups"""
+        async with self._lock:
+            if not self.interaction.response.is_done():
+                await self.interaction.response.defer(ephemeral=self.ephemeral, thinking=True)
+                self.deferred = True
+
+    async def send(self, content=None, **kwargs):
+        """Send a message as the interaction's response, or as a followup once it was acknowledged"""
+        async with self._lock:
+            first = not self.responded
+            if first:
+                self.responded = True
+                self.latency.record(self.command, self.path, time.monotonic() - self.started)
+            if not self.interaction.response.is_done():
+                return await self.interaction.response.send_message(content, **kwargs)
+            if first and self.deferred:
+                # The deferred placeholder becomes the first message, so edit() targets it either way
+                kwargs.pop('ephemeral', None)
+                return await self.interaction.edit_original_response(content=content, **kwargs)
+        return await self.interaction.followup.send(content, **kwargs)
+
+    async def edit(self, **kwargs):
+        """Edit the first message sent with send()"""
+        return await self.interaction.edit_original_response(**kwargs)
+
+    async def _defer_when_late(self):
+        await asyncio.sleep(self.budget - (time.monotonic() - self.started))
+        try:
+            await self.defer()
+        except Exception as e:
+            print(f"Exception deferring /{self.command}: {str(e)}")
+
+    def start(self):
+        """Start the fallback that defers once the budget runs out"""
+        self._watchdog = asyncio.ensure_future(self._defer_when_late())
+
+    def stop(self):
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+
+command_latency = CommandLatency(AUTO_DEFER_PERCENTILE)
+
+def responder_for(interaction):
+    """Get the Responder that auto_defer attached to an interaction"""
+    return interaction.extras['responder']
+
+def auto_defer(ephemeral=True):
+    """Decorator for commands answering through responder_for(interaction), deferring only when needed
+
+    ephemeral must match the command's messages: after a defer, Discord takes a
+    followup's visibility from the defer.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(interaction, *args, **kwargs):
+            responder = Responder(interaction, func.__name__, command_latency, AUTO_DEFER_BUDGET, ephemeral)
+            interaction.extras['responder'] = responder
+            # Predicted as a whole until the command names the path it takes
+            await responder.follow_path(DEFAULT_PATH)
+            responder.start()
+            try:
+                return await func(interaction, *args, **kwargs)
+            finally:
+                responder.stop()
+        return wrapper
+    return decorator
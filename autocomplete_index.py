@@ -0,0 +1,171 @@
+import heapq
+import re
+
+# Discord shows at most this many autocomplete choices
+MAX_CHOICES = 25
+# Length of the character n-grams used for fuzzy matching
+GRAM_SIZE = 2
+# Share of the query's n-grams an entry must contain to count as a fuzzy match
+FUZZY_THRESHOLD = 0.5
+
+WORD_SPLIT = re.compile(r'[^0-9a-z]+')
+
+def _words(text):
+    return [word for word in WORD_SPLIT.split(text.lower()) if word]
+
+def _grams(word):
+    padded = f" {word} "
+    return {padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)}
+
+class _TrieNode:
+    __slots__ = ('children', 'keys')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = set()  # Entries with a word ending at this node
+
+class AutocompleteIndex:
+    """Entries searchable by word prefix (trie) with n-gram fuzzy matching as a fallback
+
+    Every word of an entry's text goes into the trie, so "surv" finds "mc-survival".
+    When prefixes give fewer than limit results, query words are matched against the
+    distinct indexed words by shared character bigrams, which tolerates typos, and the
+    entries holding those words fill the rest. Lookups touch only the matching part of
+    the trie and the vocabulary's n-gram postings, not every entry.
+    """
+    def __init__(self):
+        self.entries = {}  # Format: {key: (label, value, search_text)}
+        self._root = _TrieNode()
+        self._grams = {}   # Format: {n-gram: {indexed word, ...}}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, label, value, text=None):
+        """Add or replace an entry; text is what is searched, the label by default"""
+        if key in self.entries:
+            self.remove(key)
+        text = (text or label).lower()
+        self.entries[key] = (label, value, text)
+
+        for word in set(_words(text)):
+            node = self._root
+            for char in word:
+                node = node.children.setdefault(char, _TrieNode())
+            if not node.keys:
+                # First entry with this word: make the word findable by its n-grams
+                for gram in _grams(word):
+                    self._grams.setdefault(gram, set()).add(word)
+            node.keys.add(key)
+
+    def remove(self, key):
+        """Remove an entry if it is indexed"""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+
+        for word in set(_words(entry[2])):
+            path = [self._root]
+            for char in word:
+                path.append(path[-1].children[char])
+            path[-1].keys.discard(key)
+            if not path[-1].keys:
+                for gram in _grams(word):
+                    words = self._grams[gram]
+                    words.discard(word)
+                    if not words:
+                        del self._grams[gram]
+            # Prune nodes left without entries or children
+            for depth in range(len(word), 0, -1):
+                node = path[depth]
+                if node.keys or node.children:
+                    break
+                del path[depth - 1].children[word[depth - 1]]
+
+    def _node(self, word):
+        node = self._root
+        for char in word:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _subtree_keys(self, prefix):
+        """Get every entry with a word starting with prefix"""
+        node = self._node(prefix)
+        keys = set()
+        stack = [node] if node is not None else []
+        while stack:
+            node = stack.pop()
+            keys.update(node.keys)
+            stack.extend(node.children.values())
+        return keys
+
+    def _prefix_keys(self, prefix, limit, found, allowed=None):
+        node = self._node(prefix)
+        if node is None:
+            return
+        # Depth-first from the prefix node, shorter words first at each level, stopping at limit
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            keys = node.keys if allowed is None else node.keys & allowed
+            for key in keys:
+                if key not in found:
+                    found[key] = None
+                    if len(found) >= limit:
+                        return
+            stack.extend(node.children[char] for char in sorted(node.children, reverse=True))
+
+    def _similar_words(self, word):
+        """Get {indexed word: similarity} for words sharing enough n-grams with word"""
+        grams = _grams(word)
+        counts = {}
+        for gram in grams:
+            for candidate in self._grams.get(gram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+        needed = FUZZY_THRESHOLD * len(grams)
+        return {candidate: count / len(grams) for candidate, count in counts.items() if count >= needed}
+
+    def _fuzzy_keys(self, words, limit, found):
+        # Score entries by their best match for each query word; half the words must match on average
+        scores = {}
+        for word in words:
+            best = {}
+            # Ascending similarity, so an entry ends up with its best match for this word
+            for similar, similarity in sorted(self._similar_words(word).items(), key=lambda item: item[1]):
+                best.update(dict.fromkeys(self._node(similar).keys, similarity))
+            for key, similarity in best.items():
+                scores[key] = scores.get(key, 0) + similarity
+
+        # Best scores first, ties by label; only the score tiers needed to reach limit are sorted
+        tiers = {}
+        needed = FUZZY_THRESHOLD * len(words)
+        for key, score in scores.items():
+            if score >= needed and key not in found:
+                tiers.setdefault(score, []).append(key)
+        for score in sorted(tiers, reverse=True):
+            for key in heapq.nsmallest(limit - len(found), tiers[score], key=lambda key: self.entries[key][0]):
+                found[key] = None
+            if len(found) >= limit:
+                return
+
+    def search(self, query, limit=MAX_CHOICES):
+        """Get up to limit (label, value) pairs: word-prefix matches first, then fuzzy matches"""
+        words = _words(query)
+        if not words:
+            return [entry[:2] for entry in heapq.nsmallest(limit, self.entries.values())]
+
+        # Prefix matches on the last word, narrowed to entries that also have the earlier words
+        found = {}
+        allowed = None
+        for word in words[:-1]:
+            keys = self._subtree_keys(word)
+            allowed = keys if allowed is None else allowed & keys
+        if allowed is None or allowed:
+            self._prefix_keys(words[-1], limit, found, allowed)
+        found = dict.fromkeys(sorted(found, key=lambda key: self.entries[key][0]))
+        if len(found) < limit:
+            self._fuzzy_keys(words, limit, found)
+
+        return [self.entries[key][:2] for key in found]
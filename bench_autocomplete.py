@@ -0,0 +1,60 @@
+"""Benchmark autocomplete per keystroke: AutocompleteIndex vs a substring scan over every name
+
+Usage: python bench_autocomplete.py [number_of_names]
+"""
+import random
+import sys
+import time
+from autocomplete_index import MAX_CHOICES, AutocompleteIndex
+
+WORDS = ["survival", "creative", "skyblock", "modded", "vanilla", "paper", "forge", "fabric", "python",
+         "nodejs", "discord", "bot", "web", "api", "lobby", "factions", "minigames", "proxy", "test", "dev"]
+QUERIES = ["survival", "web host", "pyhton bot", "skyblok", "mod", "zzz"]
+
+def make_names(count):
+    """Build server names like users pick them: a few words plus a number"""
+    random.seed(1)
+    return [f"{'-'.join(random.sample(WORDS, random.randint(1, 3)))}-{index}" for index in range(count)]
+
+def substring_search(names, query):
+    """What template_autocomplete did before: scan every name for the query"""
+    query = query.lower()
+    return [name for name in names if query in name.lower()][:MAX_CHOICES]
+
+def keystroke_latencies(search, queries):
+    """Time a search for every prefix of every query, as typed one key at a time"""
+    latencies = []
+    for query in queries:
+        for end in range(1, len(query) + 1):
+            started = time.perf_counter()
+            search(query[:end])
+            latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    names = make_names(count)
+
+    started = time.perf_counter()
+    index = AutocompleteIndex()
+    for position, name in enumerate(names):
+        index.add(position, name, str(position))
+    build_time = time.perf_counter() - started
+
+    indexed = keystroke_latencies(index.search, QUERIES)
+    scanned = keystroke_latencies(lambda query: substring_search(names, query), QUERIES)
+
+    print(f"{count} names, {len(indexed)} keystrokes, index built in {build_time * 1000:.1f} ms")
+    print(f"{'':<16} {'substring':>12} {'index':>12} {'ratio':>8}")
+    for label, fraction in (("p50 (ms)", 0.5), ("p99 (ms)", 0.99)):
+        scan, lookup = percentile(scanned, fraction), percentile(indexed, fraction)
+        print(f"{label:<16} {scan * 1000:12.3f} {lookup * 1000:12.3f} {scan / lookup:7.1f}x")
+    for query in QUERIES:
+        matches = [label for label, _ in index.search(query, 3)]
+        print(f"{query!r:<16} substring: {len(substring_search(names, query)):>3}  index: {matches}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark loading the user/server registry: JSON files vs binary snapshot, dicts vs compact records
+
+Usage: python bench_persistence.py [number_of_users]
+"""
+import contextlib
+import gc
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import persistence
+from compact_registry import CompactRegistry
+from journal_store import JournalBackend
+from snapshot_format import read_snapshot, write_snapshot
+
+def make_state(users):
+    """Build registry data shaped like the real files, with snowflake-sized Discord IDs"""
+    random.seed(1)
+    user_servers = {}
+    pterodactyl_users = {}
+    auth_codes = {}
+    for index in range(users):
+        discord_id = str(random.randrange(10 ** 17, 10 ** 19 // 10))
+        pterodactyl_users[discord_id] = index + 1
+        user_servers[discord_id] = [random.randrange(1, 10 ** 6) for _ in range(random.randint(0, 2))]
+    for index in range(users // 100):
+        auth_codes[f"{index:06X}"] = {'discord_id': random.choice(list(pterodactyl_users)), 'expires_at': time.time() + 600}
+    return user_servers, auth_codes, pterodactyl_users
+
+def best_of(runs, func):
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def measure_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, value
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    user_servers, auth_codes, pterodactyl_users = make_state(users)
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_files = [os.path.join(directory, name) for name in ("user_servers.json", "user_auth_codes.json", "pterodactyl_users.json")]
+        for path, data in zip(json_files, (user_servers, auth_codes, pterodactyl_users)):
+            persistence.write_json_atomic(path, data)
+        snapshot_path = os.path.join(directory, "snapshot.bin")
+        write_snapshot(snapshot_path, {'seq': 0, 'user_servers': user_servers, 'auth_codes': auth_codes,
+                                       'pterodactyl_users': pterodactyl_users})
+
+        json_size = sum(os.path.getsize(path) for path in json_files)
+        binary_size = os.path.getsize(snapshot_path)
+
+        def load_json():
+            # Same work as persistence.load_user_servers / load_user_auth_codes / load_pterodactyl_users
+            return [{str(k): v for k, v in persistence.load_data(path).items()} for path in json_files]
+
+        json_time, _ = best_of(5, load_json)
+        binary_time, snapshot = best_of(5, lambda: read_snapshot(snapshot_path))
+        compact_time, registry = best_of(5, lambda: CompactRegistry.from_snapshot(snapshot_path))
+        # Startup with COMPACT_STATE on the json or sqlite backend: load the backend's dicts, then pack them
+        boot_time, _ = best_of(5, lambda: CompactRegistry.from_mappings(*load_json()[0::2]))
+
+        def open_journal(compact):
+            # Startup on the journal backend with a binary snapshot, without and with COMPACT_STATE
+            backend = JournalBackend(snapshot_path, os.path.join(directory, "journal.log"), compact=compact)
+            with contextlib.redirect_stdout(io.StringIO()):
+                backend.open(*json_files)
+            if compact:
+                return backend.load_compact_registry()
+            return backend.load_user_servers(), backend.load_pterodactyl_users()
+
+        journal_time, _ = best_of(5, lambda: open_journal(False))
+        journal_compact_time, _ = best_of(5, lambda: open_journal(True))
+
+        # Memory held by the loaded registry, measured from a fresh load so keys and values are not shared
+        registry_files = (json_files[0], json_files[2])
+        dict_memory, _ = measure_memory(lambda: [persistence.load_data(path) for path in registry_files])
+        compact_memory, _ = measure_memory(lambda: CompactRegistry.from_snapshot(snapshot_path))
+
+    assert snapshot['user_servers'] == user_servers
+    assert snapshot['pterodactyl_users'] == pterodactyl_users
+
+    for discord_id in random.sample(list(user_servers), 100):
+        assert list(registry.user_servers[discord_id]) == user_servers[discord_id]
+        assert registry.pterodactyl_users[discord_id] == pterodactyl_users[discord_id]
+
+    print(f"{users} linked users, {sum(len(v) for v in user_servers.values())} servers, {len(auth_codes)} auth codes")
+    print(f"{'':<24} {'json':>12} {'binary':>12} {'ratio':>8}   (binary decoded to the same dicts)")
+    print(f"{'file size (KiB)':<24} {json_size / 1024:12.1f} {binary_size / 1024:12.1f} {json_size / binary_size:7.1f}x")
+    print(f"{'load time (ms)':<24} {json_time * 1000:12.1f} {binary_time * 1000:12.1f} {json_time / binary_time:7.1f}x")
+    print(f"{'':<24} {'dicts':>12} {'compact':>12} {'':>8}   (json files vs binary snapshot into CompactRegistry)")
+    print(f"{'load time (ms)':<24} {json_time * 1000:12.1f} {compact_time * 1000:12.1f} {json_time / compact_time:7.1f}x")
+    print(f"{'memory (KiB)':<24} {dict_memory / 1024:12.1f} {compact_memory / 1024:12.1f} {dict_memory / compact_memory:7.1f}x")
+    print(f"{'':<24} {'dicts':>12} {'packed':>12} {'':>8}   (json/sqlite startup: dicts packed into CompactRegistry)")
+    print(f"{'load time (ms)':<24} {json_time * 1000:12.1f} {boot_time * 1000:12.1f} {json_time / boot_time:7.1f}x")
+    print(f"{'':<24} {'dicts':>12} {'compact':>12} {'':>8}   (journal startup from snapshot.bin, without and with COMPACT_STATE)")
+    print(f"{'load time (ms)':<24} {journal_time * 1000:12.1f} {journal_compact_time * 1000:12.1f} "
+          f"{journal_time / journal_compact_time:7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -5,22 +5,50 @@ import asyncio
 import os
 import uuid
 import traceback
-import requests
-from config import DISCORD_BOT_TOKEN, DISCORD_REDIRECT_URI, USER_AUTH_CODES, USER_SERVERS, PTERODACTYL_USERS, SERVER_TEMPLATES
+from config import DISCORD_BOT_TOKEN, DISCORD_REDIRECT_URI, PTERODACTYL_URL, USER_AUTH_CODES, PTERODACTYL_USERS, SERVER_TEMPLATES, templates_version, COMMAND_DEADLINE, AUTH_CODE_PURGE_INTERVAL, MAX_SERVERS_PER_USER, LINK_WAIT_TIMEOUT, watch_state
+from deadlines import deadline, with_deadline
+from auto_defer import auto_defer, responder_for
+import persistence
+from autocomplete_index import AutocompleteIndex
+from render_cache import RenderCache
+from link_waiters import LINK_WAITERS
 from pterodactyl_api import PterodactylAPI
-from web_server import run_web_server_in_thread, set_pterodactyl_api
 
 # Initialize the Discord bot
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
 pterodactyl = PterodactylAPI()
 
+class PteroBot(commands.Bot):
+    async def setup_hook(self):
+        # Let the web server thread run panel calls on this loop
+        pterodactyl.bind_loop(asyncio.get_running_loop())
+
+    async def close(self):
+        # Release the pooled panel connections before the loop shuts down
+        await pterodactyl.close()
+        await super().close()
+
+bot = PteroBot(command_prefix="!", intents=intents)
+
+def listing_path(user_id):
+    """Name the path to a user's servers (cached or panel listing) for auto-defer latency tracking"""
+    return 'cached' if pterodactyl.user_server_cache.is_fresh(user_id) else 'panel'
+
 @bot.event
 async def on_ready():
     print(f"Logged in as {bot.user.name} ({bot.user.id})")
     print("------")
 
+    # Start background panel jobs (on_ready can fire again after a reconnect)
+    pterodactyl.start_background_tasks()
+
+    # Validate templates and build the allocation index before the first /create
+    try:
+        await pterodactyl.warm_up()
+    except Exception as e:
+        print(f"Failed to warm up panel data: {e}")
+
     # Sync slash commands
     try:
         synced = await bot.tree.sync()
@@ -29,22 +57,25 @@ async def on_ready():
         print(f"Failed to sync commands: {e}")
 
 @bot.tree.command(name="link", description="Link your Discord account to Pterodactyl Panel")
+@with_deadline(COMMAND_DEADLINE)
+@auto_defer()
 async def link(interaction: discord.Interaction):
     """Send an authentication link to link Discord account with Pterodactyl Panel"""
+    responder = responder_for(interaction)
     user_id = str(interaction.user.id)
 
     # Check if user is already linked
     if user_id in PTERODACTYL_USERS:
+        # Answered after looking the account up on the panel
+        await responder.follow_path('panel')
         # Get the Pterodactyl user ID
         pterodactyl_user_id = PTERODACTYL_USERS[user_id]
 
         # Try to get user details
         try:
-            user_url = f"{pterodactyl.base_url}/api/application/users/{pterodactyl_user_id}"
-            user_response = requests.get(user_url, headers=pterodactyl.headers)
+            user_data = await pterodactyl.get_user(pterodactyl_user_id)
 
-            if user_response.status_code == 200:
-                user_data = user_response.json()['attributes']
+            if user_data:
 
                 embed = discord.Embed(
                     title="Account Already Linked",
@@ -55,13 +86,13 @@ async def link(interaction: discord.Interaction):
                 embed.add_field(name="Email", value=user_data['email'], inline=True)
                 embed.add_field(name="Panel URL", value=f"[Access Pterodactyl Panel]({pterodactyl.base_url})", inline=False)
 
-                await interaction.response.send_message(embed=embed, ephemeral=True)
+                await responder.send(embed=embed, ephemeral=True)
                 return
         except Exception as e:
             print(f"Error getting user details: {e}")
 
         # Fallback message if we can't get user details
-        await interaction.response.send_message(
+        await responder.send(
             "Your Discord account is already linked to a Pterodactyl account. Use `/servers` to see your servers.",
             ephemeral=True
         )
@@ -95,103 +126,111 @@ async def link(interaction: discord.Interaction):
     view.add_item(button)
     # view.add_item(button2)
 
-    await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
-
-    # Wait to see if the user completes OAuth
-    await asyncio.sleep(30)  # Wait 30 seconds
-
-    # Check if the user was linked through OAuth
-    if user_id in PTERODACTYL_USERS:
-        # Get the Pterodactyl user ID
-        pterodactyl_user_id = PTERODACTYL_USERS[user_id]
-
-        # Try to get user details
-        try:
-            user_url = f"{pterodactyl.base_url}/api/application/users/{pterodactyl_user_id}"
-            user_response = requests.get(user_url, headers=pterodactyl.headers)
-
-            if user_response.status_code == 200:
-                user_data = user_response.json()['attributes']
-
-                embed = discord.Embed(
-                    title="✅ __Account Linked Successfully__",
-                    description="*Your Discord account has been linked to your Pterodactyl account!*\n\n```diff\n+ Connection established successfully\n```",
-                    color=discord.Color.green()
-                )
-                embed.add_field(
-                    name="📝 __Account Information__",
-                    value=f"```yaml\nUsername: {user_data['username']}\nEmail: {user_data['email']}\n```",
-                    inline=False
-                )
+    # Register before sending the button so a fast OAuth callback can't be missed
+    waiter = LINK_WAITERS.register(user_id)
+    await responder.send(embed=embed, view=view, ephemeral=True)
 
-                # Create a view with a button for the panel
-                view = discord.ui.View()
-                panel_button = discord.ui.Button(
-                    label="Access Pterodactyl Panel",
-                    style=discord.ButtonStyle.link,
-                    url=pterodactyl.base_url,
-                    emoji="🔗"
-                )
-                view.add_item(panel_button)
+    # Wait until the web server links the account, or give up after LINK_WAIT_TIMEOUT
+    user_data = await LINK_WAITERS.wait(user_id, waiter, LINK_WAIT_TIMEOUT)
 
-                embed.add_field(
-                    name="🚀 __Next Steps__",
-                    value="```md\n# Create a Server\nUse /create <template> to create a new server\n\n# View Templates\nUse /templates to see available options\n\n# View Your Servers\nUse /servers to see your existing servers\n```",
-                    inline=False
-                )
+    if user_data is None:
+        if user_id not in PTERODACTYL_USERS:
+            embed = discord.Embed(
+                title="⌛ __Link Not Completed__",
+                description="*We didn't see your account get linked in time.*\n\n```md\n# Already finished?\nUse /servers to check your account\n\n# Try again\nUse /link to get a new link\n```",
+                color=discord.Color.orange()
+            )
+            await responder.send(embed=embed, ephemeral=True)
+            return
+        user_data = {}
 
-                # Send the message with the button
-                await interaction.followup.send(embed=embed, view=view, ephemeral=True)
-                return
-        except Exception as e:
-            print(f"Error getting user details: {e}")
+    # Create a view with a button for the panel
+    view = discord.ui.View()
+    panel_button = discord.ui.Button(
+        label="Access Pterodactyl Panel",
+        style=discord.ButtonStyle.link,
+        url=pterodactyl.base_url,
+        emoji="🔗"
+    )
+    view.add_item(panel_button)
 
-        # Fallback message if we can't get user details
+    if 'username' in user_data and 'email' in user_data:
         embed = discord.Embed(
             title="✅ __Account Linked Successfully__",
-            description="*Your Discord account has been linked to your Pterodactyl account!*",
+            description="*Your Discord account has been linked to your Pterodactyl account!*\n\n```diff\n+ Connection established successfully\n```",
             color=discord.Color.green()
         )
-
-        # Create a view with a button for the panel
-        view = discord.ui.View()
-        panel_button = discord.ui.Button(
-            label="Access Pterodactyl Panel",
-            style=discord.ButtonStyle.link,
-            url=pterodactyl.base_url,
-            emoji="🔗"
+        embed.add_field(
+            name="📝 __Account Information__",
+            value=f"```yaml\nUsername: {user_data['username']}\nEmail: {user_data['email']}\n```",
+            inline=False
+        )
+        embed.add_field(
+            name="🚀 __Next Steps__",
+            value="```md\n# Create a Server\nUse /create <template> to create a new server\n\n# View Templates\nUse /templates to see available options\n\n# View Your Servers\nUse /servers to see your existing servers\n```",
+            inline=False
+        )
+    else:
+        # Linked from another process, or found linked after the wait; no account details at hand
+        embed = discord.Embed(
+            title="✅ __Account Linked Successfully__",
+            description="*Your Discord account has been linked to your Pterodactyl account!*",
+            color=discord.Color.green()
         )
-        view.add_item(panel_button)
-
         embed.add_field(
             name="🚀 __Next Steps__",
             value="```md\n# Create a Server\nUse /create <template> to create a new server\n\n# View Templates\nUse /templates to see available options\n```",
             inline=False
         )
 
-        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+    await responder.send(embed=embed, view=view, ephemeral=True)
+
+# Output built only from templates or catalog data, rebuilt when that data changes
+RENDER_CACHE = RenderCache()
+
+def render_embed(name, version, build):
+    """Get a copy of a cached embed that per-user fields can be added to"""
+    rendered = RENDER_CACHE.get(name, version, lambda: build().to_dict())
+    return discord.Embed.from_dict({**rendered, 'fields': list(rendered.get('fields', ()))})
+
+def build_template_index():
+    """Build the autocomplete index of template names"""
+    index = AutocompleteIndex()
+    for template_name, template_data in SERVER_TEMPLATES.items():
+        index.add(template_name, template_name.capitalize(), template_name, f"{template_name} {template_data.get('name', '')}")
+    return index
+
+def build_template_list():
+    """Build the one-line-per-template summary shown when /create gets an unknown template"""
+    template_list = ""
+    for temp_name, temp_data in SERVER_TEMPLATES.items():
+        template_list += f"**{temp_name}**: {temp_data['description']} - RAM: {temp_data['memory']}MB, CPU: {temp_data['cpu']/100} cores, Disk: {temp_data['disk']/1024}GB\n"
+    return template_list
 
 # Define a template autocomplete function
 async def template_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
     """Autocomplete for template names"""
-    templates = list(SERVER_TEMPLATES.keys())
+    index = RENDER_CACHE.get('template-index', templates_version(), build_template_index)
     return [
-        app_commands.Choice(name=template.capitalize(), value=template)
-        for template in templates if current.lower() in template.lower()
+        app_commands.Choice(name=label, value=value)
+        for label, value in index.search(current)
     ]
 
 @bot.tree.command(name="create", description="Create a new server with a specified template")
 @app_commands.describe(template="The template to use for the server", name="Optional custom name for your server")
 @app_commands.autocomplete(template=template_autocomplete)
+@with_deadline(COMMAND_DEADLINE)
+@auto_defer()
 async def create(interaction: discord.Interaction, template: str, name: str = None):
     """Create a new server based on a template"""
+    responder = responder_for(interaction)
     try:
         user_id = str(interaction.user.id)
         print(f"User {user_id} ({interaction.user.name}) is attempting to create a server with template '{template}'")
 
         # Check if the user is linked to a Pterodactyl account
         if user_id not in PTERODACTYL_USERS:
-            await interaction.response.send_message(
+            await responder.send(
                 "You need to link your account first. Use `/link` to get started.",
                 ephemeral=True
             )
@@ -200,9 +239,7 @@ async def create(interaction: discord.Interaction, template: str, name: str = No
         # Check if the template exists
         if template not in SERVER_TEMPLATES:
             # Create a list of available templates with their details
-            template_list = ""
-            for temp_name, temp_data in SERVER_TEMPLATES.items():
-                template_list += f"**{temp_name}**: {temp_data['description']} - RAM: {temp_data['memory']}MB, CPU: {temp_data['cpu']/100} cores, Disk: {temp_data['disk']/1024}GB\n"
+            template_list = RENDER_CACHE.get('template-list', templates_version(), build_template_list)
 
             embed = discord.Embed(
                 title="Template Not Found",
@@ -212,16 +249,17 @@ async def create(interaction: discord.Interaction, template: str, name: str = No
             embed.add_field(name="Available Templates", value=template_list, inline=False)
             embed.set_footer(text="Use /templates to see all available templates")
 
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            await responder.send(embed=embed, ephemeral=True)
             return
 
-        # Sync the user's servers first and check if they can create more
+        # Sync the user's servers if they were not listed recently, then check the quota locally
+        await responder.follow_path(listing_path(user_id))
         await pterodactyl.sync_user_servers(user_id)
 
         # Check if the user can create more servers
         if not await pterodactyl.can_create_server(user_id):
-            await interaction.response.send_message(
-                "You have reached the maximum number of servers (2). Please delete a server before creating a new one. Use `/delete <server_id>` to delete a server.",
+            await responder.send(
+                f"You have reached the maximum number of servers ({MAX_SERVERS_PER_USER}). Please delete a server before creating a new one. Use `/delete <server_id>` to delete a server.",
                 ephemeral=True
             )
             return
@@ -245,7 +283,7 @@ async def create(interaction: discord.Interaction, template: str, name: str = No
         embed.set_footer(text="Server creation in progress... This may take a moment.")
 
         # Send initial message
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        await responder.send(embed=embed, ephemeral=True)
 
         # Create the server
         pterodactyl_user_id = PTERODACTYL_USERS[user_id]
@@ -253,18 +291,18 @@ async def create(interaction: discord.Interaction, template: str, name: str = No
 
         # Update the embed with progress
         embed.description = f"**{template_data['description']}**\n\n**Status:** Finding available node and allocation..."
-        await interaction.edit_original_response(embed=embed)
+        await responder.edit(embed=embed)
 
         # Update the embed with progress
         embed.description = f"**{template_data['description']}**\n\n**Status:** Configuring server settings..."
-        await interaction.edit_original_response(embed=embed)
+        await responder.edit(embed=embed)
 
         server, error = await pterodactyl.create_server(pterodactyl_user_id, template, server_name)
 
         if server:
             try:
                 # Register the server for the user
-                await pterodactyl.register_server_for_user(user_id, server['id'])
+                await pterodactyl.register_server_for_user(user_id, server['id'], server)
                 print(f"Server created successfully with ID: {server['id']} for user {user_id}")
 
                 # Get server name (with fallback)
@@ -302,9 +340,9 @@ async def create(interaction: discord.Interaction, template: str, name: str = No
                         connection_info = f"{connection_host}:{port}"
                         embed.add_field(name="Connection Info", value=f"`{connection_info}`", inline=False)
                     else:
-                        # Try to get allocation details from the API
+                        # Resolve the allocation from the included relationship or the allocation index
                         try:
-                            allocation_details = pterodactyl.get_allocation_sync(allocation)
+                            allocation_details = await pterodactyl.get_server_allocation(server)
                             if allocation_details:
                                 # Prefer alias over IP address
                                 alias = allocation_details.get('alias')
@@ -328,7 +366,7 @@ async def create(interaction: discord.Interaction, template: str, name: str = No
                 embed.set_footer(text="Your server is now being installed. It may take a few minutes before it's ready to use.")
 
                 # Update the original message with the success embed
-                await interaction.edit_original_response(embed=embed)
+                await responder.edit(embed=embed)
             except Exception as e:
                 print(f"Exception handling server creation success: {str(e)}")
                 traceback.print_exc()
@@ -341,7 +379,7 @@ async def create(interaction: discord.Interaction, template: str, name: str = No
                 )
                 simple_embed.add_field(name="Panel URL", value=f"[Access Pterodactyl Panel]({pterodactyl.base_url})", inline=False)
 
-                await interaction.edit_original_response(embed=simple_embed)
+                await responder.edit(embed=simple_embed)
         else:
             print(f"Server creation failed for user {user_id}: {error}")
             error_embed = discord.Embed(
@@ -354,57 +392,54 @@ async def create(interaction: discord.Interaction, template: str, name: str = No
                 value="Please try again later or contact an administrator for assistance.",
                 inline=False
             )
-            await interaction.edit_original_response(embed=error_embed)
+            await responder.edit(embed=error_embed)
     except Exception as e:
         print(f"Exception in create command: {str(e)}")
-        await interaction.followup.send(f"An unexpected error occurred: {str(e)}", ephemeral=True)
+        await responder.send(f"An unexpected error occurred: {str(e)}", ephemeral=True)
 
 @bot.tree.command(name="servers", description="List your servers")
+@with_deadline(COMMAND_DEADLINE)
+@auto_defer()
 async def servers(interaction: discord.Interaction):
     """List all servers owned by the user"""
+    responder = responder_for(interaction)
     user_id = str(interaction.user.id)
 
     # Check if the user is linked to a Pterodactyl account
     if user_id not in PTERODACTYL_USERS:
-        await interaction.response.send_message(
+        await responder.send(
             "You need to link your account first. Use `/link` to get started.",
             ephemeral=True
         )
         return
 
-    await interaction.response.defer(ephemeral=True, thinking=True)
-
-    # Sync the user's servers first
-    await pterodactyl.sync_user_servers(user_id)
+    # Defers only if this path is predicted to miss the acknowledgement window
+    await responder.follow_path(listing_path(user_id))
 
-    # Get the user's servers
+    # Get the user's servers (listed from the panel only if the cached list is stale)
     pterodactyl_user_id = PTERODACTYL_USERS[user_id]
-    servers = await pterodactyl.get_user_servers(pterodactyl_user_id)
+    servers = await pterodactyl.get_cached_user_servers(user_id)
 
     if servers:
         embed = discord.Embed(
             title="🖥️ __Your Servers__",
-            description=f"You have **{len(servers)}** server(s) out of a maximum of **2**",
+            description=f"You have **{len(servers)}** server(s) out of a maximum of **{MAX_SERVERS_PER_USER}**",
             color=discord.Color.blue()
         )
 
+        # Look up the account and every server's connection details at the same time
+        user_data, allocations = await pterodactyl.get_servers_details(pterodactyl_user_id, servers)
+
         # Add user information
-        try:
-            user_url = f"{pterodactyl.base_url}/api/application/users/{pterodactyl_user_id}"
-            user_response = requests.get(user_url, headers=pterodactyl.headers)
-
-            if user_response.status_code == 200:
-                user_data = user_response.json()['attributes']
-                embed.add_field(
-                    name="📝 __Account Information__",
-                    value=f"```md\n# Username: {user_data['username']}\n# Email: {user_data['email']}\n```",
-                    inline=False
-                )
-        except Exception as e:
-            print(f"Error getting user details: {e}")
+        if user_data:
+            embed.add_field(
+                name="📝 __Account Information__",
+                value=f"```md\n# Username: {user_data['username']}\n# Email: {user_data['email']}\n```",
+                inline=False
+            )
 
         # Add server information
-        for i, server in enumerate(servers):
+        for server, allocation in zip(servers, allocations):
             # Get server status with emoji
             status = server.get('status')
             if status is None or status == 'offline':
@@ -420,34 +455,17 @@ async def servers(interaction: discord.Interaction):
             # Get server identifier
             server_id = server.get('identifier', server.get('uuid', server.get('id', 'Unknown')))
 
-            # Get connection info
+            # Get connection info (the lookup may have failed or run out of time)
             connection_info = "Check panel for details"
-            if 'allocation' in server:
-                allocation = server['allocation']
-                if isinstance(allocation, dict):
-                    # Prefer alias over IP address
-                    alias = allocation.get('alias')
-                    ip = allocation.get('ip', 'Unknown')
-                    port = allocation.get('port', 'Unknown')
-
-                    # Use alias if available, otherwise use IP
-                    connection_host = alias if alias else ip
-                    connection_info = f"{connection_host}:{port}"
-                else:
-                    # Try to get allocation details from the API
-                    try:
-                        allocation_details = pterodactyl.get_allocation_sync(allocation)
-                        if allocation_details:
-                            # Prefer alias over IP address
-                            alias = allocation_details.get('alias')
-                            ip = allocation_details.get('ip', 'Unknown')
-                            port = allocation_details.get('port', 'Unknown')
-
-                            # Use alias if available, otherwise use IP
-                            connection_host = alias if alias else ip
-                            connection_info = f"{connection_host}:{port}"
-                    except Exception as e:
-                        print(f"Error getting allocation details: {e}")
+            if allocation:
+                # Prefer alias over IP address
+                alias = allocation.get('alias')
+                ip = allocation.get('ip', 'Unknown')
+                port = allocation.get('port', 'Unknown')
+
+                # Use alias if available, otherwise use IP
+                connection_host = alias if alias else ip
+                connection_info = f"{connection_host}:{port}"
 
             # Get server resources
             memory = server.get('limits', {}).get('memory', 'Unknown')
@@ -491,13 +509,13 @@ async def servers(interaction: discord.Interaction):
             )
 
         # Add a note about how to create more servers and delete servers
-        if len(servers) < 2:
+        if len(servers) < MAX_SERVERS_PER_USER:
             embed.add_field(
                 name="💬 __Available Commands__",
                 value=f"```md\n# /delete - Delete a server\n# /create <template> - Create a new server\n# /templates - View available templates\n```",
                 inline=False
             )
-            embed.set_footer(text=f"✨ You can create {2 - len(servers)} more server(s) out of a maximum of 2.")
+            embed.set_footer(text=f"✨ You can create {MAX_SERVERS_PER_USER - len(servers)} more server(s) out of a maximum of {MAX_SERVERS_PER_USER}.")
         else:
             embed.add_field(
                 name="💬 __Available Commands__",
@@ -506,7 +524,7 @@ async def servers(interaction: discord.Interaction):
             )
             embed.set_footer(text="⚠️ You have reached the maximum number of servers.")
 
-        await interaction.followup.send(embed=embed, ephemeral=True)
+        await responder.send(embed=embed, ephemeral=True)
     else:
         embed = discord.Embed(
             title="🔍 __No Servers Found__",
@@ -518,39 +536,120 @@ async def servers(interaction: discord.Interaction):
             value="```md\n# Step 1: View available templates\nUse the /templates command to see what's available\n\n# Step 2: Create your first server\nUse /create <template> to launch your server\n```",
             inline=False
         )
-        embed.set_footer(text="✨ You can create up to 2 servers with your account.")
-        await interaction.followup.send(embed=embed, ephemeral=True)
+        embed.set_footer(text=f"✨ You can create up to {MAX_SERVERS_PER_USER} servers with your account.")
+        await responder.send(embed=embed, ephemeral=True)
+
+def build_delete_confirmation(user_id, server_id, server_name, server_data):
+    """Build the embed and buttons asking to confirm deleting a server"""
+    # Create confirmation embed
+    confirm_embed = discord.Embed(
+        title="⚠️ __Confirm Server Deletion__",
+        description=f"**Are you sure you want to delete:**\n\n```fix\n{server_name}\n```\n*This action cannot be undone.*",
+        color=discord.Color.red()
+    )
+
+    # Create confirmation buttons
+    confirm_view = discord.ui.View(timeout=60)
+    confirm_button = discord.ui.Button(label="Confirm Delete", style=discord.ButtonStyle.danger, custom_id=f"confirm_{server_id}")
+    cancel_button = discord.ui.Button(label="Cancel", style=discord.ButtonStyle.secondary, custom_id="cancel")
+
+    async def confirm_callback(interaction):
+        # Delete the server (button callbacks run outside the command's deadline)
+        with deadline(COMMAND_DEADLINE):
+            # The server was listed from the panel just now, so its ownership needs no extra lookup
+            success = await pterodactyl.delete_server(server_id, user_id, server_data)
+
+        if success:
+            success_embed = discord.Embed(
+                title="✅ __Server Deleted Successfully__",
+                description=f"Your server **{server_name}** has been removed from your account.",
+                color=discord.Color.green()
+            )
+            success_embed.add_field(
+                name="🚀 __Next Steps__",
+                value="```md\n# Create a New Server\nUse /create <template> to create a new server\n\n# View Templates\nUse /templates to see available options\n```",
+                inline=False
+            )
+            await interaction.response.edit_message(embed=success_embed, view=None)
+        else:
+            error_embed = discord.Embed(
+                title="❌ __Error Deleting Server__",
+                description=f"```diff\n- Failed to delete server: {server_name}\n```\n*Please try again later or contact an administrator.*",
+                color=discord.Color.red()
+            )
+            await interaction.response.edit_message(embed=error_embed, view=None)
+
+    async def cancel_callback(interaction):
+        cancel_embed = discord.Embed(
+            title="❌ __Operation Cancelled__",
+            description="*Server deletion has been cancelled.*\n\n```ini\n[Your server remains unchanged]\n```",
+            color=discord.Color.orange()
+        )
+        await interaction.response.edit_message(embed=cancel_embed, view=None)
+
+    confirm_button.callback = confirm_callback
+    cancel_button.callback = cancel_callback
+
+    confirm_view.add_item(confirm_button)
+    confirm_view.add_item(cancel_button)
+
+    return confirm_embed, confirm_view
+
+async def server_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    """Autocomplete for the user's server names, answered from the server cache"""
+    return [
+        app_commands.Choice(name=label, value=value)
+        for label, value in pterodactyl.autocomplete_servers(str(interaction.user.id), current)
+    ]
 
 @bot.tree.command(name="delete", description="Delete one of your servers")
-async def delete_server(interaction: discord.Interaction):
+@app_commands.describe(server="Optional server to delete; leave empty to choose from a list")
+@app_commands.autocomplete(server=server_autocomplete)
+@with_deadline(COMMAND_DEADLINE)
+@auto_defer()
+async def delete_server(interaction: discord.Interaction, server: str = None):
     """Delete a server - shows a list of your servers to choose from"""
+    responder = responder_for(interaction)
     user_id = str(interaction.user.id)
 
     # Check if the user is linked to a Pterodactyl account
     if user_id not in PTERODACTYL_USERS:
-        await interaction.response.send_message(
+        await responder.send(
             "You need to link your account first. Use `/link` to get started.",
             ephemeral=True
         )
         return
 
-    await interaction.response.defer(ephemeral=True, thinking=True)
+    # Defers only if this path is predicted to miss the acknowledgement window
+    await responder.follow_path(listing_path(user_id))
 
-    # Sync the user's servers first
-    await pterodactyl.sync_user_servers(user_id)
-
-    # Get the user's servers
-    pterodactyl_user_id = PTERODACTYL_USERS[user_id]
-    servers = await pterodactyl.get_user_servers(pterodactyl_user_id)
+    # Get the user's servers (listed from the panel only if the cached list is stale)
+    servers = await pterodactyl.get_cached_user_servers(user_id)
 
     # Show the list of servers
     if not servers:
-        await interaction.followup.send(
+        await responder.send(
             "You don't have any servers to delete.",
             ephemeral=True
         )
         return
 
+    # A server picked from autocomplete (or typed) goes straight to confirmation
+    if server:
+        wanted = server.strip().lower()
+        chosen = next((candidate for candidate in servers
+                       if wanted in (str(candidate['id']), str(candidate.get('identifier', '')).lower(), candidate['name'].lower())), None)
+        if chosen is None:
+            await responder.send(
+                f"You don't have a server matching `{server}`. Use `/delete` without a server to choose from a list.",
+                ephemeral=True
+            )
+            return
+
+        confirm_embed, confirm_view = build_delete_confirmation(user_id, chosen['id'], chosen['name'], chosen)
+        await responder.send(embed=confirm_embed, view=confirm_view, ephemeral=True)
+        return
+
     embed = discord.Embed(
         title="🖥️ __Select Server to Delete__",
         description="*Click the button below the server you want to remove.*",
@@ -578,57 +677,8 @@ async def delete_server(interaction: discord.Interaction):
         button = discord.ui.Button(label=f"Delete {server_name}", style=discord.ButtonStyle.danger, custom_id=f"delete_{server_id}")
 
         # Define the callback for this button
-        async def button_callback(interaction, server_id=server_id, server_name=server_name):
-            # Create confirmation embed
-            confirm_embed = discord.Embed(
-                title="⚠️ __Confirm Server Deletion__",
-                description=f"**Are you sure you want to delete:**\n\n```fix\n{server_name}\n```\n*This action cannot be undone.*",
-                color=discord.Color.red()
-            )
-
-            # Create confirmation buttons
-            confirm_view = discord.ui.View(timeout=60)
-            confirm_button = discord.ui.Button(label="Confirm Delete", style=discord.ButtonStyle.danger, custom_id=f"confirm_{server_id}")
-            cancel_button = discord.ui.Button(label="Cancel", style=discord.ButtonStyle.secondary, custom_id="cancel")
-
-            async def confirm_callback(interaction):
-                # Delete the server
-                success = await pterodactyl.delete_server(server_id, user_id)
-
-                if success:
-                    success_embed = discord.Embed(
-                        title="✅ __Server Deleted Successfully__",
-                        description=f"Your server **{server_name}** has been removed from your account.",
-                        color=discord.Color.green()
-                    )
-                    success_embed.add_field(
-                        name="🚀 __Next Steps__",
-                        value="```md\n# Create a New Server\nUse /create <template> to create a new server\n\n# View Templates\nUse /templates to see available options\n```",
-                        inline=False
-                    )
-                    await interaction.response.edit_message(embed=success_embed, view=None)
-                else:
-                    error_embed = discord.Embed(
-                        title="❌ __Error Deleting Server__",
-                        description=f"```diff\n- Failed to delete server: {server_name}\n```\n*Please try again later or contact an administrator.*",
-                        color=discord.Color.red()
-                    )
-                    await interaction.response.edit_message(embed=error_embed, view=None)
-
-            async def cancel_callback(interaction):
-                cancel_embed = discord.Embed(
-                    title="❌ __Operation Cancelled__",
-                    description="*Server deletion has been cancelled.*\n\n```ini\n[Your server remains unchanged]\n```",
-                    color=discord.Color.orange()
-                )
-                await interaction.response.edit_message(embed=cancel_embed, view=None)
-
-            confirm_button.callback = confirm_callback
-            cancel_button.callback = cancel_callback
-
-            confirm_view.add_item(confirm_button)
-            confirm_view.add_item(cancel_button)
-
+        async def button_callback(interaction, server_id=server_id, server_name=server_name, server_data=server):
+            confirm_embed, confirm_view = build_delete_confirmation(user_id, server_id, server_name, server_data)
             await interaction.response.edit_message(embed=confirm_embed, view=confirm_view)
 
         button.callback = button_callback
@@ -642,34 +692,16 @@ async def delete_server(interaction: discord.Interaction):
     )
     embed.set_footer(text="⚠️ Deleting a server is permanent and cannot be undone.")
 
-    await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+    await responder.send(embed=embed, view=view, ephemeral=True)
 
-@bot.tree.command(name="templates", description="List available server templates")
-async def templates(interaction: discord.Interaction):
-    """List all available server templates"""
+def build_templates_embed():
+    """Build the /templates embed without the per-user quota field"""
     embed = discord.Embed(
         title="📎 __Available Server Templates__",
         description="*Select a template that fits your needs to create a new server.*\n\n**To create a server:** `/create <template>`",
         color=discord.Color.blue()
     )
 
-    # Add user information if linked
-    user_id = str(interaction.user.id)
-    if user_id in PTERODACTYL_USERS:
-        # Sync the user's servers first
-        await pterodactyl.sync_user_servers(user_id)
-
-        pterodactyl_user_id = PTERODACTYL_USERS[user_id]
-        servers = await pterodactyl.get_user_servers(pterodactyl_user_id)
-        servers_count = len(servers) if servers else 0
-        servers_remaining = max(0, 2 - servers_count)
-
-        embed.add_field(
-            name="📊 __Your Server Quota__",
-            value=f"```yaml\nCurrent Servers: {servers_count}/2\nRemaining Slots: {servers_remaining}\n```",
-            inline=False
-        )
-
     # Add template information
     for template_name, template_data in SERVER_TEMPLATES.items():
         # Format memory and disk
@@ -718,9 +750,36 @@ async def templates(interaction: discord.Interaction):
         )
 
     embed.set_footer(text="✨ Choose a template that best fits your project requirements.")
-    await interaction.response.send_message(embed=embed)
+    return embed
+
+@bot.tree.command(name="templates", description="List available server templates")
+@with_deadline(COMMAND_DEADLINE)
+@auto_defer(ephemeral=False)
+async def templates(interaction: discord.Interaction):
+    """List all available server templates"""
+    embed = render_embed('templates', templates_version(), build_templates_embed)
+
+    # Add user information if linked
+    responder = responder_for(interaction)
+    user_id = str(interaction.user.id)
+    if user_id in PTERODACTYL_USERS:
+        await responder.follow_path(listing_path(user_id))
+        # Get the user's servers (listed from the panel only if the cached list is stale)
+        servers = await pterodactyl.get_cached_user_servers(user_id)
+        servers_count = len(servers) if servers else 0
+        servers_remaining = max(0, MAX_SERVERS_PER_USER - servers_count)
+
+        embed.insert_field_at(
+            0,
+            name="📊 __Your Server Quota__",
+            value=f"```yaml\nCurrent Servers: {servers_count}/{MAX_SERVERS_PER_USER}\nRemaining Slots: {servers_remaining}\n```",
+            inline=False
+        )
+
+    await responder.send(embed=embed)
 
 @bot.tree.command(name="reset-password", description="Reset your Pterodactyl panel password")
+@with_deadline(COMMAND_DEADLINE)
 async def reset_password(interaction: discord.Interaction):
     """Reset your Pterodactyl panel password"""
     user_id = str(interaction.user.id)
@@ -746,11 +805,9 @@ async def reset_password(interaction: discord.Interaction):
 
     # Get user details if possible
     try:
-        user_url = f"{pterodactyl.base_url}/api/application/users/{pterodactyl_user_id}"
-        user_response = requests.get(user_url, headers=pterodactyl.headers)
+        user_data = await pterodactyl.get_user(pterodactyl_user_id)
 
-        if user_response.status_code == 200:
-            user_data = user_response.json()['attributes']
+        if user_data:
             username = user_data['username']
             email = user_data['email']
         else:
@@ -814,7 +871,98 @@ async def reset_password(interaction: discord.Interaction):
         )
         await interaction.edit_original_response(embed=error_embed)
 
+def configured_eggs_by_nest():
+    """Get the egg IDs used by SERVER_TEMPLATES, grouped by nest ID"""
+    configured_eggs = {}
+    for template_name, template_data in SERVER_TEMPLATES.items():
+        nest_id = template_data.get('nest')
+        egg_id = template_data.get('egg')
+        if nest_id and egg_id:
+            if nest_id not in configured_eggs:
+                configured_eggs[nest_id] = []
+            if egg_id not in configured_eggs[nest_id]:
+                configured_eggs[nest_id].append(egg_id)
+    return configured_eggs
+
+def build_panel_info_embed(nests, configured_eggs, eggs_by_nest, nodes, locations):
+    """Build the /panel-info embed from catalog data, without the request stats footer"""
+    # Create an embed for the panel information
+    embed = discord.Embed(
+        title="💻 __Pterodactyl Panel Configuration__",
+        description=f"*System information for administrators*\n\n**Panel URL:** `{PTERODACTYL_URL}`",
+        color=discord.Color.blue()
+    )
+
+    # Add nest information (only configured ones)
+    nest_info = "```yaml\n"
+    for nest in nests:
+        nest_attr = nest['attributes']
+        nest_id = nest_attr['id']
+
+        # Only show nests that have configured eggs
+        if nest_id in configured_eggs:
+            nest_info += f"# {nest_attr['name']} (ID: {nest_id})\n"
+
+            # Get eggs for this nest
+            eggs = eggs_by_nest.get(nest_id)
+            if eggs:
+                found_eggs = False
+                for egg in eggs:
+                    egg_attr = egg['attributes']
+                    egg_id = egg_attr['id']
+
+                    # Only show eggs that are configured in SERVER_TEMPLATES
+                    if egg_id in configured_eggs[nest_id]:
+                        found_eggs = True
+                        # Find which template uses this egg
+                        template_names = []
+                        for template_name, template_data in SERVER_TEMPLATES.items():
+                            if template_data.get('nest') == nest_id and template_data.get('egg') == egg_id:
+                                template_names.append(template_name)
+
+                        template_str = f" (Used in: {', '.join(template_names)})" if template_names else ""
+                        nest_info += f"  - {egg_attr['name']} (ID: {egg_id}){template_str}\n"
+
+                if not found_eggs:
+                    nest_info += "  - No configured eggs found for this nest\n"
+            else:
+                nest_info += "  - No eggs found for this nest\n"
+    nest_info += "```"
+
+    embed.add_field(name="🐥 __Configured Nests and Eggs__", value=nest_info, inline=False)
+
+    if nodes:
+        node_info = "```ini\n"
+        for node in nodes:
+            node_attr = node['attributes']
+            node_info += f"[{node_attr['name']}] (ID: {node_attr['id']})\n"
+            node_info += f"  Location = {node_attr['location_id']}\n"
+            memory_formatted = f"{node_attr['memory']} MB" if node_attr['memory'] < 1024 else f"{node_attr['memory']/1024:.1f} GB"
+            disk_formatted = f"{node_attr['disk']} MB" if node_attr['disk'] < 1024 else f"{node_attr['disk']/1024:.1f} GB"
+            node_info += f"  Memory = {memory_formatted}\n"
+            node_info += f"  Disk = {disk_formatted}\n\n"
+        node_info += "```"
+
+        embed.add_field(name="💻 __Available Nodes__", value=node_info, inline=False)
+    else:
+        embed.add_field(name="💻 __Available Nodes__", value="```diff\n- No nodes found\n```", inline=False)
+
+    if locations:
+        location_info = "```md\n"
+        for location in locations:
+            location_attr = location['attributes']
+            location_info += f"# {location_attr['short']} (ID: {location_attr['id']})\n"
+            location_info += f"  {location_attr['long']}\n\n"
+        location_info += "```"
+
+        embed.add_field(name="📍 __Available Locations__", value=location_info, inline=False)
+    else:
+        embed.add_field(name="📍 __Available Locations__", value="```diff\n- No locations found\n```", inline=False)
+
+    return embed
+
 @bot.tree.command(name="panel-info", description="Get information about the Pterodactyl panel configuration")
+@with_deadline(COMMAND_DEADLINE)
 async def panel_info(interaction: discord.Interaction):
     """Get information about the Pterodactyl panel configuration"""
     # Only allow administrators to use this command
@@ -825,6 +973,9 @@ async def panel_info(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True, thinking=True)
 
     try:
+        # Taken before fetching, so data refreshed meanwhile makes the next call render again
+        version = (templates_version(), pterodactyl.catalog.version)
+
         # Get nests
         nests = await pterodactyl.get_nests()
 
@@ -832,93 +983,27 @@ async def panel_info(interaction: discord.Interaction):
             await interaction.followup.send("No nests found on the Pterodactyl panel.", ephemeral=True)
             return
 
-        # Create an embed for the panel information
-        embed = discord.Embed(
-            title="💻 __Pterodactyl Panel Configuration__",
-            description=f"*System information for administrators*\n\n**Panel URL:** `{PTERODACTYL_URL}`",
-            color=discord.Color.blue()
+        # Get eggs of the nests used by SERVER_TEMPLATES, nodes and locations all at once
+        configured_eggs = configured_eggs_by_nest()
+        nest_ids = [nest['attributes']['id'] for nest in nests if nest['attributes']['id'] in configured_eggs]
+        *eggs, nodes, locations = await asyncio.gather(
+            *(pterodactyl.get_eggs(nest_id) for nest_id in nest_ids),
+            pterodactyl.get_nodes(),
+            pterodactyl.get_locations(),
+        )
+        eggs_by_nest = dict(zip(nest_ids, eggs))
+
+        embed = render_embed('panel-info', version,
+                             lambda: build_panel_info_embed(nests, configured_eggs, eggs_by_nest, nodes, locations))
+
+        # Show how many panel GETs were served by coalescing
+        request_stats = pterodactyl.request_stats()
+        scheduler_stats = request_stats['scheduler']
+        embed.set_footer(
+            text=f"Coalesced panel requests: {request_stats['deduplicated']} of {request_stats['calls']} GETs | "
+                 f"Rate limit: {scheduler_stats['tokens']:.0f}/{scheduler_stats['capacity']:.0f} tokens, "
+                 f"{scheduler_stats['queued']} queued, {scheduler_stats['throttled']} throttled"
         )
-
-        # Get configured eggs from SERVER_TEMPLATES
-        configured_eggs = {}
-        for template_name, template_data in SERVER_TEMPLATES.items():
-            nest_id = template_data.get('nest')
-            egg_id = template_data.get('egg')
-            if nest_id and egg_id:
-                if nest_id not in configured_eggs:
-                    configured_eggs[nest_id] = []
-                if egg_id not in configured_eggs[nest_id]:
-                    configured_eggs[nest_id].append(egg_id)
-
-        # Add nest information (only configured ones)
-        nest_info = "```yaml\n"
-        for nest in nests:
-            nest_attr = nest['attributes']
-            nest_id = nest_attr['id']
-
-            # Only show nests that have configured eggs
-            if nest_id in configured_eggs:
-                nest_info += f"# {nest_attr['name']} (ID: {nest_id})\n"
-
-                # Get eggs for this nest
-                eggs = await pterodactyl.get_eggs(nest_id)
-                if eggs:
-                    found_eggs = False
-                    for egg in eggs:
-                        egg_attr = egg['attributes']
-                        egg_id = egg_attr['id']
-
-                        # Only show eggs that are configured in SERVER_TEMPLATES
-                        if egg_id in configured_eggs[nest_id]:
-                            found_eggs = True
-                            # Find which template uses this egg
-                            template_names = []
-                            for template_name, template_data in SERVER_TEMPLATES.items():
-                                if template_data.get('nest') == nest_id and template_data.get('egg') == egg_id:
-                                    template_names.append(template_name)
-
-                            template_str = f" (Used in: {', '.join(template_names)})" if template_names else ""
-                            nest_info += f"  - {egg_attr['name']} (ID: {egg_id}){template_str}\n"
-
-                    if not found_eggs:
-                        nest_info += "  - No configured eggs found for this nest\n"
-                else:
-                    nest_info += "  - No eggs found for this nest\n"
-        nest_info += "```"
-
-        embed.add_field(name="🐥 __Configured Nests and Eggs__", value=nest_info, inline=False)
-
-        # Get nodes
-        nodes = await pterodactyl.get_nodes()
-        if nodes:
-            node_info = "```ini\n"
-            for node in nodes:
-                node_attr = node['attributes']
-                node_info += f"[{node_attr['name']}] (ID: {node_attr['id']})\n"
-                node_info += f"  Location = {node_attr['location_id']}\n"
-                memory_formatted = f"{node_attr['memory']} MB" if node_attr['memory'] < 1024 else f"{node_attr['memory']/1024:.1f} GB"
-                disk_formatted = f"{node_attr['disk']} MB" if node_attr['disk'] < 1024 else f"{node_attr['disk']/1024:.1f} GB"
-                node_info += f"  Memory = {memory_formatted}\n"
-                node_info += f"  Disk = {disk_formatted}\n\n"
-            node_info += "```"
-
-            embed.add_field(name="💻 __Available Nodes__", value=node_info, inline=False)
-        else:
-            embed.add_field(name="💻 __Available Nodes__", value="```diff\n- No nodes found\n```", inline=False)
-
-        # Get locations
-        locations = await pterodactyl.get_locations()
-        if locations:
-            location_info = "```md\n"
-            for location in locations:
-                location_attr = location['attributes']
-                location_info += f"# {location_attr['short']} (ID: {location_attr['id']})\n"
-                location_info += f"  {location_attr['long']}\n\n"
-            location_info += "```"
-
-            embed.add_field(name="📍 __Available Locations__", value=location_info, inline=False)
-        else:
-            embed.add_field(name="📍 __Available Locations__", value="```diff\n- No locations found\n```", inline=False)
 
         await interaction.followup.send(embed=embed, ephemeral=True)
     except Exception as e:
@@ -926,15 +1011,45 @@ async def panel_info(interaction: discord.Interaction):
         traceback.print_exc()
         await interaction.followup.send(f"An error occurred: {str(e)}", ephemeral=True)
 
+@bot.tree.command(name="cache-clear", description="Clear the cached panel catalog data (nests, eggs, nodes, locations)")
+async def cache_clear(interaction: discord.Interaction):
+    """Clear the cached panel catalog data"""
+    # Only allow administrators to use this command
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("This command is only available to administrators.", ephemeral=True)
+        return
+
+    cleared = pterodactyl.invalidate_catalog()
+
+    embed = discord.Embed(
+        title="🧹 __Catalog Cache Cleared__",
+        description=f"*Removed **{cleared}** cached catalog entries.*\n\n```yaml\nNext lookups: fetched fresh from the panel\n```",
+        color=discord.Color.green()
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 def main():
+    # Flask and the OAuth client are only needed once the bot actually starts
+    from web_server import run_web_server_in_thread, set_pterodactyl_api
+
     # Pass the pterodactyl API instance to the web server
     set_pterodactyl_api(pterodactyl)
 
     # Start the web server in a separate thread
     web_thread = run_web_server_in_thread()
 
+    # Drop expired auth codes in the background
+    USER_AUTH_CODES.start_purger(AUTH_CODE_PURGE_INTERVAL)
+
+    # Pick up links, servers and auth codes changed by other bot or web server processes
+    watch_state()
+
     # Start the Discord bot
-    bot.run(DISCORD_BOT_TOKEN)
+    try:
+        bot.run(DISCORD_BOT_TOKEN)
+    finally:
+        # Write out changes still waiting in the persistence writer
+        persistence.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,93 @@
+import asyncio
+import time
+import traceback
+from collections import OrderedDict
+from request_scheduler import BACKGROUND, run_with_priority
+
+class CatalogCache:
+    """Shared TTL cache for panel catalog data with LRU eviction and stale-while-revalidate"""
+    def __init__(self, max_entries, stale_grace):
+        self.max_entries = max_entries
+        self.stale_grace = stale_grace  # Seconds an expired entry may still be served while it refreshes
+        self._entries = OrderedDict()   # Format: {key: (value, fetched_at)}
+        self._inflight = {}             # Format: {key: asyncio.Task}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.version = 0  # Bumped whenever cached data changes, so output rendered from it can be rebuilt
+
+    async def get(self, key, ttl, fetch):
+        """Get a cached value, calling fetch() on a miss; fetch errors are raised and not cached"""
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            self._entries.move_to_end(key)
+
+            if age < ttl:
+                self.hits += 1
+                return value
+
+            if age < ttl + self.stale_grace:
+                # Serve the stale value now and refresh it in the background
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    refresh = lambda: run_with_priority(fetch(), BACKGROUND)
+                    self._start_fetch(key, refresh).add_done_callback(self._log_refresh_error)
+                return value
+
+        self.misses += 1
+        return await asyncio.shield(self._start_fetch(key, fetch))
+
+    async def refresh(self, key, fetch):
+        """Fetch a value now, bypassing any cached entry, and store it"""
+        return await asyncio.shield(self._start_fetch(key, fetch))
+
+    def _start_fetch(self, key, fetch):
+        # Concurrent misses for the same key share one fetch
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            self._inflight[key] = task
+        return task
+
+    async def _fetch(self, key, fetch):
+        try:
+            value = await fetch()
+            if value is not None:
+                self._store(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key, value):
+        previous = self._entries.get(key)
+        if previous is None or previous[0] != value:
+            self.version += 1
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _log_refresh_error(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            print(f"Exception refreshing catalog cache: {str(error)}")
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+    def invalidate(self, resource=None):
+        """Drop every entry, or only the entries of one resource type; returns how many were dropped"""
+        self.version += 1
+        if resource is None:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+
+        keys = [key for key in self._entries if key[0] == resource]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def __len__(self):
+        return len(self._entries)
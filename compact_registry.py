@@ -0,0 +1,197 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from snapshot_format import NOT_LINKED, NO_SERVER_RECORD, SnapshotArrays, decode_arrays, encode_snapshot, read_snapshot_arrays
+
+class UserRecord:
+    """Linked panel user and owned servers of one Discord user, once it was read for update or changed"""
+    __slots__ = ('pterodactyl_user_id', 'server_ids')
+
+    def __init__(self, pterodactyl_user_id=None, server_ids=None):
+        self.pterodactyl_user_id = pterodactyl_user_id  # None when the user is not linked
+        self.server_ids = server_ids                    # array('q'), None when the user has no server record
+
+class CompactRegistry:
+    """Registry of Discord users stored as integer arrays sorted by snowflake
+
+    The loaded data stays in the snapshot's columns (about 20 bytes per user plus 8 per
+    server) and is found by binary search. A user is copied into a __slots__ record in
+    the overlay the first time it changes or its server list is handed out, since callers
+    may change that list in place. user_servers and pterodactyl_users are dict-like views
+    with string keys that can stand in for USER_SERVERS and PTERODACTYL_USERS.
+    """
+    def __init__(self, arrays=None):
+        if arrays is None:
+            arrays = decode_arrays(encode_snapshot({}))
+        self.ids = arrays.ids
+        self.links = arrays.links
+        self.server_counts = arrays.server_counts
+        self.server_start = arrays.server_start
+        self.servers = arrays.servers
+        self.overlay = {}  # Format: {discord_user_id (int): UserRecord}, replaces the user's columns
+
+        self.user_servers = ServerListsView(self)
+        self.pterodactyl_users = LinksView(self)
+
+    @classmethod
+    def from_mappings(cls, user_servers, pterodactyl_users):
+        """Build a registry from the string-keyed USER_SERVERS and PTERODACTYL_USERS dicts"""
+        return cls(decode_arrays(encode_snapshot({'user_servers': user_servers, 'pterodactyl_users': pterodactyl_users})))
+
+    @classmethod
+    def from_snapshot(cls, file_path):
+        """Load a registry from a binary snapshot file, or None if there is none"""
+        arrays = read_snapshot_arrays(file_path)
+        return cls(arrays) if arrays is not None else None
+
+    def copy(self):
+        """Get an independent copy; the columns are copied whole, which is much cheaper than packing dicts"""
+        arrays = SnapshotArrays(0, array('Q', self.ids), array('q', self.links), array('i', self.server_counts),
+                                array('I', self.server_start), array('q', self.servers), {})
+        registry = CompactRegistry(arrays)
+        registry.overlay = {discord_id: UserRecord(record.pterodactyl_user_id,
+                                                   array('q', record.server_ids) if record.server_ids is not None else None)
+                            for discord_id, record in self.overlay.items()}
+        return registry
+
+    def _index(self, discord_id):
+        index = bisect_left(self.ids, discord_id)
+        if index < len(self.ids) and self.ids[index] == discord_id:
+            return index
+        return None
+
+    def link(self, discord_id):
+        """Get a Discord user's linked panel user ID, or None"""
+        record = self.overlay.get(discord_id)
+        if record is not None:
+            return record.pterodactyl_user_id
+        index = self._index(discord_id)
+        if index is None or self.links[index] == NOT_LINKED:
+            return None
+        return self.links[index]
+
+    def has_servers(self, discord_id):
+        """Check if a Discord user has a server record, without copying it"""
+        record = self.overlay.get(discord_id)
+        if record is not None:
+            return record.server_ids is not None
+        index = self._index(discord_id)
+        return index is not None and self.server_counts[index] != NO_SERVER_RECORD
+
+    def record(self, discord_id):
+        """Get the user's overlay record for reading its server list or changing it, copying it from the columns first"""
+        record = self.overlay.get(discord_id)
+        if record is None:
+            record = UserRecord()
+            index = self._index(discord_id)
+            if index is not None:
+                if self.links[index] != NOT_LINKED:
+                    record.pterodactyl_user_id = self.links[index]
+                if self.server_counts[index] != NO_SERVER_RECORD:
+                    start = self.server_start[index]
+                    record.server_ids = self.servers[start:start + self.server_counts[index]]
+            self.overlay[discord_id] = record
+        return record
+
+    def discord_ids(self, has_field):
+        """Iterate the Discord IDs of users for which has_field(link, server_count_or_record) is true"""
+        overlay = self.overlay
+        for discord_id, link, count in zip(self.ids, self.links, self.server_counts):
+            if discord_id not in overlay and has_field(link, count, None):
+                yield discord_id
+        for discord_id, record in list(overlay.items()):
+            if has_field(None, None, record):
+                yield discord_id
+
+    def server_lists(self):
+        """Iterate (discord_user_id, server_ids) of users with a server record, read-only, without copying them into the overlay"""
+        overlay = self.overlay
+        for discord_id, count, start in zip(self.ids, self.server_counts, self.server_start):
+            if discord_id not in overlay and count != NO_SERVER_RECORD:
+                yield discord_id, self.servers[start:start + count]
+        for discord_id, record in list(overlay.items()):
+            if record.server_ids is not None:
+                yield discord_id, record.server_ids
+
+class _RegistryView(MutableMapping):
+    """String-keyed mapping over one field of a CompactRegistry"""
+    def __init__(self, registry):
+        self._registry = registry
+
+    @staticmethod
+    def _id(key):
+        try:
+            return int(key)
+        except (TypeError, ValueError):
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._clear(self._registry.record(self._id(key)))
+
+    def __iter__(self):
+        return map(str, self._registry.discord_ids(self._has_field))
+
+    def clear(self):
+        # MutableMapping's popitem loop would rescan the columns for every key
+        for key in list(self):
+            del self[key]
+
+    def __len__(self):
+        return sum(1 for _ in self._registry.discord_ids(self._has_field))
+
+class ServerListsView(_RegistryView):
+    """USER_SERVERS view: {discord_user_id: array('q', [server_id, ...])}"""
+    @staticmethod
+    def _has_field(link, count, record):
+        return record.server_ids is not None if record is not None else count != NO_SERVER_RECORD
+
+    @staticmethod
+    def _clear(record):
+        record.server_ids = None
+
+    def __getitem__(self, key):
+        discord_id = self._id(key)
+        if not self._registry.has_servers(discord_id):
+            raise KeyError(key)
+        # Handed out lists may be changed in place, so they always come from the overlay
+        return self._registry.record(discord_id).server_ids
+
+    def __setitem__(self, key, value):
+        self._registry.record(int(key)).server_ids = array('q', value)
+
+    def readonly_items(self):
+        """Iterate (discord_user_id, server_ids) pairs without copying users into the overlay; don't change the lists"""
+        return ((str(discord_id), server_ids) for discord_id, server_ids in self._registry.server_lists())
+
+    def __contains__(self, key):
+        try:
+            return self._registry.has_servers(self._id(key))
+        except KeyError:
+            return False
+
+class LinksView(_RegistryView):
+    """PTERODACTYL_USERS view: {discord_user_id: pterodactyl_user_id}"""
+    @staticmethod
+    def _has_field(link, count, record):
+        return record.pterodactyl_user_id is not None if record is not None else link != NOT_LINKED
+
+    @staticmethod
+    def _clear(record):
+        record.pterodactyl_user_id = None
+
+    def __getitem__(self, key):
+        user_id = self._registry.link(self._id(key))
+        if user_id is None:
+            raise KeyError(key)
+        return user_id
+
+    def __setitem__(self, key, value):
+        self._registry.record(int(key)).pterodactyl_user_id = int(value)
+
+    def __contains__(self, key):
+        try:
+            return self._registry.link(self._id(key)) is not None
+        except KeyError:
+            return False
@@ -1,6 +1,13 @@
 import os
+import threading
 from dotenv import load_dotenv
 import persistence
+from auth_code_store import AuthCodeStore
+from lazy_state import LazyMapping
+from compact_registry import CompactRegistry
+from ownership_index import OwnershipIndex
+from link_waiters import LINK_WAITERS
+from render_cache import content_version
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,6 +22,31 @@ DISCORD_REDIRECT_URI = os.getenv('DISCORD_REDIRECT_URI')
 PTERODACTYL_URL = os.getenv('PTERODACTYL_URL')
 PTERODACTYL_API_KEY = os.getenv('PTERODACTYL_API_KEY')
 
+# Pterodactyl HTTP Connection Pool Configuration
+PTERODACTYL_MAX_CONNECTIONS = int(os.getenv('PTERODACTYL_MAX_CONNECTIONS', 100))
+PTERODACTYL_MAX_CONNECTIONS_PER_HOST = int(os.getenv('PTERODACTYL_MAX_CONNECTIONS_PER_HOST', 20))
+PTERODACTYL_KEEPALIVE_TIMEOUT = float(os.getenv('PTERODACTYL_KEEPALIVE_TIMEOUT', 30))
+
+# Request Scheduler Configuration
+PTERODACTYL_RATE_LIMIT = int(os.getenv('PTERODACTYL_RATE_LIMIT', 240))  # Requests per minute until the panel reports its own limit
+SCHEDULER_BACKGROUND_RESERVE = float(os.getenv('SCHEDULER_BACKGROUND_RESERVE', 0.25))  # Share of the bucket kept free for interactive requests
+
+# Timeout and Deadline Configuration (seconds)
+PTERODACTYL_REQUEST_TIMEOUT = float(os.getenv('PTERODACTYL_REQUEST_TIMEOUT', 15))  # Longest a single panel call may take
+# Whole-command budget, kept below Discord's 15 minute interaction token lifetime
+COMMAND_DEADLINE = min(float(os.getenv('COMMAND_DEADLINE', 60)), 840)
+OAUTH_DEADLINE = float(os.getenv('OAUTH_DEADLINE', 20))  # Budget for the panel calls of one OAuth callback
+WEB_REQUEST_TIMEOUT = float(os.getenv('WEB_REQUEST_TIMEOUT', 10))  # Timeout for Discord OAuth HTTP calls
+# How long /link waits for the OAuth callback, kept below Discord's 15 minute interaction token lifetime
+LINK_WAIT_TIMEOUT = min(float(os.getenv('LINK_WAIT_TIMEOUT', 600)), 840)
+# Time a command may take before its first response without deferring, kept below Discord's 3 second acknowledgement window
+AUTO_DEFER_BUDGET = min(float(os.getenv('AUTO_DEFER_BUDGET', 2)), 2.5)
+AUTO_DEFER_PERCENTILE = float(os.getenv('AUTO_DEFER_PERCENTILE', 95))  # Latency percentile a command path is predicted by
+
+# Hedged Request Configuration (idempotent GETs only)
+PTERODACTYL_HEDGE_ENABLED = os.getenv('PTERODACTYL_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PTERODACTYL_HEDGE_PERCENTILE = float(os.getenv('PTERODACTYL_HEDGE_PERCENTILE', 95))  # Latency percentile after which a second GET is sent
+
 # Web Server Configuration
 FLASK_SECRET_KEY = os.getenv('FLASK_SECRET_KEY')
 WEB_HOST = os.getenv('WEB_HOST', 'localhost')
@@ -83,16 +115,136 @@ SERVER_TEMPLATES = {
     }
 }
 
+# Hashed once at load, SERVER_TEMPLATES only changes through refresh_templates_version()
+_templates_version = content_version(SERVER_TEMPLATES)
+
+def templates_version():
+    """Version of SERVER_TEMPLATES that output rendered from the templates is keyed by"""
+    return _templates_version
+
+def refresh_templates_version():
+    """Hash SERVER_TEMPLATES again after changing it, so output rendered from the old templates is rebuilt"""
+    global _templates_version
+    _templates_version = content_version(SERVER_TEMPLATES)
+
+# Allocation Index Configuration
+ALLOCATION_RECONCILE_INTERVAL = int(os.getenv('ALLOCATION_RECONCILE_INTERVAL', 300))  # Seconds between full rebuilds
+
+# Catalog Cache Configuration (nests, eggs, egg variables, locations, nodes)
+CATALOG_CACHE_TTL = {  # Seconds before an entry is refreshed
+    'nests': int(os.getenv('CATALOG_TTL_NESTS', 3600)),
+    'eggs': int(os.getenv('CATALOG_TTL_EGGS', 3600)),
+    'egg_variables': int(os.getenv('CATALOG_TTL_EGG_VARIABLES', 3600)),
+    'locations': int(os.getenv('CATALOG_TTL_LOCATIONS', 3600)),
+    'nodes': int(os.getenv('CATALOG_TTL_NODES', 300)),
+}
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', 512))
+CATALOG_CACHE_STALE_GRACE = int(os.getenv('CATALOG_CACHE_STALE_GRACE', 86400))  # Serve stale entries this long while refreshing
+
+# Panel Mirror Configuration (background copy of panel users and servers)
+PANEL_MIRROR_ENABLED = os.getenv('PANEL_MIRROR_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PANEL_MIRROR_INTERVAL = int(os.getenv('PANEL_MIRROR_INTERVAL', 30))  # Seconds between delta refreshes
+PANEL_MIRROR_FULL_RELOAD_INTERVAL = int(os.getenv('PANEL_MIRROR_FULL_RELOAD_INTERVAL', 3600))  # Seconds between full reloads, which pick up deletions
+PANEL_MIRROR_MAX_STALENESS = int(os.getenv('PANEL_MIRROR_MAX_STALENESS', 120))  # Reads go to the panel once the last refresh is older than this
+
+# Persistence Configuration
+PERSISTENCE_BACKEND = os.getenv('PERSISTENCE_BACKEND', 'json').lower()  # 'json', 'sqlite', 'journal' or 'shared'
+JOURNAL_COMPACT_EVERY = int(os.getenv('JOURNAL_COMPACT_EVERY', 1000))  # Journal entries before compacting into a snapshot
+PERSISTENCE_FLUSH_WINDOW = float(os.getenv('PERSISTENCE_FLUSH_WINDOW', 0.5))  # Seconds changes are batched before writing, 0 writes synchronously
+SNAPSHOT_FORMAT = os.getenv('SNAPSHOT_FORMAT', 'binary').lower()  # Journal snapshot format, 'binary' or 'json'
+COMPACT_STATE = os.getenv('COMPACT_STATE', 'false').lower() in ('1', 'true', 'yes')  # Keep users and servers in compact integer records
+STATE_BACKEND_URL = os.getenv('STATE_BACKEND_URL', 'local')  # Store for the 'shared' backend: 'local' or a redis:// URL
+
+# Auth Code Configuration
+AUTH_CODE_TTL = int(os.getenv('AUTH_CODE_TTL', 600))  # Seconds an auth code stays valid
+AUTH_CODES_PER_USER = int(os.getenv('AUTH_CODES_PER_USER', 3))  # Live codes kept per Discord user
+AUTH_CODE_PURGE_INTERVAL = int(os.getenv('AUTH_CODE_PURGE_INTERVAL', 60))  # Seconds between purges of expired codes
+
 # User Limits
 MAX_SERVERS_PER_USER = 2
+USER_SERVERS_CACHE_TTL = int(os.getenv('USER_SERVERS_CACHE_TTL', 60))  # Seconds a user's listed servers are reused before listing them again
+SERVERS_DETAILS_CONCURRENCY = int(os.getenv('SERVERS_DETAILS_CONCURRENCY', 8))  # Allocation lookups /servers runs at once
+SERVERS_DETAILS_TIMEOUT = float(os.getenv('SERVERS_DETAILS_TIMEOUT', 10))  # Seconds /servers waits for details before replying without them
 
 # Database for tracking user servers
-# Load data from disk if available, otherwise start with empty dictionaries
-USER_SERVERS = persistence.load_user_servers()  # Format: {discord_user_id: [server_id1, server_id2, ...]}
-USER_AUTH_CODES = persistence.load_user_auth_codes()  # Format: {auth_code: discord_user_id}
-PTERODACTYL_USERS = persistence.load_pterodactyl_users()  # Format: {discord_user_id: pterodactyl_user_id}
-
-# Print loaded data for debugging
-print(f"Loaded {len(USER_SERVERS)} user server records")
-print(f"Loaded {len(USER_AUTH_CODES)} auth codes")
-print(f"Loaded {len(PTERODACTYL_USERS)} linked Pterodactyl users")
+# Loaded from disk on first access, so importing config stays cheap and does no I/O
+persistence.use_backend(PERSISTENCE_BACKEND, JOURNAL_COMPACT_EVERY, PERSISTENCE_FLUSH_WINDOW, SNAPSHOT_FORMAT, STATE_BACKEND_URL,
+                        COMPACT_STATE)
+
+_compact_registry = None
+_compact_registry_lock = threading.Lock()
+
+def _load_compact_registry():
+    """Build the compact registry shared by USER_SERVERS and PTERODACTYL_USERS
+
+    The journal backend with a binary snapshot loads it straight from snapshot.bin and the
+    journal, without decoding them into dicts. Other backends load their dicts, which are
+    then packed, so only the memory held afterwards shrinks.
+    """
+    global _compact_registry
+    with _compact_registry_lock:
+        if _compact_registry is None:
+            _compact_registry = persistence.load_compact_registry()
+        if _compact_registry is None:
+            _compact_registry = CompactRegistry.from_mappings(persistence.load_user_servers(), persistence.load_pterodactyl_users())
+    return _compact_registry
+
+if COMPACT_STATE:
+    _load_user_servers = lambda: _load_compact_registry().user_servers
+    _load_pterodactyl_users = lambda: _load_compact_registry().pterodactyl_users
+else:
+    _load_user_servers = persistence.load_user_servers
+    _load_pterodactyl_users = persistence.load_pterodactyl_users
+
+USER_SERVERS = LazyMapping(_load_user_servers, "user server records")  # Format: {discord_user_id: [server_id1, server_id2, ...]}
+USER_AUTH_CODES = LazyMapping(lambda: AuthCodeStore(AUTH_CODE_TTL, AUTH_CODES_PER_USER, persistence.load_user_auth_codes()),
+                              "auth codes")  # Format: {auth_code: discord_user_id}
+PTERODACTYL_USERS = LazyMapping(_load_pterodactyl_users, "linked Pterodactyl users")  # Format: {discord_user_id: pterodactyl_user_id}
+# Reverse lookups (server -> owner, panel user -> Discord user); change USER_SERVERS and PTERODACTYL_USERS through it
+OWNERSHIP = OwnershipIndex(USER_SERVERS, PTERODACTYL_USERS)
+
+def load_state():
+    """Load every state mapping now instead of on first access"""
+    for state in (USER_SERVERS, USER_AUTH_CODES, PTERODACTYL_USERS):
+        state.load()
+
+def _apply_remote_change(message):
+    """Apply a change published by another process to the state loaded in this one"""
+    global _compact_registry
+    change = message.get('type')
+    if change == 'user_servers' and USER_SERVERS.loaded:
+        OWNERSHIP.set_servers(message['discord_id'], message['server_ids'])
+    elif change == 'link' and PTERODACTYL_USERS.loaded:
+        OWNERSHIP.link(message['discord_id'], message['pterodactyl_user_id'])
+    elif change == 'auth_code' and USER_AUTH_CODES.loaded:
+        USER_AUTH_CODES.track(message['code'], message['discord_id'], message['expires_at'])
+    elif change == 'auth_codes_removed' and USER_AUTH_CODES.loaded:
+        for code in message['codes']:
+            USER_AUTH_CODES.forget(code)
+    elif change == 'auth_codes_replaced' and USER_AUTH_CODES.loaded:
+        for code in list(USER_AUTH_CODES.keys()):
+            if code not in message['records']:
+                USER_AUTH_CODES.forget(code)
+        for code, record in message['records'].items():
+            USER_AUTH_CODES.track(code, record['discord_id'], record['expires_at'])
+    elif change == 'reload':
+        # A whole document was replaced, load it again on next access
+        OWNERSHIP.invalidate()
+        if COMPACT_STATE:
+            with _compact_registry_lock:
+                _compact_registry = None
+            USER_SERVERS.reset()
+            PTERODACTYL_USERS.reset()
+        elif message['document'] == 'user_servers':
+            USER_SERVERS.reset()
+        else:
+            PTERODACTYL_USERS.reset()
+
+    if change == 'link':
+        # A /link in this process may be waiting for an OAuth callback handled by another one
+        LINK_WAITERS.resolve(message['discord_id'], {'id': message['pterodactyl_user_id']})
+
+def watch_state():
+    """Keep the state in this process up to date with changes made by other processes sharing the store"""
+    if persistence.watch(_apply_remote_change):
+        print("Watching shared state for changes from other processes")
@@ -0,0 +1,50 @@
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+
+# Absolute time.monotonic() by which the current task's panel calls must finish
+request_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+@contextmanager
+def deadline(seconds):
+    """Give the enclosed panel calls at most this many seconds; an outer, earlier deadline still wins"""
+    expires_at = time.monotonic() + seconds
+    current = request_deadline.get()
+    if current is not None:
+        expires_at = min(expires_at, current)
+
+    token = request_deadline.set(expires_at)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+def remaining():
+    """Seconds left before the current deadline, or None if there is no deadline"""
+    expires_at = request_deadline.get()
+    if expires_at is None:
+        return None
+    return expires_at - time.monotonic()
+
+def timeout_for(default):
+    """The timeout to use for one call: the default, capped by the current deadline"""
+    left = remaining()
+    if left is None:
+        return default
+    return min(default, left)
+
+async def run_with_deadline(coro, seconds):
+    """Await a coroutine with its panel calls bounded by a deadline"""
+    with deadline(seconds):
+        return await coro
+
+def with_deadline(seconds):
+    """Decorator that runs a coroutine function under a deadline"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with deadline(seconds):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,334 @@
+import copy
+import json
+import os
+import threading
+from persistence import load_data, write_json_atomic
+from compact_registry import CompactRegistry
+from snapshot_format import read_snapshot, read_snapshot_arrays, write_snapshot
+
+def _server_lists(user_servers):
+    """(discord_user_id, server_ids) pairs to search without changing them; a registry view skips copying each user"""
+    readonly_items = getattr(user_servers, 'readonly_items', None)
+    return readonly_items() if readonly_items is not None else user_servers.items()
+
+class JournalBackend:
+    """Persistence backend that appends one journal line per change and folds the journal into a snapshot
+
+    Startup loads the snapshot and replays the journal written after it. Once the journal
+    holds compact_every entries it is rotated and compacted into a new snapshot on a
+    background thread. Every entry carries a sequence number, and the snapshot records the
+    last one it includes, so a crash at any point of a compaction replays cleanly.
+    With a writer, appends are fsynced together once per flush window instead of one by one.
+    A snapshot path ending in .bin uses the binary snapshot format, anything else JSON.
+    With compact set, users and servers are loaded from a binary snapshot straight into a
+    CompactRegistry (see load_compact_registry) instead of being decoded into dicts.
+    """
+    def __init__(self, snapshot_path, journal_path, compact_every=1000, writer=None, previous_snapshot_path=None,
+                 compact=False):
+        self.snapshot_path = snapshot_path
+        # Snapshot in the other format, read once when switching formats
+        self.previous_snapshot_path = previous_snapshot_path
+        self.journal_path = journal_path
+        self.writer = writer
+        self.rotated_path = f"{journal_path}.1"
+        self.compact_every = compact_every
+        self.compact = compact
+        self.registry = None  # CompactRegistry holding user_servers and pterodactyl_users, when loaded compact
+
+        self.user_servers = {}
+        self.auth_codes = {}
+        self.pterodactyl_users = {}
+
+        self._seq = 0
+        self._pending = 0  # Entries appended since the last rotation
+        self._journal = None
+        self._lock = threading.Lock()
+        self._compactor = None
+
+    def open(self, user_servers_file, auth_codes_file, pterodactyl_users_file):
+        """Load the snapshot and replay the journal, importing the JSON data files on first start; returns whether they were imported"""
+        imported = False
+        arrays = None
+        if self.compact and self.snapshot_path.endswith('.bin'):
+            arrays = read_snapshot_arrays(self.snapshot_path)
+        snapshot = self._read_snapshot(self.snapshot_path) if arrays is None else {'seq': arrays.seq}
+        if snapshot is None and self.previous_snapshot_path and os.path.exists(self.previous_snapshot_path):
+            snapshot = self._read_snapshot(self.previous_snapshot_path)
+            self._write_snapshot(snapshot)
+            # Drop the old file so switching back later can't pick up a stale snapshot
+            os.remove(self.previous_snapshot_path)
+            print(f"Converted {self.previous_snapshot_path} to {self.snapshot_path}")
+        elif snapshot is None and not os.path.exists(self.journal_path):
+            snapshot = {
+                'seq': 0,
+                'user_servers': load_data(user_servers_file),
+                'auth_codes': load_data(auth_codes_file),
+                'pterodactyl_users': load_data(pterodactyl_users_file),
+            }
+            self._write_snapshot(snapshot)
+            imported = True
+            print(f"Imported JSON data files into {self.snapshot_path}")
+        snapshot = snapshot or {}
+
+        self._seq = snapshot.get('seq', 0)
+        if arrays is not None:
+            self.registry = CompactRegistry(arrays)
+            self.user_servers = self.registry.user_servers
+            self.auth_codes = arrays.auth_codes
+            self.pterodactyl_users = self.registry.pterodactyl_users
+        else:
+            self.user_servers = {str(k): v for k, v in snapshot.get('user_servers', {}).items()}
+            self.auth_codes = {str(k): v for k, v in snapshot.get('auth_codes', {}).items()}
+            self.pterodactyl_users = {str(k): v for k, v in snapshot.get('pterodactyl_users', {}).items()}
+
+        replayed = 0
+        for path in (self.rotated_path, self.journal_path):
+            replayed += self._replay(path)
+        print(f"Loaded snapshot at entry {snapshot.get('seq', 0)} and replayed {replayed} journal entries")
+
+        self._pending = replayed
+        self._trim_torn_tail(self.journal_path)
+        self._journal = open(self.journal_path, 'a')
+        if self._pending >= self.compact_every:
+            self._start_compaction()
+        return imported
+
+    def _read_snapshot(self, path):
+        if path.endswith('.bin'):
+            return read_snapshot(path)
+        return load_data(path) if os.path.exists(path) else None
+
+    def _write_snapshot(self, snapshot):
+        registry = snapshot.get('registry')
+        if registry is not None:
+            snapshot = {
+                'seq': snapshot['seq'],
+                'user_servers': dict(registry.user_servers.readonly_items()),
+                'auth_codes': snapshot['auth_codes'],
+                'pterodactyl_users': dict(registry.pterodactyl_users),
+            }
+        if self.snapshot_path.endswith('.bin'):
+            write_snapshot(self.snapshot_path, snapshot)
+        else:
+            write_json_atomic(self.snapshot_path, snapshot, indent=None)
+
+    def _replay(self, path):
+        if not os.path.exists(path):
+            return 0
+
+        replayed = 0
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Only the last line can be torn by a crash mid-append
+                    print(f"Skipping unreadable journal line in {path}")
+                    continue
+                if entry['seq'] <= self._seq:
+                    continue
+                self._apply(entry['op'], entry['args'])
+                self._seq = entry['seq']
+                replayed += 1
+        return replayed
+
+    def _trim_torn_tail(self, path):
+        """Cut a partial last line left by a crash, so the next append starts on a fresh line"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def _apply(self, op, args):
+        if op == 'add_user_server':
+            discord_id, server_id = args
+            if discord_id not in self.user_servers:
+                self.user_servers[discord_id] = []
+            # Fetched again, a registry view stores its own copy of what was set
+            server_list = self.user_servers[discord_id]
+            if server_id not in server_list:
+                server_list.append(server_id)
+        elif op == 'remove_server':
+            (server_id,) = args
+            owners = [discord_id for discord_id, server_list in _server_lists(self.user_servers) if server_id in server_list]
+            for discord_id in owners:
+                self.user_servers[discord_id].remove(server_id)
+        elif op == 'set_user_servers':
+            discord_id, server_ids = args
+            self.user_servers[discord_id] = list(server_ids)
+        elif op == 'link_user':
+            discord_id, pterodactyl_user_id = args
+            self.pterodactyl_users[discord_id] = pterodactyl_user_id
+        elif op == 'add_auth_code':
+            code, discord_id = args[:2]
+            # Entries from before expiry tracking have no expiry and are dropped on load
+            expires_at = args[2] if len(args) > 2 else 0
+            self.auth_codes[code] = {'discord_id': discord_id, 'expires_at': expires_at}
+        elif op == 'remove_auth_codes':
+            for code in args[0]:
+                self.auth_codes.pop(code, None)
+        elif op == 'replace_user_servers':
+            # Replaced in place, so a registry view keeps backing its registry
+            self.user_servers.clear()
+            self.user_servers.update(copy.deepcopy(args[0]))
+        elif op == 'replace_auth_codes':
+            self.auth_codes = dict(args[0])
+        elif op == 'replace_pterodactyl_users':
+            self.pterodactyl_users.clear()
+            self.pterodactyl_users.update(args[0])
+        else:
+            raise ValueError(f"Unknown journal operation: {op}")
+
+    def _record(self, op, *args):
+        """Append a change to the journal, then apply it in memory"""
+        with self._lock:
+            position = None
+            try:
+                line = json.dumps({'seq': self._seq + 1, 'op': op, 'args': args}) + '\n'
+                position = self._journal.tell()
+                self._journal.write(line)
+                self._journal.flush()
+                if self.writer is None:
+                    os.fsync(self._journal.fileno())
+            except Exception as e:
+                print(f"Error appending to journal {self.journal_path}: {e}")
+                if position is not None:
+                    self._drop_failed_append(position)
+                return False
+
+            # Only changes that made it into the journal are applied, so memory never runs ahead of disk
+            self._seq += 1
+            self._apply(op, args)
+            self._pending += 1
+
+            if self._pending >= self.compact_every:
+                self._start_compaction()
+
+        if self.writer is not None:
+            self.writer.mark_dirty(self.journal_path, self._sync)
+        return True
+
+    def _drop_failed_append(self, position):
+        """Cut whatever part of a failed append reached the file, so the next append starts on a fresh line"""
+        # Caller must hold the lock
+        try:
+            self._journal.close()
+        except Exception:
+            pass  # Closing retries the buffered write, which is cut off below either way
+        try:
+            os.truncate(self.journal_path, position)
+            self._journal = open(self.journal_path, 'a')
+        except Exception as e:
+            print(f"Error restoring journal {self.journal_path} after a failed append: {e}")
+
+    def _sync(self):
+        """Fsync the appends made since the last sync"""
+        with self._lock:
+            if self._journal is not None:
+                os.fsync(self._journal.fileno())
+
+    def _start_compaction(self):
+        # Caller must hold the lock
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        if os.path.exists(self.rotated_path):
+            # The previous rotation was never compacted (crash), keep it until it is
+            snapshot = self._snapshot()
+        else:
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            os.replace(self.journal_path, self.rotated_path)
+            self._journal = open(self.journal_path, 'a')
+            snapshot = self._snapshot()
+
+        self._pending = 0
+        self._compactor = threading.Thread(target=self._compact, args=(snapshot,), daemon=True)
+        self._compactor.start()
+
+    def _snapshot(self):
+        if self.registry is not None:
+            # Copying the columns is cheap; the compaction thread turns the copy into snapshot data
+            return {'seq': self._seq, 'registry': self.registry.copy(), 'auth_codes': dict(self.auth_codes)}
+        return {
+            'seq': self._seq,
+            'user_servers': copy.deepcopy(self.user_servers),
+            'auth_codes': dict(self.auth_codes),
+            'pterodactyl_users': dict(self.pterodactyl_users),
+        }
+
+    def _compact(self, snapshot):
+        """Write a snapshot covering the rotated journal, then drop the rotated journal"""
+        try:
+            self._write_snapshot(snapshot)
+            os.remove(self.rotated_path)
+            print(f"Compacted journal into snapshot at entry {snapshot['seq']}")
+        except Exception as e:
+            print(f"Error compacting journal: {e}")
+
+    def load_user_servers(self):
+        with self._lock:
+            if self.registry is not None:
+                return {discord_id: server_ids.tolist() for discord_id, server_ids in self.user_servers.readonly_items()}
+            return copy.deepcopy(self.user_servers)
+
+    def load_compact_registry(self):
+        """Get a copy of the registry loaded from the binary snapshot and journal, or None when loaded into dicts"""
+        with self._lock:
+            return self.registry.copy() if self.registry is not None else None
+
+    def load_user_auth_codes(self):
+        with self._lock:
+            return dict(self.auth_codes)
+
+    def load_pterodactyl_users(self):
+        with self._lock:
+            return dict(self.pterodactyl_users)
+
+    def add_user_server(self, discord_id, server_id):
+        return self._record('add_user_server', str(discord_id), server_id)
+
+    def remove_server(self, server_id):
+        return self._record('remove_server', server_id)
+
+    def set_user_servers(self, discord_id, server_ids):
+        return self._record('set_user_servers', str(discord_id), list(server_ids))
+
+    def link_user(self, discord_id, pterodactyl_user_id):
+        return self._record('link_user', str(discord_id), pterodactyl_user_id)
+
+    def add_auth_code(self, code, discord_id, expires_at):
+        return self._record('add_auth_code', code, str(discord_id), expires_at)
+
+    def remove_auth_codes(self, codes):
+        return self._record('remove_auth_codes', list(codes))
+
+    def save_user_servers(self, user_servers):
+        return self._record('replace_user_servers', user_servers)
+
+    def save_user_auth_codes(self, user_auth_codes):
+        return self._record('replace_auth_codes', user_auth_codes)
+
+    def save_pterodactyl_users(self, pterodactyl_users):
+        return self._record('replace_pterodactyl_users', pterodactyl_users)
+
+    def close(self):
+        """Fold the whole journal into the snapshot and close it"""
+        with self._lock:
+            if self._journal is None:
+                return
+            compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+        with self._lock:
+            try:
+                self._write_snapshot(self._snapshot())
+                self._journal.close()
+                self._journal = None
+                for path in (self.rotated_path, self.journal_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            except Exception as e:
+                print(f"Error compacting journal on close: {e}")
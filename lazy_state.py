@@ -0,0 +1,62 @@
+import threading
+from collections.abc import MutableMapping
+
+class LazyMapping(MutableMapping):
+    """Mapping that loads its contents on first access
+
+    Stands in for the state dicts in config so importing config does no disk I/O.
+    Attributes other than the mapping interface are passed through to the loaded object.
+    """
+    def __init__(self, loader, description):
+        self._loader = loader
+        self._description = description
+        self._target = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def load(self):
+        """Load the contents now if they are not loaded yet, and return them"""
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    target = self._loader()
+                    print(f"Loaded {len(target)} {self._description}")
+                    self._target = target
+        return self._target
+
+    def reset(self):
+        """Drop the loaded contents so they are loaded again on next access"""
+        with self._lock:
+            self._target = None
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the proxy itself
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        self.load()[key] = value
+
+    def __delitem__(self, key):
+        del self.load()[key]
+
+    def __contains__(self, key):
+        return key in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __repr__(self):
+        if self._target is None:
+            return f"<LazyMapping {self._description} (not loaded)>"
+        return repr(self._target)
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+class LinkWaiters:
+    """Futures that /link commands await until the user's account gets linked
+
+    The OAuth callback runs in the web server's thread (or, with shared state, in another
+    process whose change arrives on a subscriber thread), so futures are resolved through
+    call_soon_threadsafe on the loop that created them.
+    """
+    def __init__(self):
+        self._waiters = {}  # Format: {discord_user_id: [asyncio.Future, ...]}
+        self._lock = threading.Lock()
+
+    def register(self, discord_id):
+        """Create a future for a Discord user on the running loop; await it with wait()"""
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._waiters.setdefault(str(discord_id), []).append(future)
+        return future
+
+    def _unregister(self, discord_id, future):
+        with self._lock:
+            futures = self._waiters.get(discord_id)
+            if futures is not None and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self._waiters[discord_id]
+
+    async def wait(self, discord_id, future, timeout):
+        """Wait for a registered future; returns what the link was resolved with, or None on timeout"""
+        discord_id = str(discord_id)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._unregister(discord_id, future)
+
+    def resolve(self, discord_id, result):
+        """Complete every waiter of a Discord user with result; safe to call from any thread"""
+        with self._lock:
+            futures = self._waiters.pop(str(discord_id), [])
+        for future in futures:
+            loop = future.get_loop()
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._set_result, future, result)
+        return len(futures)
+
+    @staticmethod
+    def _set_result(future, result):
+        if not future.done():
+            future.set_result(result)
+
+    def pending(self):
+        """Number of Discord users with a /link waiting"""
+        with self._lock:
+            return len(self._waiters)
+
+# Shared by the bot commands and the web server
+LINK_WAITERS = LinkWaiters()
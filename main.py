@@ -1,10 +1,9 @@
-import os
-from bot import main as bot_main
-from dotenv import load_dotenv
-from config import DISCORD_BOT_TOKEN, PTERODACTYL_URL, PTERODACTYL_API_KEY
+import sys
+from startup_profile import StartupProfiler
 
 def check_environment():
     """Check if all required environment variables are set"""
+    from config import DISCORD_BOT_TOKEN, PTERODACTYL_URL, PTERODACTYL_API_KEY
     missing_vars = []
 
     if not DISCORD_BOT_TOKEN:
@@ -27,8 +26,15 @@ def check_environment():
 
 def main():
     """Main entry point for the application"""
-    # Load environment variables
-    load_dotenv()
+    # With --profile-startup, time each startup stage and module import, then exit without connecting
+    profile_startup = '--profile-startup' in sys.argv
+    profiler = StartupProfiler()
+    if profile_startup:
+        profiler.install()
+
+    # Load configuration (environment variables are read from .env by config)
+    with profiler.stage("import config"):
+        from config import DISCORD_BOT_TOKEN, PTERODACTYL_URL, PTERODACTYL_API_KEY
 
     # Print environment variables for debugging
     print(f"DISCORD_BOT_TOKEN: {'*' * 10}{DISCORD_BOT_TOKEN[-5:] if DISCORD_BOT_TOKEN else 'None'}")
@@ -39,6 +45,20 @@ def main():
     if not check_environment():
         return
 
+    # The bot pulls in discord.py and the panel client, so only import it once the environment is valid
+    with profiler.stage("import bot"):
+        from bot import main as bot_main
+
+    if profile_startup:
+        with profiler.stage("import web server"):
+            import web_server
+        with profiler.stage("load state"):
+            import config
+            config.load_state()
+        profiler.uninstall()
+        profiler.report()
+        return
+
     print("Starting bot...")
     # Start the bot
     try:
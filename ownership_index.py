@@ -0,0 +1,117 @@
+import threading
+
+class OwnershipIndex:
+    """Reverse lookups for USER_SERVERS and PTERODACTYL_USERS, changed together with them
+
+    server_owners maps server_id -> discord_user_id and panel_users maps
+    pterodactyl_user_id -> discord_user_id (the most recently linked Discord user).
+    Every change to the two mappings goes through this class under one lock, so the
+    forward and reverse sides never disagree. The index is built on first use.
+    Persisting changes is left to the caller, as with the mappings themselves.
+    """
+    def __init__(self, user_servers, pterodactyl_users):
+        self.user_servers = user_servers
+        self.pterodactyl_users = pterodactyl_users
+        self.server_owners = None  # Format: {server_id: discord_user_id}
+        self.panel_users = None    # Format: {pterodactyl_user_id: discord_user_id}
+        self._lock = threading.RLock()
+
+    def _ensure_built(self):
+        # Caller must hold the lock
+        if self.server_owners is None:
+            # Compact registry views can be read without copying every user into their overlay
+            readonly_items = getattr(self.user_servers, 'readonly_items', None)
+            items = readonly_items() if readonly_items is not None else self.user_servers.items()
+            self.server_owners = {server_id: discord_id for discord_id, server_ids in items for server_id in server_ids}
+            self.panel_users = {user_id: discord_id for discord_id, user_id in self.pterodactyl_users.items()}
+
+    def invalidate(self):
+        """Drop the index so it is rebuilt from the mappings on next use"""
+        with self._lock:
+            self.server_owners = None
+            self.panel_users = None
+
+    def owner_of(self, server_id):
+        """Get the Discord user owning a server, or None if no user has it"""
+        with self._lock:
+            self._ensure_built()
+            return self.server_owners.get(server_id)
+
+    def discord_id_for(self, pterodactyl_user_id):
+        """Get the Discord user linked to a panel user, or None"""
+        with self._lock:
+            self._ensure_built()
+            return self.panel_users.get(pterodactyl_user_id)
+
+    def server_count(self, discord_id):
+        """Get how many servers a Discord user has"""
+        with self._lock:
+            return len(self.user_servers.get(discord_id, ()))
+
+    def _take_from_owner(self, server_id, discord_id, changed):
+        # Caller must hold the lock; a server has one owner, so drop it from anyone else's list first
+        owner = self.server_owners.get(server_id)
+        if owner is not None and owner != discord_id:
+            server_ids = self.user_servers.get(owner)
+            if server_ids is not None and server_id in server_ids:
+                server_ids.remove(server_id)
+            changed.append(owner)
+
+    def add_server(self, discord_id, server_id):
+        """Record that a user owns a server; returns the Discord IDs whose server lists changed"""
+        with self._lock:
+            self._ensure_built()
+            changed = []
+            self._take_from_owner(server_id, discord_id, changed)
+
+            if discord_id not in self.user_servers:
+                self.user_servers[discord_id] = []
+            server_ids = self.user_servers[discord_id]
+            if server_id not in server_ids:
+                server_ids.append(server_id)
+                changed.append(discord_id)
+            self.server_owners[server_id] = discord_id
+            return changed
+
+    def remove_server(self, server_id):
+        """Remove a server from its owner's list; returns the previous owner, or None"""
+        with self._lock:
+            self._ensure_built()
+            owner = self.server_owners.pop(server_id, None)
+            if owner is not None:
+                server_ids = self.user_servers.get(owner)
+                if server_ids is not None and server_id in server_ids:
+                    server_ids.remove(server_id)
+            return owner
+
+    def set_servers(self, discord_id, server_ids):
+        """Replace a user's server list; returns the Discord IDs whose server lists changed"""
+        server_ids = list(server_ids)
+        with self._lock:
+            self._ensure_built()
+            current = self.user_servers.get(discord_id)
+            if current is not None and list(current) == server_ids:
+                return []
+
+            changed = []
+            for server_id in server_ids:
+                self._take_from_owner(server_id, discord_id, changed)
+            for server_id in current or ():
+                if self.server_owners.get(server_id) == discord_id:
+                    del self.server_owners[server_id]
+
+            self.user_servers[discord_id] = server_ids
+            for server_id in server_ids:
+                self.server_owners[server_id] = discord_id
+            changed.append(discord_id)
+            return changed
+
+    def link(self, discord_id, pterodactyl_user_id):
+        """Record a Discord user's linked panel user"""
+        with self._lock:
+            self._ensure_built()
+            previous = self.pterodactyl_users.get(discord_id)
+            if previous is not None and self.panel_users.get(previous) == discord_id:
+                del self.panel_users[previous]
+            self.pterodactyl_users[discord_id] = pterodactyl_user_id
+            self.panel_users[pterodactyl_user_id] = discord_id
@@ -0,0 +1,257 @@
+import asyncio
+import contextvars
+import json
+import time
+from collections import deque
+import aiohttp
+from config import (PTERODACTYL_MAX_CONNECTIONS, PTERODACTYL_MAX_CONNECTIONS_PER_HOST, PTERODACTYL_KEEPALIVE_TIMEOUT,
+                    PTERODACTYL_REQUEST_TIMEOUT, PTERODACTYL_HEDGE_ENABLED, PTERODACTYL_HEDGE_PERCENTILE)
+from request_scheduler import PriorityTicket, RequestScheduler, request_priority
+import deadlines
+
+# How many times a request is retried after the panel answers 429
+MAX_RATE_LIMIT_RETRIES = 2
+
+# Latency samples kept for picking the hedge delay, and how many are needed before hedging starts
+HEDGE_SAMPLE_SIZE = 200
+HEDGE_MIN_SAMPLES = 20
+
+# One pooled session per process, bound to the loop that created it
+_session = None
+_session_loop = None
+
+class PterodactylAPIError(Exception):
+    """Raised when the panel answers a request with an unexpected status code"""
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+class PanelTimeoutError(PterodactylAPIError):
+    """Raised when a panel call runs past its timeout or the calling command's deadline"""
+    def __init__(self, text="Panel request timed out"):
+        super().__init__(504, text)
+
+class PanelResponse:
+    """Response from the panel, decoded once and shaped like a requests.Response"""
+    def __init__(self, status_code, text, headers):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+        self._json = None
+        self._decoded = False
+
+    def json(self):
+        """Decode the response body as JSON (cached after the first call)"""
+        if not self._decoded:
+            self._json = json.loads(self.text) if self.text else None
+            self._decoded = True
+        return self._json
+
+def get_session():
+    """Get the shared aiohttp session, creating it on first use"""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=PTERODACTYL_MAX_CONNECTIONS,
+            limit_per_host=PTERODACTYL_MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=PTERODACTYL_KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+        _session_loop = loop
+
+    return _session
+
+async def close_session():
+    """Close the shared session and release its pooled connections"""
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+class SingleFlight:
+    """Coalesces identical in-flight requests so concurrent callers share one result
+
+    The shared request waits for its rate limit token at the most urgent priority
+    among the callers waiting on it.
+    """
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self._inflight = {}  # Format: {key: (asyncio.Task, PriorityTicket)}
+        self.calls = 0
+        self.deduplicated = 0
+
+    async def do(self, key, fn):
+        """Run fn(ticket) unless an identical call is already in flight, then await that one instead"""
+        self.calls += 1
+        level = request_priority.get()
+        flight = self._inflight.get(key)
+
+        if flight is not None:
+            self.deduplicated += 1
+            task, ticket = flight
+            self.scheduler.promote(ticket, level)
+        else:
+            ticket = PriorityTicket(level)
+            task = self._start(lambda: fn(ticket))
+            self._inflight[key] = (task, ticket)
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        # Shielded so one cancelled caller doesn't cancel the request for the others,
+        # and bounded by this caller's own deadline rather than the first caller's
+        return await _within_deadline(asyncio.shield(task))
+
+    @staticmethod
+    def _start(fn):
+        # The shared request runs without the starting caller's deadline, so only the request
+        # timeout bounds it and every waiter stops waiting at its own deadline instead
+        context = contextvars.copy_context()
+        context.run(deadlines.request_deadline.set, None)
+        return context.run(asyncio.ensure_future, fn())
+
+    def _forget(self, key, task):
+        flight = self._inflight.get(key)
+        if flight is not None and flight[0] is task:
+            del self._inflight[key]
+
+class Hedger:
+    """Tracks GET latency and picks the delay after which a second, hedged request is sent"""
+    def __init__(self, enabled, percentile):
+        self.enabled = enabled
+        self.percentile = percentile
+        self._samples = deque(maxlen=HEDGE_SAMPLE_SIZE)
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def delay(self):
+        """Seconds to wait before hedging, or None while hedging is off or there are too few samples"""
+        if not self.enabled or len(self._samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index]
+
+scheduler = RequestScheduler()
+single_flight = SingleFlight(scheduler)
+hedger = Hedger(PTERODACTYL_HEDGE_ENABLED, PTERODACTYL_HEDGE_PERCENTILE)
+
+async def _within_deadline(awaitable):
+    """Await something, giving up with PanelTimeoutError when the current deadline passes"""
+    left = deadlines.remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        elif asyncio.isfuture(awaitable):
+            # Nobody will await it now, so consume its result to keep asyncio quiet
+            awaitable.add_done_callback(lambda future: future.cancelled() or future.exception())
+        raise PanelTimeoutError("Command deadline exceeded before the panel call was sent")
+    try:
+        return await asyncio.wait_for(awaitable, timeout=left)
+    except asyncio.TimeoutError:
+        raise PanelTimeoutError("Command deadline exceeded while waiting for the panel")
+
+def _request_key(method, url, params):
+    query = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return method, url, query
+
+async def _attempt(method, url, headers, params, json_body):
+    """Send one request over the shared session, bounded by the request timeout and the deadline"""
+    timeout = deadlines.timeout_for(PTERODACTYL_REQUEST_TIMEOUT)
+    if timeout <= 0:
+        raise PanelTimeoutError("Command deadline exceeded before the panel call was sent")
+
+    session = get_session()
+    started = time.monotonic()
+    try:
+        async with session.request(method, url, headers=headers, params=params, json=json_body,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            text = await response.text()
+            scheduler.observe(response.status, response.headers)
+            panel_response = PanelResponse(response.status, text, response.headers)
+    except asyncio.TimeoutError:
+        raise PanelTimeoutError(f"Panel did not answer {method} {url} within {timeout:.1f}s")
+
+    if method == 'GET' and panel_response.status_code < 500:
+        hedger.record(time.monotonic() - started)
+    return panel_response
+
+async def _hedged(method, url, headers, params, json_body, ticket=None):
+    """Send an idempotent request, racing a second copy if the first is slower than usual"""
+    delay = hedger.delay()
+    if delay is None:
+        return await _attempt(method, url, headers, params, json_body)
+
+    first = asyncio.ensure_future(_attempt(method, url, headers, params, json_body))
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        # Only hedge when a token is free right now, so hedging never adds to a rate limit backlog
+        if done or not scheduler.try_acquire(ticket.level if ticket is not None else None):
+            return await first
+
+        hedger.hedged += 1
+        second = asyncio.ensure_future(_attempt(method, url, headers, params, json_body))
+        pending.add(second)
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        hedger.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def _send(method, url, headers, params, json_body, ticket=None):
+    attempt = 0
+    while True:
+        # Wait for a rate limit token at the ticket's priority, or the calling task's
+        await _within_deadline(scheduler.acquire(ticket=ticket))
+
+        if method == 'GET':
+            panel_response = await _hedged(method, url, headers, params, json_body, ticket)
+        else:
+            panel_response = await _attempt(method, url, headers, params, json_body)
+
+        if panel_response.status_code != 429 or attempt >= MAX_RATE_LIMIT_RETRIES:
+            return panel_response
+        attempt += 1
+
+async def request(method, url, headers=None, params=None, json_body=None):
+    """Send a request over the shared session and read the full body
+
+    Identical concurrent GETs are coalesced into one request and share the same
+    PanelResponse, so callers must treat its decoded JSON as read-only. Every call
+    respects the calling task's deadline and raises PanelTimeoutError past it.
+    """
+    if method == 'GET':
+        return await single_flight.do(
+            _request_key(method, url, params),
+            lambda ticket: _send(method, url, headers, params, json_body, ticket)
+        )
+    return await _send(method, url, headers, params, json_body)
+
+def stats():
+    """Get request coalescing, scheduling and hedging counters"""
+    return {
+        'calls': single_flight.calls,
+        'deduplicated': single_flight.deduplicated,
+        'in_flight': len(single_flight._inflight),
+        'scheduler': scheduler.stats(),
+        'hedged': hedger.hedged,
+        'hedge_wins': hedger.hedge_wins,
+        'hedge_delay': hedger.delay(),
+    }
@@ -0,0 +1,176 @@
+import asyncio
+import time
+import traceback
+from panel_http import PterodactylAPIError
+from request_scheduler import BACKGROUND, request_priority
+
+class MirrorTable:
+    """Mirrored records of one panel list endpoint, keyed by ID"""
+    def __init__(self, name, path, params=None):
+        self.name = name
+        self.path = path
+        self.params = dict(params or {})
+        self.records = {}  # Format: {id: attributes}
+        # Newest changes first; panels that can't sort by update time fall back to newest IDs first
+        self.sort = '-updated_at'
+
+    def seen(self, attributes):
+        """Check if a record is already mirrored as it is now"""
+        current = self.records.get(attributes['id'])
+        if current is None:
+            return False
+        if self.sort == '-updated_at':
+            return current.get('updated_at') == attributes.get('updated_at')
+        return True
+
+class PanelMirror:
+    """Background mirror of panel users and servers, refreshed by delta
+
+    After one full load, each refresh reads list pages newest change first and stops at
+    the first record it already has, so panel traffic follows the number of changes rather
+    than the panel's size. Deletions made outside the bot only show up on the periodic full
+    reload. Changes made by the bot are applied directly. Reads are only answered while the
+    last refresh is at most max_staleness seconds old. Nodes and allocations are mirrored
+    by the AllocationIndex.
+    """
+    def __init__(self, api, interval, full_reload_interval, max_staleness):
+        self.api = api
+        self.interval = interval
+        self.full_reload_interval = full_reload_interval
+        self.max_staleness = max_staleness
+        self.users = MirrorTable('users', '/api/application/users')
+        self.servers = MirrorTable('servers', '/api/application/servers', {'include': 'allocations'})
+        self.users_by_email = {}    # Format: {email: user_id}
+        self.servers_by_user = {}   # Format: {user_id: {server_id, ...}}
+        self.refreshed_at = None
+        self.loaded_at = None
+        self.delta_records = 0
+        self._task = None
+
+    def is_fresh(self):
+        """Check if the mirror may answer reads"""
+        return self.refreshed_at is not None and time.monotonic() - self.refreshed_at <= self.max_staleness
+
+    def _index_user(self, attributes):
+        previous = self.users.records.get(attributes['id'])
+        if previous is not None and self.users_by_email.get(previous['email']) == previous['id']:
+            del self.users_by_email[previous['email']]
+        self.users.records[attributes['id']] = attributes
+        self.users_by_email[attributes['email']] = attributes['id']
+
+    def _index_server(self, attributes):
+        previous = self.servers.records.get(attributes['id'])
+        if previous is not None:
+            self.servers_by_user.get(previous['user'], set()).discard(previous['id'])
+        self.servers.records[attributes['id']] = attributes
+        self.servers_by_user.setdefault(attributes['user'], set()).add(attributes['id'])
+
+    def _list(self, table, sort):
+        return self.api.iter_list(self.api.base_url + table.path, {**table.params, 'sort': sort})
+
+    async def load(self):
+        """Load every user and server from the panel, replacing the mirror"""
+        started = time.monotonic()
+        users, servers = await asyncio.gather(
+            self.api.list_all(self.api.base_url + self.users.path, self.users.params),
+            self.api.list_all(self.api.base_url + self.servers.path, self.servers.params),
+        )
+
+        self.users.records = {}
+        self.users_by_email = {}
+        for user in users:
+            self._index_user(user['attributes'])
+        self.servers.records = {}
+        self.servers_by_user = {}
+        for server in servers:
+            self._index_server(server['attributes'])
+
+        self.loaded_at = self.refreshed_at = started
+        print(f"Panel mirror loaded: {len(self.users.records)} users, {len(self.servers.records)} servers")
+
+    async def _delta(self, table, index):
+        """Apply records changed since the last refresh; returns how many were applied"""
+        while True:
+            items = self._list(table, table.sort)
+            applied = 0
+            try:
+                async for item in items:
+                    attributes = item['attributes']
+                    if table.seen(attributes):
+                        break
+                    index(attributes)
+                    applied += 1
+                return applied
+            except PterodactylAPIError as e:
+                if table.sort != '-updated_at' or e.status_code not in (400, 422):
+                    raise
+                print(f"Panel can't sort {table.name} by update time ({e.status_code}), refreshing by newest ID")
+                table.sort = '-id'
+            finally:
+                await items.aclose()
+
+    async def refresh(self):
+        """Apply changes made on the panel since the last refresh"""
+        started = time.monotonic()
+        applied = await self._delta(self.users, self._index_user)
+        applied += await self._delta(self.servers, self._index_server)
+        self.delta_records += applied
+        self.refreshed_at = started
+        if applied:
+            print(f"Panel mirror refreshed: {applied} changed records")
+
+    async def _refresh_loop(self):
+        # This task's panel requests yield to interactive ones
+        request_priority.set(BACKGROUND)
+        while True:
+            try:
+                if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.full_reload_interval:
+                    await self.load()
+                else:
+                    await self.refresh()
+            except Exception as e:
+                print(f"Exception refreshing panel mirror: {str(e)}")
+                traceback.print_exc()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start the background refresh task"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._refresh_loop())
+
+    def user(self, user_id):
+        """Get a mirrored user, or None if it is not mirrored"""
+        return self.users.records.get(user_id)
+
+    def user_by_email(self, email):
+        """Get a mirrored user by exact email, or None"""
+        user_id = self.users_by_email.get(email)
+        return self.users.records.get(user_id) if user_id is not None else None
+
+    def user_servers(self, user_id):
+        """Get the mirrored servers of a panel user"""
+        return [self.servers.records[server_id] for server_id in sorted(self.servers_by_user.get(user_id, ()))]
+
+    def upsert_user(self, attributes):
+        """Apply a user created or changed by the bot"""
+        self._index_user(attributes)
+
+    def upsert_server(self, attributes):
+        """Apply a server created or changed by the bot"""
+        self._index_server(attributes)
+
+    def remove_server(self, server_id):
+        """Apply a server deleted by the bot"""
+        attributes = self.servers.records.pop(server_id, None)
+        if attributes is not None:
+            self.servers_by_user.get(attributes['user'], set()).discard(server_id)
+
+    def stats(self):
+        """Get the mirror's size and refresh counters"""
+        return {
+            'users': len(self.users.records),
+            'servers': len(self.servers.records),
+            'fresh': self.is_fresh(),
+            'delta_records': self.delta_records,
+            'sort': {'users': self.users.sort, 'servers': self.servers.sort},
+        }
@@ -1,12 +1,22 @@
+import copy
 import json
 import os
 import threading
+import time
+from persistence_writer import WRITE_RETRY_DELAY, PersistenceWriter
 
 # File paths for data storage
 DATA_DIR = "data"
 USER_SERVERS_FILE = os.path.join(DATA_DIR, "user_servers.json")
 USER_AUTH_CODES_FILE = os.path.join(DATA_DIR, "user_auth_codes.json")
 PTERODACTYL_USERS_FILE = os.path.join(DATA_DIR, "pterodactyl_users.json")
+SQLITE_FILE = os.path.join(DATA_DIR, "bot.db")
+SNAPSHOT_FILE = os.path.join(DATA_DIR, "snapshot.json")
+BINARY_SNAPSHOT_FILE = os.path.join(DATA_DIR, "snapshot.bin")
+JOURNAL_FILE = os.path.join(DATA_DIR, "journal.log")
+
+# Attempts at writing pending changes when closing, before they are given up
+SHUTDOWN_FLUSH_ATTEMPTS = 3
 
 # Lock for thread-safe file operations
 file_lock = threading.Lock()
@@ -29,47 +39,289 @@ def load_data(file_path, default=None):
         print(f"Error loading data from {file_path}: {e}")
         return default
 
+def write_text_atomic(file_path, text):
+    """Write to a temp file, fsync it and rename it over the target, so a crash never leaves a truncated file"""
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+def write_json_atomic(file_path, data, indent=2):
+    """Write JSON atomically (see write_text_atomic)"""
+    write_text_atomic(file_path, json.dumps(data, indent=indent))
+
 def save_data(file_path, data):
     """Save data to a JSON file"""
     with file_lock:
         try:
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=2)
+            write_json_atomic(file_path, data)
             return True
         except Exception as e:
             print(f"Error saving data to {file_path}: {e}")
             return False
 
+class JSONBackend:
+    """Persistence backend that rewrites one pretty-printed JSON file per document
+
+    With a writer, changes only mark their document dirty and the writer thread
+    rewrites each dirty file once per flush window.
+    """
+    def __init__(self, writer=None):
+        self.writer = writer
+        self._lock = threading.Lock()
+        # Own copies of each document so row-level changes can be applied and written out
+        self._documents = {
+            USER_SERVERS_FILE: None,
+            USER_AUTH_CODES_FILE: None,
+            PTERODACTYL_USERS_FILE: None,
+        }
+
+    def _load(self, file_path):
+        with self._lock:
+            self._documents[file_path] = {str(k): v for k, v in load_data(file_path).items()}
+            return copy.deepcopy(self._documents[file_path])
+
+    def _document(self, file_path):
+        # Caller must hold the lock
+        if self._documents[file_path] is None:
+            self._documents[file_path] = {str(k): v for k, v in load_data(file_path).items()}
+        return self._documents[file_path]
+
+    def _save(self, file_path):
+        if self.writer is None:
+            return self._write(file_path)
+        self.writer.mark_dirty(file_path, lambda: self._write(file_path))
+        return True
+
+    def _write(self, file_path):
+        # Serialize under the lock, write to disk outside it
+        with self._lock:
+            text = json.dumps(self._documents[file_path], indent=2)
+        with file_lock:
+            try:
+                write_text_atomic(file_path, text)
+                return True
+            except Exception as e:
+                print(f"Error saving data to {file_path}: {e}")
+                return False
+
+    def load_user_servers(self):
+        return self._load(USER_SERVERS_FILE)
+
+    def load_user_auth_codes(self):
+        return self._load(USER_AUTH_CODES_FILE)
+
+    def load_pterodactyl_users(self):
+        return self._load(PTERODACTYL_USERS_FILE)
+
+    def add_user_server(self, discord_id, server_id):
+        with self._lock:
+            server_list = self._document(USER_SERVERS_FILE).setdefault(str(discord_id), [])
+            if server_id not in server_list:
+                server_list.append(server_id)
+        return self._save(USER_SERVERS_FILE)
+
+    def remove_server(self, server_id):
+        with self._lock:
+            for server_list in self._document(USER_SERVERS_FILE).values():
+                if server_id in server_list:
+                    server_list.remove(server_id)
+        return self._save(USER_SERVERS_FILE)
+
+    def set_user_servers(self, discord_id, server_ids):
+        with self._lock:
+            self._document(USER_SERVERS_FILE)[str(discord_id)] = list(server_ids)
+        return self._save(USER_SERVERS_FILE)
+
+    def link_user(self, discord_id, pterodactyl_user_id):
+        with self._lock:
+            self._document(PTERODACTYL_USERS_FILE)[str(discord_id)] = pterodactyl_user_id
+        return self._save(PTERODACTYL_USERS_FILE)
+
+    def add_auth_code(self, code, discord_id, expires_at):
+        with self._lock:
+            self._document(USER_AUTH_CODES_FILE)[code] = {'discord_id': str(discord_id), 'expires_at': expires_at}
+        return self._save(USER_AUTH_CODES_FILE)
+
+    def remove_auth_codes(self, codes):
+        with self._lock:
+            document = self._document(USER_AUTH_CODES_FILE)
+            for code in codes:
+                document.pop(code, None)
+        return self._save(USER_AUTH_CODES_FILE)
+
+    def save_user_servers(self, user_servers):
+        with self._lock:
+            self._documents[USER_SERVERS_FILE] = copy.deepcopy(user_servers)
+        return self._save(USER_SERVERS_FILE)
+
+    def save_user_auth_codes(self, user_auth_codes):
+        with self._lock:
+            self._documents[USER_AUTH_CODES_FILE] = dict(user_auth_codes)
+        return self._save(USER_AUTH_CODES_FILE)
+
+    def save_pterodactyl_users(self, pterodactyl_users):
+        with self._lock:
+            self._documents[PTERODACTYL_USERS_FILE] = dict(pterodactyl_users)
+        return self._save(PTERODACTYL_USERS_FILE)
+
+    def close(self):
+        pass
+
+# Active storage backend and its background writer, chosen by configure()
+_backend = None
+_writer = None
+# Backend settings opened on first use, set by use_backend()
+_settings = ('json',)
+_open_lock = threading.Lock()
+
+def _warn_json_imported(backend_name):
+    print(f"WARNING: the JSON files in {DATA_DIR} were imported into the {backend_name} backend and are no longer "
+          f"updated. Switching back to PERSISTENCE_BACKEND=json would load the data as it was before this import.")
+
+def configure(backend_name, journal_compact_every=1000, flush_window=0.5, snapshot_format='binary', state_url='local',
+              compact_state=False):
+    """Select the storage backend ('sqlite', 'journal', 'shared' or 'json'); a flush_window of 0 writes synchronously"""
+    global _backend, _writer
+    ensure_data_dir()
+
+    if _backend is not None:
+        close()
+
+    _writer = PersistenceWriter(flush_window) if flush_window > 0 else None
+
+    if backend_name == 'json':
+        _backend = JSONBackend(_writer)
+    elif backend_name == 'sqlite':
+        from sqlite_store import SQLiteBackend
+        _backend = SQLiteBackend(SQLITE_FILE, _writer)
+        # First start on SQLite: bring over the existing JSON data
+        if _backend.import_json(USER_SERVERS_FILE, USER_AUTH_CODES_FILE, PTERODACTYL_USERS_FILE, load_data):
+            _warn_json_imported(backend_name)
+    elif backend_name == 'journal':
+        from journal_store import JournalBackend
+        if snapshot_format == 'binary':
+            snapshot_file, previous_snapshot_file = BINARY_SNAPSHOT_FILE, SNAPSHOT_FILE
+        else:
+            snapshot_file, previous_snapshot_file = SNAPSHOT_FILE, BINARY_SNAPSHOT_FILE
+        _backend = JournalBackend(snapshot_file, JOURNAL_FILE, journal_compact_every, _writer, previous_snapshot_file,
+                                  compact_state)
+        if _backend.open(USER_SERVERS_FILE, USER_AUTH_CODES_FILE, PTERODACTYL_USERS_FILE):
+            _warn_json_imported(backend_name)
+    elif backend_name == 'shared':
+        from shared_store import SharedBackend
+        from state_backend import LocalStateBackend, create_state_backend
+        state = create_state_backend(state_url)
+        if isinstance(state, LocalStateBackend):
+            print("WARNING: the shared persistence backend is using STATE_BACKEND_URL=local, so all state is kept "
+                  "in this process's memory only and is LOST ON RESTART. Set STATE_BACKEND_URL to a redis:// URL.")
+        _backend = SharedBackend(state, _writer)
+        # First process on an empty shared store brings over the existing JSON data
+        if _backend.import_json(USER_SERVERS_FILE, USER_AUTH_CODES_FILE, PTERODACTYL_USERS_FILE, load_data):
+            _warn_json_imported(backend_name)
+    else:
+        raise ValueError(f"Unknown persistence backend: {backend_name}")
+
+    print(f"Using {backend_name} persistence backend")
+    return _backend
+
+def use_backend(backend_name, journal_compact_every=1000, flush_window=0.5, snapshot_format='binary', state_url='local',
+                compact_state=False):
+    """Choose the storage backend without opening it; it is opened on first use"""
+    global _settings
+    _settings = (backend_name, journal_compact_every, flush_window, snapshot_format, state_url, compact_state)
+
+def get_backend():
+    """Get the active storage backend, opening the one chosen by use_backend() on first use"""
+    if _backend is None:
+        with _open_lock:
+            if _backend is None:
+                configure(*_settings)
+    return _backend
+
 def load_user_servers():
     """Load user servers data"""
-    ensure_data_dir()
-    data = load_data(USER_SERVERS_FILE)
-    # Convert keys back to strings (JSON converts them to strings during serialization)
-    return {str(k): v for k, v in data.items()}
+    return get_backend().load_user_servers()
 
 def save_user_servers(user_servers):
     """Save user servers data"""
-    ensure_data_dir()
-    return save_data(USER_SERVERS_FILE, user_servers)
+    return get_backend().save_user_servers(user_servers)
 
 def load_user_auth_codes():
     """Load user auth codes data"""
-    ensure_data_dir()
-    data = load_data(USER_AUTH_CODES_FILE)
-    return {str(k): v for k, v in data.items()}
+    return get_backend().load_user_auth_codes()
 
 def save_user_auth_codes(user_auth_codes):
     """Save user auth codes data"""
-    ensure_data_dir()
-    return save_data(USER_AUTH_CODES_FILE, user_auth_codes)
+    return get_backend().save_user_auth_codes(user_auth_codes)
 
 def load_pterodactyl_users():
     """Load pterodactyl users data"""
-    ensure_data_dir()
-    data = load_data(PTERODACTYL_USERS_FILE)
-    return {str(k): v for k, v in data.items()}
+    return get_backend().load_pterodactyl_users()
 
 def save_pterodactyl_users(pterodactyl_users):
     """Save pterodactyl users data"""
-    ensure_data_dir()
-    return save_data(PTERODACTYL_USERS_FILE, pterodactyl_users)
+    return get_backend().save_pterodactyl_users(pterodactyl_users)
+
+def load_compact_registry():
+    """Load users and servers as a CompactRegistry straight from the backend's storage, or None if it can't"""
+    backend = get_backend()
+    if not hasattr(backend, 'load_compact_registry'):
+        return None
+    return backend.load_compact_registry()
+
+def add_user_server(discord_id, server_id):
+    """Record that a user owns a server"""
+    return get_backend().add_user_server(discord_id, server_id)
+
+def remove_server(server_id):
+    """Remove a server from every user's server list"""
+    return get_backend().remove_server(server_id)
+
+def set_user_servers(discord_id, server_ids):
+    """Replace one user's server list"""
+    return get_backend().set_user_servers(discord_id, server_ids)
+
+def link_user(discord_id, pterodactyl_user_id):
+    """Record a Discord user's linked Pterodactyl user"""
+    return get_backend().link_user(discord_id, pterodactyl_user_id)
+
+def add_auth_code(code, discord_id, expires_at):
+    """Store an auth code issued to a Discord user"""
+    return get_backend().add_auth_code(code, discord_id, expires_at)
+
+def remove_auth_codes(codes):
+    """Remove expired or used auth codes"""
+    return get_backend().remove_auth_codes(codes)
+
+def watch(callback):
+    """Call callback(message) for changes made by other processes; returns False if the backend is not shared"""
+    backend = get_backend()
+    if not hasattr(backend, 'watch'):
+        return False
+    backend.watch(callback)
+    return True
+
+def flush():
+    """Write every pending change to disk now; False if a write failed and is still pending"""
+    if _writer is not None:
+        return _writer.flush()
+    return True
+
+def writer_stats():
+    """Get the background writer's counters, or None when writes are synchronous"""
+    return _writer.stats() if _writer is not None else None
+
+def close():
+    """Flush pending changes and close the active storage backend"""
+    for attempt in range(SHUTDOWN_FLUSH_ATTEMPTS):
+        if flush():
+            break
+        if attempt + 1 < SHUTDOWN_FLUSH_ATTEMPTS:
+            time.sleep(WRITE_RETRY_DELAY)
+    else:
+        print(f"Giving up on pending persistence writes after {SHUTDOWN_FLUSH_ATTEMPTS} attempts: {writer_stats()}")
+    if _backend is not None:
+        _backend.close()
@@ -0,0 +1,85 @@
+import threading
+import time
+import traceback
+
+# Wait before retrying failed writes, doubling per consecutive failure up to the maximum
+WRITE_RETRY_DELAY = 1.0
+WRITE_RETRY_MAX_DELAY = 60.0
+
+class PersistenceWriter:
+    """Background thread that writes dirty persistence state, coalescing bursts of changes
+
+    Backends call mark_dirty(key, write) after changing state in memory. The first
+    notification opens a flush window; every notification for the same key within it
+    collapses into one call of the latest write function once the window closes.
+    A write that raises or returns False stays pending and is retried with backoff,
+    unless a newer write for its key was scheduled in the meantime.
+    """
+    def __init__(self, flush_window):
+        self.flush_window = flush_window
+        self._pending = {}  # Format: {key: write_function}
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()  # Keeps the thread and flush() from writing at the same time
+        self._thread = None
+        self._retry_delay = 0  # Extra wait before the next window while writes are failing
+        self.notifications = 0
+        self.writes = 0
+        self.failures = 0
+
+    def mark_dirty(self, key, write):
+        """Schedule write() to run once the current flush window closes"""
+        with self._condition:
+            self._pending[key] = write
+            self.notifications += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="persistence-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            # Let the rest of the burst arrive before writing
+            time.sleep(self.flush_window + self._retry_delay)
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._write_lock:
+            with self._condition:
+                batch, self._pending = self._pending, {}
+
+            failed = {}
+            for key, write in batch.items():
+                try:
+                    if write() is False:
+                        failed[key] = write
+                    else:
+                        self.writes += 1
+                except Exception as e:
+                    print(f"Error writing {key}: {e}")
+                    traceback.print_exc()
+                    failed[key] = write
+
+            if not failed:
+                self._retry_delay = 0
+                return True
+
+            self.failures += len(failed)
+            self._retry_delay = min(max(self._retry_delay * 2, WRITE_RETRY_DELAY), WRITE_RETRY_MAX_DELAY)
+            with self._condition:
+                # A newer write for the same key replaces the failed one
+                for key, write in failed.items():
+                    self._pending.setdefault(key, write)
+            print(f"{len(failed)} persistence write(s) failed, retrying in {self._retry_delay:.0f}s")
+            return False
+
+    def flush(self):
+        """Write everything that is pending now, in the calling thread (used at shutdown); False if a write failed"""
+        return self._write_pending()
+
+    def stats(self):
+        """Get notification and write counters"""
+        return {'notifications': self.notifications, 'writes': self.writes, 'failures': self.failures,
+                'pending': len(self._pending)}
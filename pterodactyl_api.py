@@ -1,12 +1,43 @@
-import requests
 import json
 import asyncio
 import uuid
-import random
 import secrets
 import traceback
-from config import PTERODACTYL_URL, PTERODACTYL_API_KEY, SERVER_TEMPLATES, USER_SERVERS, PTERODACTYL_USERS
+import concurrent.futures
+from types import MappingProxyType
+from config import (PTERODACTYL_URL, PTERODACTYL_API_KEY, SERVER_TEMPLATES, USER_SERVERS, PTERODACTYL_USERS, OWNERSHIP,
+                    CATALOG_CACHE_TTL, CATALOG_CACHE_MAX_ENTRIES, CATALOG_CACHE_STALE_GRACE, OAUTH_DEADLINE,
+                    MAX_SERVERS_PER_USER, USER_SERVERS_CACHE_TTL, PANEL_MIRROR_ENABLED, PANEL_MIRROR_INTERVAL,
+                    PANEL_MIRROR_FULL_RELOAD_INTERVAL, PANEL_MIRROR_MAX_STALENESS,
+                    SERVERS_DETAILS_CONCURRENCY, SERVERS_DETAILS_TIMEOUT)
 import persistence
+import panel_http
+from allocation_index import AllocationIndex
+from catalog_cache import CatalogCache
+from panel_mirror import PanelMirror
+from user_server_cache import UserServerCache
+from request_scheduler import INTERACTIVE, OAUTH, run_with_priority
+from deadlines import run_with_deadline, timeout_for
+from panel_http import PterodactylAPIError
+
+# Number of items requested per page from list endpoints
+PAGE_SIZE = 100
+
+def freeze(value):
+    """Recursively turn dicts into read-only mappings and lists into tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def thaw(value):
+    """Recursively copy a frozen value back into plain dicts and lists"""
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
 
 class PterodactylAPI:
     def __init__(self):
@@ -17,6 +48,128 @@ class PterodactylAPI:
             'Accept': 'application/json',
             'Content-Type': 'application/json',
         }
+        self.allocation_index = AllocationIndex(self)
+        self.catalog = CatalogCache(CATALOG_CACHE_MAX_ENTRIES, CATALOG_CACHE_STALE_GRACE)
+        self.compiled_templates = {}  # Format: {template_name: frozen payload skeleton}
+        self.user_server_cache = UserServerCache(USER_SERVERS_CACHE_TTL)
+        self._server_listings = {}  # Format: {(discord_user_id, fresh): asyncio.Task}, listings in flight
+        self._prefetches = set()    # Autocomplete listings in flight
+        # Background copy of panel users and servers that answers reads, when enabled
+        self.mirror = PanelMirror(self, PANEL_MIRROR_INTERVAL, PANEL_MIRROR_FULL_RELOAD_INTERVAL,
+                                  PANEL_MIRROR_MAX_STALENESS) if PANEL_MIRROR_ENABLED else None
+        self.loop = None  # The bot's event loop, used by the sync wrappers
+
+    async def _request(self, method, url, params=None, json=None):
+        """Send a request to the panel over the shared non-blocking session"""
+        return await panel_http.request(method, url, headers=self.headers, params=params, json_body=json)
+
+    def bind_loop(self, loop):
+        """Remember the bot's event loop so sync callers in other threads can use the async client"""
+        self.loop = loop
+
+    def _run_sync(self, coro, level=OAUTH, timeout=OAUTH_DEADLINE):
+        """Run a coroutine on the bot's loop from another thread (the web server) and wait for it"""
+        if self.loop is None or self.loop.is_closed():
+            coro.close()
+            raise RuntimeError("The bot's event loop is not running")
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            coro.close()
+            raise RuntimeError("Sync panel helpers can't be called from the bot's event loop")
+
+        future = asyncio.run_coroutine_threadsafe(run_with_deadline(run_with_priority(coro, level), timeout), self.loop)
+        try:
+            # The deadline normally ends the call first, this only guards against a stuck loop
+            return future.result(timeout + 5)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def start_background_tasks(self):
+        """Start the periodic background jobs (must be called from the running loop)"""
+        self.allocation_index.start()
+        if self.mirror is not None:
+            self.mirror.start()
+
+    def request_stats(self):
+        """Get counters for coalesced and scheduled panel requests"""
+        return panel_http.stats()
+
+    def _mirror(self, fresh=False):
+        """Get the panel mirror if it may answer a read, else None"""
+        if fresh or self.mirror is None or not self.mirror.is_fresh():
+            return None
+        return self.mirror
+
+    async def close(self):
+        """Close the shared HTTP session"""
+        await panel_http.close_session()
+
+    async def _get_attributes(self, url, params=None):
+        """Fetch a single object and return its attributes"""
+        response = await self._request('GET', url, params=params)
+
+        if response.status_code != 200:
+            raise PterodactylAPIError(response.status_code, response.text)
+
+        return response.json()['attributes']
+
+    async def _get_page(self, url, params, page):
+        """Fetch one page of a list endpoint and return its items and pagination meta"""
+        response = await self._request('GET', url, params={**params, 'page': page})
+
+        if response.status_code != 200:
+            raise PterodactylAPIError(response.status_code, response.text)
+
+        body = response.json()
+        pagination = body.get('meta', {}).get('pagination', {})
+        return body['data'], pagination
+
+    async def iter_list(self, url, params=None):
+        """Iterate over every item of a paginated list endpoint, prefetching the next page"""
+        params = dict(params or {})
+        params.setdefault('per_page', PAGE_SIZE)
+
+        page = 1
+        pending = asyncio.ensure_future(self._get_page(url, params, page))
+        try:
+            while pending is not None:
+                items, pagination = await pending
+                pending = None
+
+                # Start on the next page while the caller consumes this one
+                if pagination.get('current_page', page) < pagination.get('total_pages', 1):
+                    page += 1
+                    pending = asyncio.ensure_future(self._get_page(url, params, page))
+
+                for item in items:
+                    yield item
+        finally:
+            if pending is not None:
+                if pending.done():
+                    if not pending.cancelled():
+                        pending.exception()
+                else:
+                    pending.cancel()
+
+    async def list_all(self, url, params=None):
+        """Collect every item of a paginated list endpoint"""
+        return [item async for item in self.iter_list(url, params)]
+
+    async def find_first(self, url, predicate, params=None):
+        """Return the first item of a list endpoint matching predicate, stopping early"""
+        items = self.iter_list(url, params)
+        try:
+            async for item in items:
+                if predicate(item):
+                    return item
+            return None
+        finally:
+            await items.aclose()
 
     async def create_user(self, username, email, first_name, last_name, password=None):
         """Create a new user in Pterodactyl Panel"""
@@ -32,57 +185,226 @@ class PterodactylAPI:
             "password": password,
         }
 
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = await self._request('POST', url, json=payload)
 
         if response.status_code == 201:
-            return response.json()['attributes']
+            user = response.json()['attributes']
+            if self.mirror is not None:
+                self.mirror.upsert_user(user)
+            return user
         else:
             print(f"Error creating user: {response.text}")
             return None
 
-    async def get_user_by_email(self, email):
-        """Get a user by email - async version"""
-        url = f"{self.base_url}/api/application/users"
-        response = requests.get(url, headers=self.headers)
+    async def get_user(self, user_id, fresh=False):
+        """Get a user by their Pterodactyl user ID (fresh=True skips the panel mirror)"""
+        mirror = self._mirror(fresh)
+        if mirror is not None and mirror.user(user_id) is not None:
+            return mirror.user(user_id)
 
-        if response.status_code == 200:
-            users = response.json()['data']
-            for user in users:
-                if user['attributes']['email'] == email:
-                    return user['attributes']
+        try:
+            url = f"{self.base_url}/api/application/users/{user_id}"
+            response = await self._request('GET', url)
 
-        return None
+            if response.status_code == 200:
+                return response.json()['attributes']
+            else:
+                print(f"Error getting user details: {response.text}")
+                return None
+        except Exception as e:
+            print(f"Exception getting user details: {str(e)}")
+            return None
+
+    async def get_user_by_email(self, email, fresh=False):
+        """Get a user by email - async version (fresh=True skips the panel mirror)"""
+        mirror = self._mirror(fresh)
+        if mirror is not None and mirror.user_by_email(email) is not None:
+            return mirror.user_by_email(email)
+
+        url = f"{self.base_url}/api/application/users"
+
+        # The panel's email filter is a partial match, so still compare exactly
+        def matches(user):
+            return user['attributes']['email'] == email
 
-    def get_user_by_email_sync(self, email):
-        """Get a user by email - sync version"""
         try:
-            url = f"{self.base_url}/api/application/users"
-            response = requests.get(url, headers=self.headers)
+            user = await self.find_first(url, matches, params={'filter[email]': email})
+        except PterodactylAPIError as e:
+            # Older panels may reject the filter, fall back to scanning every user
+            print(f"Filtered user lookup failed ({e.status_code}), scanning all users")
+            try:
+                user = await self.find_first(url, matches)
+            except PterodactylAPIError as e:
+                print(f"Error getting user by email: {e.text}")
+                return None
 
-            if response.status_code == 200:
-                users = response.json()['data']
-                for user in users:
-                    if user['attributes']['email'] == email:
-                        return user['attributes']
+        return user['attributes'] if user else None
 
-            return None
+    def get_user_by_email_sync(self, email):
+        """Get a user by email - sync version for the web server thread"""
+        try:
+            return self._run_sync(self.get_user_by_email(email))
         except Exception as e:
             print(f"Error getting user by email: {str(e)}")
             return None
 
+    def _build_environment(self, egg_details, template):
+        """Build a template's environment variables from its egg's defaults and the template env"""
+        environment_vars = {}
+
+        # Check if we have variables in the egg details
+        egg_variables = egg_details.get('relationships', {}).get('variables', {}).get('data', [])
+        if egg_variables:
+            print(f"Found {len(egg_variables)} variables for egg {egg_details.get('id')}")
+
+            # Get detailed variable information for all variables from the egg
+            for var_data in egg_variables:
+                var_attr = var_data.get('attributes', {})
+                env_name = var_attr.get('env_variable')
+                env_default = var_attr.get('default_value')
+                env_required = var_attr.get('required', False)
+
+                print(f"Variable: {env_name}, Default: {env_default}, Required: {env_required}")
+
+                if env_name:
+                    environment_vars[env_name] = env_default or ''
+
+        # If no environment variables were found in the egg, use some basic defaults based on egg type
+        if not environment_vars:
+            egg_name = egg_details.get('name', '').lower()
+            print(f"No environment variables found in egg relationships. Using basic defaults for egg type: {egg_name}")
+
+            if 'python' in egg_name:
+                environment_vars = {
+                    "USER_UPLOAD": "0",
+                    "AUTO_UPDATE": "0",
+                    "PY_FILE": "main.py",
+                    "REQUIREMENTS_FILE": "requirements.txt",
+                    "STARTUP_CMD": "python"
+                }
+            elif 'minecraft' in egg_name:
+                environment_vars = {
+                    "SERVER_JARFILE": "server.jar",
+                    "MINECRAFT_VERSION": "latest",
+                    "BUILD_NUMBER": "latest",
+                    "VANILLA_VERSION": "latest"
+                }
+            elif 'node' in egg_name or 'javascript' in egg_name:
+                environment_vars = {
+                    "USER_UPLOAD": "0",
+                    "AUTO_UPDATE": "0",
+                    "JS_FILE": "index.js",
+                    "NODE_PACKAGES": ""
+                }
+            else:
+                # Generic fallback
+                environment_vars = {
+                    "USER_UPLOAD": "0",
+                    "AUTO_UPDATE": "0"
+                }
+
+        # Apply template-specific environment variables if available
+        if 'env' in template:
+            print(f"Applying template-specific environment variables: {template['env']}")
+            for key, value in template['env'].items():
+                environment_vars[key] = value
+
+        return environment_vars
+
+    async def compile_template(self, template_name):
+        """Validate a template against the panel and build its frozen creation payload skeleton"""
+        template = SERVER_TEMPLATES[template_name]
+
+        # Get the nest and egg details
+        nest_id = template.get('nest', 1)  # Default to nest ID 1 if not specified
+        egg_id = template.get('egg', 1)    # Default to egg ID 1 if not specified
+
+        # Get egg details to ensure we have the correct environment variables and startup command
+        egg_details = await self.get_egg_details(nest_id, egg_id)
+
+        if not egg_details:
+            return None, f"Could not find egg with ID {egg_id} in nest {nest_id}"
+
+        skeleton = {
+            "description": f"Server created with {template_name} template via Discord bot",
+            "egg": egg_id,
+            # Get the correct docker image and startup command from the egg
+            "docker_image": egg_details.get('docker_image', "ghcr.io/pterodactyl/yolks:java_17"),
+            "startup": egg_details.get('startup', "java -Xms128M -Xmx{{SERVER_MEMORY}}M -jar {{SERVER_JARFILE}}"),
+            "environment": self._build_environment(egg_details, template),
+            "limits": {
+                "memory": template['memory'],
+                "swap": 0,
+                "disk": template['disk'],
+                "io": 500,
+                "cpu": template['cpu']
+            },
+            "feature_limits": {
+                "databases": 1,
+                "backups": 1,
+                "allocations": 1
+            },
+            "start_on_completion": True,
+            "skip_scripts": False,
+            "oom_disabled": True
+        }
+
+        compiled = freeze(skeleton)
+        self.compiled_templates[template_name] = compiled
+        return compiled, None
+
+    async def compile_templates(self):
+        """Compile every template concurrently and report the ones that fail"""
+        names = list(SERVER_TEMPLATES)
+        results = await asyncio.gather(*(self.compile_template(name) for name in names), return_exceptions=True)
+
+        errors = {}
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                errors[name] = f"Exception compiling template: {str(result)}"
+            elif result[1]:
+                errors[name] = result[1]
+
+        print(f"Compiled {len(names) - len(errors)}/{len(names)} server templates")
+        for name, error in errors.items():
+            print(f"  - Template '{name}' is invalid: {error}")
+
+        return errors
+
+    async def get_compiled_template(self, template_name):
+        """Get a template's payload skeleton, compiling it first if needed"""
+        compiled = self.compiled_templates.get(template_name)
+        if compiled is not None:
+            return compiled, None
+        return await self.compile_template(template_name)
+
+    def invalidate_catalog(self):
+        """Drop cached catalog data and compiled templates; returns the number of cache entries dropped"""
+        self.compiled_templates.clear()
+        return self.catalog.invalidate()
+
+    async def warm_up(self):
+        """Compile templates and build the allocation index so the first /create is not slower than later ones"""
+        await asyncio.gather(self.compile_templates(), self.allocation_index.ensure_built())
+
     async def create_server(self, user_id, template_name, server_name=None):
         """Create a new server for a user based on a template with automatic allocation"""
+        reserved_allocation_id = None
         try:
             if template_name not in SERVER_TEMPLATES:
                 return None, "Template not found"
 
-            template = SERVER_TEMPLATES[template_name]
-
             if server_name is None:
                 server_name = f"{template_name}-{str(uuid.uuid4())[:8]}"
 
             print(f"Creating server '{server_name}' for user {user_id} with template {template_name}")
 
+            # Get the precompiled payload for this template
+            compiled, error = await self.get_compiled_template(template_name)
+
+            if not compiled:
+                return None, error
+
             # Find an available node and allocation
             node_allocation = await self.find_available_node_and_allocation()
 
@@ -91,132 +413,38 @@ class PterodactylAPI:
 
             node = node_allocation['node']
             allocation = node_allocation['allocation']
+            reserved_allocation_id = allocation['id']
 
             print(f"Found node {node['id']} and allocation {allocation['id']} ({allocation['ip']}:{allocation['port']})")
 
-            # Get the nest and egg details
-            nest_id = template.get('nest', 1)  # Default to nest ID 1 if not specified
-            egg_id = template.get('egg', 1)    # Default to egg ID 1 if not specified
-
-            # Use the node's location
-            location_id = node['location_id']
-
-            # Get egg details to ensure we have the correct environment variables and startup command
-            egg_details = await self.get_egg_details(nest_id, egg_id)
-
-            if not egg_details:
-                return None, f"Could not find egg with ID {egg_id} in nest {nest_id}"
-
-            # Get the correct docker image and startup command from the egg
-            docker_image = egg_details.get('docker_image', "ghcr.io/pterodactyl/yolks:java_17")
-            startup_command = egg_details.get('startup', "java -Xms128M -Xmx{{SERVER_MEMORY}}M -jar {{SERVER_JARFILE}}")
-
-            # Get the environment variables from the egg
-            environment_vars = {}
-
-            # Check if we have variables in the egg details
-            egg_variables = egg_details.get('relationships', {}).get('variables', {}).get('data', [])
-            if egg_variables:
-                print(f"Found {len(egg_variables)} variables for egg {egg_id}")
-
-                # Get detailed variable information for all variables from the egg
-                for var_data in egg_variables:
-                    var_attr = var_data.get('attributes', {})
-                    env_name = var_attr.get('env_variable')
-                    env_default = var_attr.get('default_value')
-                    env_required = var_attr.get('required', False)
-
-                    print(f"Variable: {env_name}, Default: {env_default}, Required: {env_required}")
-
-                    if env_name:
-                        environment_vars[env_name] = env_default or ''
-
-            # If no environment variables were found in the egg, log a warning
-            if not environment_vars:
-                print("No environment variables found in egg relationships")
-
-            # If still no environment variables were found, use some basic defaults based on egg type
-            if not environment_vars:
-                egg_name = egg_details.get('name', '').lower()
-                print(f"No environment variables found. Using basic defaults for egg type: {egg_name}")
-
-                if 'python' in egg_name:
-                    environment_vars = {
-                        "USER_UPLOAD": "0",
-                        "AUTO_UPDATE": "0",
-                        "PY_FILE": "main.py",
-                        "REQUIREMENTS_FILE": "requirements.txt",
-                        "STARTUP_CMD": "python"
-                    }
-                elif 'minecraft' in egg_name:
-                    environment_vars = {
-                        "SERVER_JARFILE": "server.jar",
-                        "MINECRAFT_VERSION": "latest",
-                        "BUILD_NUMBER": "latest",
-                        "VANILLA_VERSION": "latest"
-                    }
-                elif 'node' in egg_name or 'javascript' in egg_name:
-                    environment_vars = {
-                        "USER_UPLOAD": "0",
-                        "AUTO_UPDATE": "0",
-                        "JS_FILE": "index.js",
-                        "NODE_PACKAGES": ""
-                    }
-                else:
-                    # Generic fallback
-                    environment_vars = {
-                        "USER_UPLOAD": "0",
-                        "AUTO_UPDATE": "0"
-                    }
-
-            # Apply template-specific environment variables if available
-            if 'env' in template:
-                print(f"Applying template-specific environment variables: {template['env']}")
-                for key, value in template['env'].items():
-                    environment_vars[key] = value
-
+            # Only the per-server fields are filled in here
             url = f"{self.base_url}/api/application/servers"
-            payload = {
-                "name": server_name,
-                "description": f"Server created with {template_name} template via Discord bot",
-                "user": user_id,
-                "egg": egg_id,
-                "docker_image": docker_image,
-                "startup": startup_command,
-                "environment": environment_vars,
-                "limits": {
-                    "memory": template['memory'],
-                    "swap": 0,
-                    "disk": template['disk'],
-                    "io": 500,
-                    "cpu": template['cpu']
-                },
-                "feature_limits": {
-                    "databases": 1,
-                    "backups": 1,
-                    "allocations": 1
-                },
-                "allocation": {
-                    "default": allocation['id']
-                },
-                "start_on_completion": True,
-                "skip_scripts": False,
-                "oom_disabled": True
+            payload = thaw(compiled)
+            payload["name"] = server_name
+            payload["user"] = user_id
+            payload["allocation"] = {
+                "default": allocation['id']
             }
 
             print(f"Sending server creation request with payload: {json.dumps(payload, indent=2)}")
 
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = await self._request('POST', url, json=payload)
 
             if response.status_code == 201:
                 server_data = response.json()['attributes']
+                self.allocation_index.confirm(reserved_allocation_id)
+                if self.mirror is not None:
+                    self.mirror.upsert_server(server_data)
                 print(f"Server created successfully with ID: {server_data['id']}")
                 return server_data, None
             else:
+                self.allocation_index.discard(reserved_allocation_id)
                 error_message = f"Error creating server: {response.status_code} - {response.text}"
                 print(error_message)
                 return None, error_message
         except Exception as e:
+            if reserved_allocation_id is not None:
+                self.allocation_index.discard(reserved_allocation_id)
             error_message = f"Exception creating server: {str(e)}"
             print(error_message)
             return None, error_message
@@ -225,13 +453,10 @@ class PterodactylAPI:
         """Get all nests"""
         try:
             url = f"{self.base_url}/api/application/nests"
-            response = requests.get(url, headers=self.headers)
-
-            if response.status_code == 200:
-                return response.json()['data']
-            else:
-                print(f"Error getting nests: {response.text}")
-                return []
+            return await self.catalog.get(('nests',), CATALOG_CACHE_TTL['nests'], lambda: self.list_all(url))
+        except PterodactylAPIError as e:
+            print(f"Error getting nests: {e.text}")
+            return []
         except Exception as e:
             print(f"Exception getting nests: {str(e)}")
             return []
@@ -240,13 +465,10 @@ class PterodactylAPI:
         """Get all eggs for a nest"""
         try:
             url = f"{self.base_url}/api/application/nests/{nest_id}/eggs"
-            response = requests.get(url, headers=self.headers)
-
-            if response.status_code == 200:
-                return response.json()['data']
-            else:
-                print(f"Error getting eggs: {response.text}")
-                return []
+            return await self.catalog.get(('eggs', nest_id), CATALOG_CACHE_TTL['eggs'], lambda: self.list_all(url))
+        except PterodactylAPIError as e:
+            print(f"Error getting eggs: {e.text}")
+            return []
         except Exception as e:
             print(f"Exception getting eggs: {str(e)}")
             return []
@@ -254,31 +476,32 @@ class PterodactylAPI:
     async def get_egg_details(self, nest_id, egg_id):
         """Get details for a specific egg"""
         try:
-            url = f"{self.base_url}/api/application/nests/{nest_id}/eggs/{egg_id}?include=variables"
-            response = requests.get(url, headers=self.headers)
-
-            if response.status_code == 200:
-                return response.json()['attributes']
+            url = f"{self.base_url}/api/application/nests/{nest_id}/eggs/{egg_id}"
+            return await self.catalog.get(
+                ('egg', nest_id, egg_id),
+                CATALOG_CACHE_TTL['eggs'],
+                lambda: self._get_attributes(url, params={'include': 'variables'})
+            )
+        except PterodactylAPIError as e:
+            print(f"Error getting egg details: {e.text}")
+            # Try to get all eggs to see what's available
+            print("Attempting to list available eggs:")
+            eggs = await self.get_eggs(nest_id)
+            if eggs:
+                print(f"Available eggs for nest {nest_id}:")
+                for egg in eggs:
+                    print(f"  - ID: {egg['attributes']['id']}, Name: {egg['attributes']['name']}")
             else:
-                print(f"Error getting egg details: {response.text}")
-                # Try to get all eggs to see what's available
-                print("Attempting to list available eggs:")
-                eggs = await self.get_eggs(nest_id)
-                if eggs:
-                    print(f"Available eggs for nest {nest_id}:")
-                    for egg in eggs:
-                        print(f"  - ID: {egg['attributes']['id']}, Name: {egg['attributes']['name']}")
+                print(f"No eggs found for nest {nest_id}")
+                # Try to list all nests
+                nests = await self.get_nests()
+                if nests:
+                    print("Available nests:")
+                    for nest in nests:
+                        print(f"  - ID: {nest['attributes']['id']}, Name: {nest['attributes']['name']}")
                 else:
-                    print(f"No eggs found for nest {nest_id}")
-                    # Try to list all nests
-                    nests = await self.get_nests()
-                    if nests:
-                        print("Available nests:")
-                        for nest in nests:
-                            print(f"  - ID: {nest['attributes']['id']}, Name: {nest['attributes']['name']}")
-                    else:
-                        print("No nests found")
-                return None
+                    print("No nests found")
+            return None
         except Exception as e:
             print(f"Exception getting egg details: {str(e)}")
             traceback.print_exc()
@@ -288,116 +511,119 @@ class PterodactylAPI:
         """Get details for a specific egg variable"""
         try:
             url = f"{self.base_url}/api/application/nests/{nest_id}/eggs/{egg_id}/variables/{variable_id}"
-            response = requests.get(url, headers=self.headers)
-
-            if response.status_code == 200:
-                return response.json()['attributes']
-            else:
-                print(f"Error getting egg variable details: {response.text}")
-                return None
+            return await self.catalog.get(
+                ('egg_variable', nest_id, egg_id, variable_id),
+                CATALOG_CACHE_TTL['egg_variables'],
+                lambda: self._get_attributes(url)
+            )
+        except PterodactylAPIError as e:
+            print(f"Error getting egg variable details: {e.text}")
+            return None
         except Exception as e:
             print(f"Exception getting egg variable details: {str(e)}")
             return None
 
-    async def get_user_servers(self, user_id):
-        """Get all servers for a user"""
-        url = f"{self.base_url}/api/application/servers"
-        response = requests.get(url, headers=self.headers)
+    async def get_egg_variables(self, nest_id, egg_id):
+        """Get all variables for a specific egg"""
+        egg_details = await self.get_egg_details(nest_id, egg_id)
+        if not egg_details:
+            return []
+
+        return egg_details.get('relationships', {}).get('variables', {}).get('data', [])
+
+    async def get_user_servers(self, user_id, fresh=False):
+        """Get all servers for a user, or None if the panel could not list them (fresh=True skips the panel mirror)"""
+        mirror = self._mirror(fresh)
+        if mirror is not None and mirror.user(user_id) is not None:
+            return mirror.user_servers(user_id)
+
+        # Ask the panel for just this user's servers
+        url = f"{self.base_url}/api/application/users/{user_id}"
+        try:
+            response = await self._request('GET', url, params={'include': 'servers'})
+        except PterodactylAPIError as e:
+            print(f"Error getting servers for user {user_id}: {e.text}")
+            return None
 
         if response.status_code == 200:
-            servers = response.json()['data']
-            user_servers = []
+            servers = response.json()['attributes'].get('relationships', {}).get('servers')
+            if servers is not None:
+                return [server['attributes'] for server in servers['data']]
+        elif response.status_code == 404:
+            print(f"User {user_id} not found on the panel")
+            return []
 
-            for server in servers:
+        # Older panels without the include, fall back to scanning every server
+        print(f"Could not include servers for user {user_id} ({response.status_code}), scanning all servers")
+        url = f"{self.base_url}/api/application/servers"
+
+        try:
+            user_servers = []
+            async for server in self.iter_list(url, params={'include': 'allocations'}):
                 if server['attributes']['user'] == user_id:
                     user_servers.append(server['attributes'])
 
             return user_servers
-        else:
-            print(f"Error getting servers: {response.text}")
-            return []
+        except PterodactylAPIError as e:
+            print(f"Error getting servers: {e.text}")
+            return None
 
-    async def link_discord_to_pterodactyl(self, discord_id, email, username, first_name="Discord", last_name="User"):
+    async def link_discord_to_pterodactyl(self, discord_id, email, username, first_name="Discord", last_name="User", password=None):
         """Link a Discord user to a Pterodactyl user (create if doesn't exist) - async version"""
         # Check if user already exists
         user = await self.get_user_by_email(email)
 
         if not user:
             # Create new user
-            user = await self.create_user(username, email, first_name, last_name)
-
-        if user:
-            # Store the link in our database
-            PTERODACTYL_USERS[discord_id] = user['id']
-            # Save the updated data to disk
-            persistence.save_pterodactyl_users(PTERODACTYL_USERS)
-            print(f"Saved link between Discord user {discord_id} and Pterodactyl user {user['id']}")
-            return user
+            if not username:
+                username = f"discord_{discord_id}"
 
-        return None
+            user = await self.create_user(username, email, first_name, last_name, password)
+            if not user:
+                return None
+            print(f"Created new user with ID: {user['id']}")
+        else:
+            print(f"Found existing user with ID: {user['id']}")
+
+        # Store the link in our database
+        OWNERSHIP.link(discord_id, user['id'])
+        # Save the new link to disk
+        persistence.link_user(discord_id, user['id'])
+        print(f"Linked Discord user {discord_id} to Pterodactyl user {user['id']} and saved to disk")
+        return user
 
     def link_discord_to_pterodactyl_sync(self, discord_id, email, username, first_name="Discord", last_name="User", password=None):
         """Link a Discord user to a Pterodactyl user (create if doesn't exist) - sync version for web server"""
         try:
-            # Check if user already exists
-            user = self.get_user_by_email_sync(email)
-
-            if not user:
-                # Create new user
-                if not username:
-                    username = f"discord_{discord_id}"
-
-                if not password:
-                    password = str(uuid.uuid4())  # Generate a random password if none provided
-
-                url = f"{self.base_url}/api/application/users"
-                payload = {
-                    "username": username,
-                    "email": email,
-                    "first_name": first_name,
-                    "last_name": last_name,
-                    "password": password,
-                }
-
-                print(f"Creating new user with payload: {payload}")
-                response = requests.post(url, headers=self.headers, json=payload)
-
-                if response.status_code == 201:
-                    user = response.json()['attributes']
-                    print(f"Created new user with ID: {user['id']}")
-                else:
-                    print(f"Error creating user: {response.text}")
-                    return None
-            else:
-                print(f"Found existing user with ID: {user['id']}")
-
-            if user:
-                # Store the link in our database
-                PTERODACTYL_USERS[discord_id] = user['id']
-                # Save the updated data to disk
-                persistence.save_pterodactyl_users(PTERODACTYL_USERS)
-                print(f"Linked Discord user {discord_id} to Pterodactyl user {user['id']} and saved to disk")
-                return user
-
-            return None
+            return self._run_sync(self.link_discord_to_pterodactyl(discord_id, email, username, first_name, last_name, password))
         except Exception as e:
             print(f"Error linking Discord to Pterodactyl: {str(e)}")
             traceback.print_exc()
             return None
 
-    async def check_server_owner(self, server_id, discord_id):
-        """Check if the user is the owner of the server"""
+    async def check_server_owner(self, server_id, discord_id, server_data=None):
+        """Check if the user is the owner of the server
+
+        Answered from the ownership index when it knows the server; server_data, if the
+        caller already fetched it from the panel, is returned as is. Otherwise the server
+        is fetched from the panel.
+        """
+        owner = OWNERSHIP.owner_of(server_id)
+        if owner is not None:
+            if owner != discord_id:
+                return False, None
+            return True, server_data
+
         try:
             # Get server details
             url = f"{self.base_url}/api/application/servers/{server_id}"
-            response = requests.get(url, headers=self.headers)
+            response = await self._request('GET', url, params={'include': 'allocations'})
 
             if response.status_code == 200:
                 server_data = response.json()['attributes']
-                pterodactyl_user_id = PTERODACTYL_USERS.get(discord_id)
 
-                # Check if the user is the owner
-                if pterodactyl_user_id and server_data['user'] == pterodactyl_user_id:
+                # Check if the user is linked to the panel user owning the server
+                if OWNERSHIP.discord_id_for(server_data['user']) == discord_id:
                     return True, server_data
                 else:
                     return False, None
@@ -409,30 +635,36 @@ class PterodactylAPI:
             traceback.print_exc()
             return False, None
 
-    async def delete_server(self, server_id, discord_id=None):
-        """Delete a server from the Pterodactyl panel"""
+    async def delete_server(self, server_id, discord_id=None, server_data=None):
+        """Delete a server from the Pterodactyl panel; server_data is the server's attributes if already fetched"""
         try:
             # If discord_id is provided, verify ownership
             if discord_id:
-                is_owner, _ = await self.check_server_owner(server_id, discord_id)
+                is_owner, server_data = await self.check_server_owner(server_id, discord_id, server_data)
                 if not is_owner:
                     print(f"User {discord_id} is not the owner of server {server_id}")
                     return False
 
             url = f"{self.base_url}/api/application/servers/{server_id}"
-            response = requests.delete(url, headers=self.headers)
+            response = await self._request('DELETE', url)
 
             if response.status_code == 204:
                 print(f"Server {server_id} deleted successfully")
+                if self.mirror is not None:
+                    self.mirror.remove_server(server_id)
 
-                # Remove the server from all users' server lists
-                for user_id, server_list in USER_SERVERS.items():
-                    if server_id in server_list:
-                        USER_SERVERS[user_id].remove(server_id)
-                        print(f"Removed server {server_id} from user {user_id}'s server list")
+                # Free the server's allocation in the index (otherwise the next reconcile frees it)
+                if server_data:
+                    self.allocation_index.release(server_data['allocation'])
 
-                # Save the updated data to disk
-                persistence.save_user_servers(USER_SERVERS)
+                # Remove the server from its owner's server list and cached servers
+                owner = OWNERSHIP.remove_server(server_id)
+                if owner is not None:
+                    self.user_server_cache.remove(owner, server_id)
+                    print(f"Removed server {server_id} from user {owner}'s server list")
+
+                # Save the removal to disk
+                persistence.remove_server(server_id)
                 print(f"Saved updated user servers data to disk after deleting server {server_id}")
 
                 return True
@@ -444,69 +676,108 @@ class PterodactylAPI:
             traceback.print_exc()
             return False
 
-    async def sync_user_servers(self, discord_id):
-        """Sync the user's servers with the Pterodactyl panel"""
-        try:
-            if discord_id not in PTERODACTYL_USERS:
-                return False
+    async def sync_user_servers(self, discord_id, fresh=False):
+        """Sync the user's servers with the Pterodactyl panel, unless they were listed within the freshness window"""
+        return await self.get_cached_user_servers(discord_id, fresh) is not None
 
-            pterodactyl_user_id = PTERODACTYL_USERS[discord_id]
-            servers = await self.get_user_servers(pterodactyl_user_id)
+    async def get_cached_user_servers(self, discord_id, fresh=False):
+        """Get a linked user's servers from the per-user cache, listing them from the panel when stale or fresh=True
 
-            # Update the USER_SERVERS dictionary
-            if discord_id not in USER_SERVERS:
-                USER_SERVERS[discord_id] = []
+        Returns None if the user is not linked or the panel could not list the servers.
+        """
+        if discord_id not in PTERODACTYL_USERS:
+            return None
 
-            # Clear the current list and add the servers from the panel
-            USER_SERVERS[discord_id] = [server['id'] for server in servers]
-            print(f"Synced servers for user {discord_id}: {USER_SERVERS[discord_id]}")
+        if not fresh:
+            servers = self.user_server_cache.get(discord_id)
+            if servers is not None:
+                return servers
+
+        # Concurrent commands of the same user share one listing
+        key = (discord_id, fresh)
+        task = self._server_listings.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._list_user_servers(discord_id, fresh))
+            self._server_listings[key] = task
+            task.add_done_callback(lambda _: self._server_listings.pop(key, None))
+        servers = await asyncio.shield(task)
+        return list(servers) if servers is not None else None
+
+    def autocomplete_servers(self, discord_id, query):
+        """Autocomplete a user's server names from the cache, without waiting on the panel
+
+        Returns (label, server_id) pairs. If the user's servers were never listed, a listing
+        is started so the next keystroke has results. It runs at interactive priority, since
+        the user is waiting on it and commands of the same user may join it.
+        """
+        choices = self.user_server_cache.search_names(discord_id, query)
+        if choices is None:
+            if discord_id in PTERODACTYL_USERS and (discord_id, False) not in self._server_listings:
+                task = asyncio.ensure_future(run_with_priority(self.get_cached_user_servers(discord_id), INTERACTIVE))
+                # The loop only keeps weak references to tasks
+                self._prefetches.add(task)
+                task.add_done_callback(self._prefetches.discard)
+            return []
+        return choices
 
-            # Save the updated data to disk
-            persistence.save_user_servers(USER_SERVERS)
-            print(f"Saved updated user servers data to disk after syncing for user {discord_id}")
+    async def _list_user_servers(self, discord_id, fresh):
+        try:
+            pterodactyl_user_id = PTERODACTYL_USERS[discord_id]
+            servers = await self.get_user_servers(pterodactyl_user_id, fresh)
+            if servers is None:
+                # Keep the last known list rather than treating a failed listing as no servers
+                return None
 
-            return True
+            server_ids = [server['id'] for server in servers]
+            print(f"Synced servers for user {discord_id}: {server_ids}")
+            self.user_server_cache.store(discord_id, servers)
+
+            # Only write to disk when the list actually changed; servers that moved to this
+            # user are dropped from their previous owner's list as well
+            changed = OWNERSHIP.set_servers(discord_id, server_ids)
+            if changed:
+                for owner in changed:
+                    if owner != discord_id:
+                        self.user_server_cache.invalidate(owner)
+                self._save_server_lists(changed)
+                print(f"Saved updated user servers data to disk after syncing for user {discord_id}")
+
+            return servers
         except Exception as e:
             print(f"Exception syncing user servers: {str(e)}")
             traceback.print_exc()
-            return False
+            return None
 
     async def can_create_server(self, discord_id):
-        """Check if a user can create more servers (limit of 2)"""
-        try:
-            # Sync the user's servers first
-            await self.sync_user_servers(discord_id)
-
-            if discord_id not in USER_SERVERS:
-                USER_SERVERS[discord_id] = []
-                return True
-
-            return len(USER_SERVERS[discord_id]) < 2  # Max 2 servers per user
-        except Exception as e:
-            print(f"Exception checking if user can create server: {str(e)}")
-            traceback.print_exc()
-            # Default to allowing server creation if there's an error
-            return True
-
-    async def register_server_for_user(self, discord_id, server_id):
-        """Register a server as belonging to a user"""
-        if discord_id not in USER_SERVERS:
-            USER_SERVERS[discord_id] = []
-
-        USER_SERVERS[discord_id].append(server_id)
+        """Check if a user can create more servers, from the locally known server list"""
+        return OWNERSHIP.server_count(discord_id) < MAX_SERVERS_PER_USER
+
+    async def register_server_for_user(self, discord_id, server_id, server=None):
+        """Register a server as belonging to a user; server is its panel attributes, written through to the cache"""
+        changed = OWNERSHIP.add_server(discord_id, server_id)
+        if server is not None:
+            self.user_server_cache.add(discord_id, server)
+        else:
+            self.user_server_cache.invalidate(discord_id)
 
-        # Save the updated data to disk
-        persistence.save_user_servers(USER_SERVERS)
+        # Save the new server to disk, and the list of any user it was recorded for before
+        self._save_server_lists(owner for owner in changed if owner != discord_id)
+        persistence.add_user_server(discord_id, server_id)
         print(f"Saved updated user servers data to disk after registering server {server_id} for user {discord_id}")
 
         return True
 
+    def _save_server_lists(self, discord_ids):
+        """Write the current server lists of the given users to disk"""
+        for discord_id in dict.fromkeys(discord_ids):
+            persistence.set_user_servers(discord_id, list(USER_SERVERS.get(discord_id, ())))
+
     async def reset_user_password(self, user_id):
         """Reset a user's password"""
         try:
             # First get the user details
             user_url = f"{self.base_url}/api/application/users/{user_id}"
-            user_response = requests.get(user_url, headers=self.headers)
+            user_response = await self._request('GET', user_url)
 
             if user_response.status_code != 200:
                 print(f"Error getting user details: {user_response.text}")
@@ -527,9 +798,11 @@ class PterodactylAPI:
                 "password": new_password
             }
 
-            response = requests.patch(url, headers=self.headers, json=payload)
+            response = await self._request('PATCH', url, json=payload)
 
             if response.status_code == 200:
+                if self.mirror is not None:
+                    self.mirror.upsert_user(response.json()['attributes'])
                 return new_password
             else:
                 print(f"Error resetting password: {response.text}")
@@ -542,92 +815,62 @@ class PterodactylAPI:
     async def get_locations(self):
         """Get all available locations"""
         url = f"{self.base_url}/api/application/locations"
-        response = requests.get(url, headers=self.headers)
 
-        if response.status_code == 200:
-            return response.json()['data']
-        else:
-            print(f"Error getting locations: {response.text}")
+        try:
+            return await self.catalog.get(('locations',), CATALOG_CACHE_TTL['locations'], lambda: self.list_all(url))
+        except PterodactylAPIError as e:
+            print(f"Error getting locations: {e.text}")
+            return []
+        except Exception as e:
+            print(f"Exception getting locations: {str(e)}")
             return []
 
-    async def get_nodes(self):
-        """Get all available nodes"""
+    async def get_nodes(self, fresh=False):
+        """Get all available nodes (fresh=True skips the catalog cache)"""
         url = f"{self.base_url}/api/application/nodes"
-        response = requests.get(url, headers=self.headers)
 
-        if response.status_code == 200:
-            return response.json()['data']
-        else:
-            print(f"Error getting nodes: {response.text}")
+        try:
+            if fresh:
+                return await self.catalog.refresh(('nodes',), lambda: self.list_all(url))
+            return await self.catalog.get(('nodes',), CATALOG_CACHE_TTL['nodes'], lambda: self.list_all(url))
+        except PterodactylAPIError as e:
+            print(f"Error getting nodes: {e.text}")
+            return []
+        except Exception as e:
+            print(f"Exception getting nodes: {str(e)}")
             return []
 
     async def get_node_allocations(self, node_id):
-        """Get all allocations for a node"""
+        """Get all allocations for a node, or None if they could not be fetched"""
         url = f"{self.base_url}/api/application/nodes/{node_id}/allocations"
-        response = requests.get(url, headers=self.headers)
 
-        if response.status_code == 200:
-            return response.json()['data']
-        else:
-            print(f"Error getting allocations: {response.text}")
-            return []
-
-    async def get_available_allocation(self, node_id):
-        """Get an available allocation for a node"""
-        allocations = await self.get_node_allocations(node_id)
-        available_allocations = []
-
-        for allocation in allocations:
-            if not allocation['attributes']['assigned']:
-                available_allocations.append(allocation['attributes'])
-
-        if available_allocations:
-            return random.choice(available_allocations)
-        else:
+        try:
+            return await self.list_all(url)
+        except PterodactylAPIError as e:
+            print(f"Error getting allocations: {e.text}")
+            return None
+        except Exception as e:
+            print(f"Exception getting allocations: {str(e)}")
             return None
 
     async def find_available_node_and_allocation(self):
         """Find an available node and allocation"""
-        nodes = await self.get_nodes()
-
-        # Shuffle nodes to distribute servers evenly
-        random.shuffle(nodes)
+        await self.allocation_index.ensure_built()
+        node_allocation = self.allocation_index.pop()
 
-        for node in nodes:
-            node_id = node['attributes']['id']
-            allocation = await self.get_available_allocation(node_id)
+        if node_allocation is None:
+            # Ports may have been freed outside the bot since the last reconcile
+            await self.allocation_index.build()
+            node_allocation = self.allocation_index.pop()
 
-            if allocation:
-                return {
-                    'node': node['attributes'],
-                    'allocation': allocation
-                }
-
-        return None
+        return node_allocation
 
-    def get_allocation_sync(self, allocation_id):
-        """Get allocation details by ID - sync version"""
+    async def get_allocation(self, allocation_id):
+        """Get allocation details by ID"""
         try:
-            # First try to get the allocation from the nodes
-            nodes_url = f"{self.base_url}/api/application/nodes"
-            nodes_response = requests.get(nodes_url, headers=self.headers)
-
-            if nodes_response.status_code == 200:
-                nodes = nodes_response.json()['data']
-
-                # Try each node
-                for node in nodes:
-                    node_id = node['attributes']['id']
-                    allocations_url = f"{self.base_url}/api/application/nodes/{node_id}/allocations"
-                    allocations_response = requests.get(allocations_url, headers=self.headers)
-
-                    if allocations_response.status_code == 200:
-                        allocations = allocations_response.json()['data']
-
-                        # Look for the allocation
-                        for allocation in allocations:
-                            if allocation['attributes']['id'] == allocation_id:
-                                return allocation['attributes']
+            allocation = await self.allocation_index.resolve(allocation_id)
+            if allocation:
+                return allocation
 
             # If we couldn't find it, return a default allocation
             print(f"Could not find allocation {allocation_id}, returning default")
@@ -645,3 +888,52 @@ class PterodactylAPI:
                 'ip': 'Unknown',
                 'port': 'Unknown'
             }
+
+    async def get_server_allocation(self, server):
+        """Get the default allocation of a server, preferring the included relationship over the index"""
+        allocation_id = server.get('allocation')
+        if allocation_id is None:
+            return None
+        if isinstance(allocation_id, dict):
+            return allocation_id
+
+        included = server.get('relationships', {}).get('allocations', {}).get('data', [])
+        for allocation in included:
+            if allocation['attributes']['id'] == allocation_id:
+                return allocation['attributes']
+
+        return await self.get_allocation(allocation_id)
+
+    async def get_servers_details(self, pterodactyl_user_id, servers):
+        """Look up the account and every server's allocation at the same time
+
+        Returns (user, [allocation or None per server]). At most SERVERS_DETAILS_CONCURRENCY
+        allocation lookups run at once; lookups still running after SERVERS_DETAILS_TIMEOUT
+        (capped by the current deadline) are cancelled and left as None, so a slow lookup
+        costs its own detail instead of the whole reply.
+        """
+        semaphore = asyncio.Semaphore(SERVERS_DETAILS_CONCURRENCY)
+
+        async def bounded(lookup):
+            async with semaphore:
+                return await lookup()
+
+        tasks = [asyncio.ensure_future(self.get_user(pterodactyl_user_id))]
+        tasks += [asyncio.ensure_future(bounded(lambda server=server: self.get_server_allocation(server)))
+                  for server in servers]
+        done, pending = await asyncio.wait(tasks, timeout=max(timeout_for(SERVERS_DETAILS_TIMEOUT), 0))
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"Server details: {len(pending)} of {len(tasks)} lookups did not finish in time")
+
+        results = []
+        for task in tasks:
+            if task not in done:
+                results.append(None)
+            elif task.exception() is not None:
+                print(f"Error getting server details: {task.exception()}")
+                results.append(None)
+            else:
+                results.append(task.result())
+        return results[0], results[1:]
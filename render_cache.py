@@ -0,0 +1,38 @@
+import hashlib
+import json
+
+def content_version(data):
+    """Get a short hash of JSON-like data, which changes whenever the data does"""
+    encoded = json.dumps(data, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+class RenderCache:
+    """Prebuilt static parts of command output, rebuilt when the data they come from changes
+
+    Each entry is stored with the version of its source data (a hash of the templates,
+    the catalog cache's version, ...); a lookup with any other version builds the entry
+    again. Cached embeds are shared, so callers copy them before adding per-user fields.
+    """
+    def __init__(self):
+        self._entries = {}  # Format: {name: (version, value)}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, version, build):
+        """Get the value rendered for version, calling build() if it is missing or outdated"""
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        value = build()
+        self._entries[name] = (version, value)
+        return value
+
+    def invalidate(self, name=None):
+        """Drop one rendered entry, or every entry"""
+        if name is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(name, None)
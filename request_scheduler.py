@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from config import PTERODACTYL_RATE_LIMIT, SCHEDULER_BACKGROUND_RESERVE
+
+# Request priorities, lower runs first
+INTERACTIVE = 0  # Slash commands
+OAUTH = 1        # OAuth callbacks from the web server
+BACKGROUND = 2   # Reconciles, cache refreshes and other background jobs
+
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', OAUTH: 'oauth', BACKGROUND: 'background'}
+
+# Priority of the panel requests made by the current task
+request_priority = contextvars.ContextVar('request_priority', default=INTERACTIVE)
+
+# Longest pause applied to background requests after repeated 429s
+MAX_BACKGROUND_BACKOFF = 300
+
+@contextmanager
+def priority(level):
+    """Run the enclosed panel requests at the given priority"""
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+async def run_with_priority(coro, level):
+    """Await a coroutine with its panel requests sent at the given priority"""
+    with priority(level):
+        return await coro
+
+class PriorityTicket:
+    """Priority of one request made on behalf of several callers, raised when a more urgent caller joins"""
+    def __init__(self, level):
+        self.level = level
+        self.future = None  # Set while the request is queued for a token
+
+class RequestScheduler:
+    """Token bucket in front of the application API with per-priority queues
+
+    The bucket starts from PTERODACTYL_RATE_LIMIT and is re-tuned from the
+    X-RateLimit-* headers the panel sends back. Background requests keep a
+    reserve of tokens free for interactive ones and back off after a 429.
+    """
+    def __init__(self, limit_per_minute=PTERODACTYL_RATE_LIMIT, background_reserve=SCHEDULER_BACKGROUND_RESERVE):
+        self.capacity = float(limit_per_minute)
+        self.rate = limit_per_minute / 60.0  # Tokens per second
+        self.tokens = self.capacity
+        self.background_reserve = background_reserve
+        self._updated = time.monotonic()
+
+        self.paused_until = 0.0             # Every priority waits until then after a 429
+        self.background_paused_until = 0.0
+        self._background_backoff = 0.0
+
+        self._queue = []                    # Format: [(priority, seq, future)]
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self._wakeup = None
+
+        self.granted = {level: 0 for level in PRIORITY_NAMES}
+        self.throttled = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def _wait_time(self, level):
+        now = self._refill()
+        paused_until = self.paused_until
+        needed = 1.0
+
+        if level == BACKGROUND:
+            paused_until = max(paused_until, self.background_paused_until)
+            needed += self.capacity * self.background_reserve
+
+        if paused_until > now:
+            return paused_until - now
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def try_acquire(self, level=None):
+        """Take a token only if one is free right now without queueing"""
+        if level is None:
+            level = request_priority.get()
+
+        if self._queue or self._wait_time(level) > 0:
+            return False
+        self.tokens -= 1
+        self.granted[level] += 1
+        return True
+
+    async def acquire(self, level=None, ticket=None):
+        """Wait for a token at the given priority (defaults to the ticket's, then the task's request_priority)"""
+        if ticket is not None:
+            level = ticket.level
+        elif level is None:
+            level = request_priority.get()
+
+        # Fast path when nobody is queued
+        if not self._queue and self._wait_time(level) == 0:
+            self.tokens -= 1
+            self.granted[level] += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (level, next(self._seq), future))
+        if ticket is not None:
+            ticket.future = future
+        self._wake()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The token was granted as we were cancelled, give it back
+                self.tokens += 1
+            raise
+        finally:
+            if ticket is not None:
+                ticket.future = None
+
+    def promote(self, ticket, level):
+        """Raise a ticket to a more urgent priority, moving it up the queue if it is waiting for a token"""
+        if level >= ticket.level:
+            return
+        ticket.level = level
+        if ticket.future is not None and not ticket.future.done():
+            # The old entry stays in the heap and is skipped once the future is granted
+            heapq.heappush(self._queue, (level, next(self._seq), ticket.future))
+            self._wake()
+
+    def _wake(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        else:
+            self._wakeup.set()
+
+    async def _dispatch(self):
+        while self._queue:
+            level, _, future = self._queue[0]
+
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+
+            wait = self._wait_time(level)
+            if wait <= 0:
+                heapq.heappop(self._queue)
+                self.tokens -= 1
+                self.granted[level] += 1
+                future.set_result(None)
+                continue
+
+            # Sleep until a token is due, or until a higher priority request arrives
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def observe(self, status_code, headers):
+        """Tune the bucket from a panel response's rate limit headers"""
+        now = self._refill()
+
+        limit = headers.get('X-RateLimit-Limit')
+        remaining = headers.get('X-RateLimit-Remaining')
+        try:
+            if limit is not None and float(limit) > 0 and float(limit) != self.capacity:
+                self.capacity = float(limit)
+                self.rate = self.capacity / 60.0
+            if remaining is not None:
+                # The panel's count is authoritative when it is lower than ours
+                self.tokens = min(self.tokens, float(remaining))
+        except ValueError:
+            pass
+
+        if status_code == 429:
+            self.throttled += 1
+            try:
+                retry_after = float(headers.get('Retry-After', 0))
+            except ValueError:
+                retry_after = 0
+            retry_after = retry_after or 60.0 / max(self.capacity, 1.0)
+
+            self.paused_until = max(self.paused_until, now + retry_after)
+            self.tokens = 0.0
+
+            # Background work backs off exponentially on repeated 429s
+            self._background_backoff = min(MAX_BACKGROUND_BACKOFF, max(retry_after, self._background_backoff * 2))
+            self.background_paused_until = max(self.background_paused_until, now + self._background_backoff)
+            print(f"Panel rate limit hit, pausing requests for {retry_after:.1f}s "
+                  f"(background for {self._background_backoff:.1f}s)")
+        elif status_code < 400:
+            self._background_backoff = 0.0
+
+    def stats(self):
+        """Get scheduler counters"""
+        self._refill()
+        return {
+            'tokens': self.tokens,
+            'capacity': self.capacity,
+            'queued': len({id(future) for _, _, future in self._queue if not future.done()}),
+            'throttled': self.throttled,
+            'granted': {PRIORITY_NAMES[level]: count for level, count in self.granted.items()},
+        }
@@ -0,0 +1,235 @@
+import os
+import socket
+import threading
+import time
+import uuid
+
+# Channel carrying changes to every process sharing the store
+CHANGES_CHANNEL = "state-changes"
+
+# Compare-and-set attempts before a change is given up
+MAX_UPDATE_ATTEMPTS = 20
+
+class SharedBackend:
+    """Persistence backend on a StateBackend shared by several bot and web server processes
+
+    Each user's server list, link and auth code is its own key, so processes never rewrite
+    each other's data. Server lists and ownership change through compare-and-set retry loops,
+    and every change is published with its new value so other processes can update the
+    state they hold in memory (see watch). With a writer, changes are queued in order and
+    sent from the writer thread once per flush window.
+    """
+    def __init__(self, state, writer=None):
+        self.state = state
+        self.writer = writer
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queued = []  # Changes waiting for the writer thread
+        self._queue_lock = threading.Lock()
+
+    def _write(self, change):
+        """Apply a change now, or queue it for the writer thread"""
+        if self.writer is None:
+            return self._apply([change])
+
+        with self._queue_lock:
+            self._queued.append(change)
+        self.writer.mark_dirty(id(self), self._apply_queued)
+        return True
+
+    def _apply_queued(self):
+        with self._queue_lock:
+            changes, self._queued = self._queued, []
+        for position, change in enumerate(changes):
+            if not self._apply([change]):
+                # Keep the changes not yet made ahead of anything queued since, the writer retries them
+                with self._queue_lock:
+                    self._queued[:0] = changes[position:]
+                return False
+        return True
+
+    def _apply(self, changes):
+        """Run queued changes in order; each is a function returning the message to publish, or None"""
+        try:
+            for change in changes:
+                message = change()
+                if message is not None:
+                    message['origin'] = self.process_id
+                    self.state.publish(CHANGES_CHANNEL, message)
+            return True
+        except Exception as e:
+            print(f"Error writing to shared state: {e}")
+            return False
+
+    def _update(self, key, update):
+        """Replace a key's value with update(current) using compare-and-set, retrying on conflicts; returns the new value"""
+        for _ in range(MAX_UPDATE_ATTEMPTS):
+            current = self.state.get(key)
+            value = update(current)
+            if value == current or self.state.compare_and_set(key, current, value):
+                return value
+        raise RuntimeError(f"Too many concurrent updates to {key}")
+
+    def _set_owner(self, server_id, discord_id):
+        """Claim a server for a user unless another user already owns it; returns whether the user owns it"""
+        owner = self._update(f"server_owner:{server_id}",
+                             lambda current: discord_id if current is None else current)
+        if owner != discord_id:
+            # Another process assigned it first, theirs stands until they release it
+            print(f"Server {server_id} is already owned by {owner}, not reassigning it to {discord_id}")
+            return False
+        return True
+
+    def _clear_owner(self, server_id, discord_id):
+        # Only clear ownership still held by this user, another process may have reassigned it
+        self.state.compare_and_set(f"server_owner:{server_id}", discord_id, None)
+
+    def import_json(self, user_servers_file, auth_codes_file, pterodactyl_users_file, load_data):
+        """Import the JSON data files once, by whichever process claims the import first"""
+        if not self.state.compare_and_set("meta:json_imported", None, time.time()):
+            return False
+
+        user_servers = load_data(user_servers_file)
+        auth_codes = load_data(auth_codes_file)
+        pterodactyl_users = load_data(pterodactyl_users_file)
+        now = time.time()
+
+        for discord_id, pterodactyl_user_id in pterodactyl_users.items():
+            self.state.set(f"user_link:{discord_id}", pterodactyl_user_id)
+        for discord_id, server_ids in user_servers.items():
+            self.state.set(f"user_servers:{discord_id}", list(server_ids))
+            for server_id in server_ids:
+                self._set_owner(server_id, str(discord_id))
+        for code, record in auth_codes.items():
+            # Plain Discord IDs from before expiry tracking are not imported
+            if isinstance(record, dict) and record['expires_at'] > now:
+                self.state.set(f"auth_code:{code}", record, ttl=record['expires_at'] - now)
+
+        print(f"Imported {len(pterodactyl_users)} linked users, {len(user_servers)} user server records "
+              f"and {len(auth_codes)} auth codes from JSON into the shared state")
+        return True
+
+    def watch(self, callback):
+        """Call callback(message) for every change made by another process"""
+        def handle(message):
+            if message.get('origin') != self.process_id:
+                callback(message)
+        self.state.subscribe(CHANGES_CHANNEL, handle)
+
+    def load_user_servers(self):
+        return {key.split(':', 1)[1]: server_ids for key, server_ids in self.state.scan("user_servers:")}
+
+    def load_user_auth_codes(self):
+        return {key.split(':', 1)[1]: record for key, record in self.state.scan("auth_code:")}
+
+    def load_pterodactyl_users(self):
+        return {key.split(':', 1)[1]: user_id for key, user_id in self.state.scan("user_link:")}
+
+    def _change_user_servers(self, discord_id, update):
+        discord_id = str(discord_id)
+        previous = []
+
+        def record_previous(current):
+            previous[:] = current or []
+            return update(current or [])
+
+        server_ids = self._update(f"user_servers:{discord_id}", record_previous)
+        for server_id in server_ids:
+            if server_id not in previous:
+                self._set_owner(server_id, discord_id)
+        for server_id in previous:
+            if server_id not in server_ids:
+                self._clear_owner(server_id, discord_id)
+        return {'type': 'user_servers', 'discord_id': discord_id, 'server_ids': server_ids}
+
+    def add_user_server(self, discord_id, server_id):
+        return self._write(lambda: self._change_user_servers(
+            discord_id, lambda current: current if server_id in current else current + [server_id]))
+
+    def remove_server(self, server_id):
+        def change():
+            discord_id = self.state.get(f"server_owner:{server_id}")
+            if discord_id is not None:
+                return self._change_user_servers(
+                    discord_id, lambda current: [s for s in current if s != server_id])
+
+            # No owner recorded, e.g. data written before ownership keys existed
+            for key, server_ids in self.state.scan("user_servers:"):
+                if server_id in server_ids:
+                    return self._change_user_servers(
+                        key.split(':', 1)[1], lambda current: [s for s in current if s != server_id])
+            return None
+        return self._write(change)
+
+    def set_user_servers(self, discord_id, server_ids):
+        server_ids = list(server_ids)
+        return self._write(lambda: self._change_user_servers(discord_id, lambda current: server_ids))
+
+    def link_user(self, discord_id, pterodactyl_user_id):
+        def change():
+            self.state.set(f"user_link:{discord_id}", pterodactyl_user_id)
+            return {'type': 'link', 'discord_id': str(discord_id), 'pterodactyl_user_id': pterodactyl_user_id}
+        return self._write(change)
+
+    def add_auth_code(self, code, discord_id, expires_at):
+        def change():
+            ttl = expires_at - time.time()
+            if ttl <= 0:
+                return None
+            self.state.set(f"auth_code:{code}", {'discord_id': str(discord_id), 'expires_at': expires_at}, ttl=ttl)
+            return {'type': 'auth_code', 'code': code, 'discord_id': str(discord_id), 'expires_at': expires_at}
+        return self._write(change)
+
+    def remove_auth_codes(self, codes):
+        codes = list(codes)
+
+        def change():
+            for code in codes:
+                self.state.delete(f"auth_code:{code}")
+            return {'type': 'auth_codes_removed', 'codes': codes}
+        return self._write(change)
+
+    def _replace(self, prefix, document, set_value):
+        for key, _ in self.state.scan(prefix):
+            if key.split(':', 1)[1] not in document:
+                self.state.delete(key)
+        for name, value in document.items():
+            set_value(str(name), value)
+
+    def save_user_servers(self, user_servers):
+        user_servers = {str(k): list(v) for k, v in user_servers.items()}
+
+        def change():
+            for key, _ in self.state.scan("user_servers:"):
+                discord_id = key.split(':', 1)[1]
+                if discord_id not in user_servers:
+                    self._change_user_servers(discord_id, lambda current: [])
+                    self.state.delete(key)
+            for discord_id, server_ids in user_servers.items():
+                self._change_user_servers(discord_id, lambda current, server_ids=server_ids: server_ids)
+            return {'type': 'reload', 'document': 'user_servers'}
+        return self._write(change)
+
+    def save_user_auth_codes(self, user_auth_codes):
+        user_auth_codes = dict(user_auth_codes)
+
+        def change():
+            now = time.time()
+
+            def set_code(code, record):
+                if record['expires_at'] > now:
+                    self.state.set(f"auth_code:{code}", record, ttl=record['expires_at'] - now)
+            self._replace("auth_code:", user_auth_codes, set_code)
+            return {'type': 'auth_codes_replaced', 'records': user_auth_codes}
+        return self._write(change)
+
+    def save_pterodactyl_users(self, pterodactyl_users):
+        pterodactyl_users = dict(pterodactyl_users)
+
+        def change():
+            self._replace("user_link:", pterodactyl_users,
+                          lambda discord_id, user_id: self.state.set(f"user_link:{discord_id}", user_id))
+            return {'type': 'reload', 'document': 'pterodactyl_users'}
+        return self._write(change)
+
+    def close(self):
+        self.state.close()
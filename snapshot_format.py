@@ -0,0 +1,160 @@
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+from itertools import accumulate
+
+# Binary snapshot of the user/server registry
+#
+# Layout (little endian), users sorted by Discord ID so the arrays can be searched directly:
+#   header      magic 'PTSN', u16 version, u64 journal sequence number
+#   users       u32 user count n, then
+#               n x u64 discord_id, n x i64 pterodactyl_user_id (-1 when not linked),
+#               n x i32 server count (-1 when the user has no server record)
+#   servers     u32 server count, then that many i64 server_id, grouped by user in user order
+#   auth codes  u32 count, then count x (u8 code length, code bytes, u64 discord_id, f64 expires_at)
+#   trailer     u32 CRC32 of everything before it
+MAGIC = b'PTSN'
+VERSION = 1
+NOT_LINKED = -1
+NO_SERVER_RECORD = -1
+
+HEADER = struct.Struct('<4sHQ')
+COUNT = struct.Struct('<I')
+AUTH_CODE = struct.Struct('<Qd')
+
+# Registry columns as loaded from a snapshot; server_start has n + 1 offsets into servers
+SnapshotArrays = namedtuple('SnapshotArrays', 'seq ids links server_counts server_start servers auth_codes')
+
+class SnapshotFormatError(Exception):
+    """Raised when a binary snapshot is corrupt or from an unknown version"""
+
+def _to_little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _from_little_endian(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def encode_snapshot(state):
+    """Pack a snapshot dict ({'seq', 'user_servers', 'auth_codes', 'pterodactyl_users'}) into bytes"""
+    user_servers = {int(k): v for k, v in state.get('user_servers', {}).items()}
+    pterodactyl_users = {int(k): v for k, v in state.get('pterodactyl_users', {}).items()}
+    discord_ids = sorted(user_servers.keys() | pterodactyl_users.keys())
+
+    ids = array('Q', discord_ids)
+    links = array('q', (int(pterodactyl_users.get(discord_id, NOT_LINKED)) for discord_id in discord_ids))
+    server_counts = array('i', (len(user_servers[discord_id]) if discord_id in user_servers else NO_SERVER_RECORD
+                                for discord_id in discord_ids))
+    servers = array('q', (int(server_id) for discord_id in discord_ids for server_id in user_servers.get(discord_id, ())))
+
+    parts = [
+        HEADER.pack(MAGIC, VERSION, state.get('seq', 0)),
+        COUNT.pack(len(ids)), _to_little_endian(ids), _to_little_endian(links), _to_little_endian(server_counts),
+        COUNT.pack(len(servers)), _to_little_endian(servers),
+    ]
+
+    # Plain Discord IDs from before expiry tracking are not kept
+    auth_codes = {code: record for code, record in state.get('auth_codes', {}).items() if isinstance(record, dict)}
+    parts.append(COUNT.pack(len(auth_codes)))
+    for code, record in auth_codes.items():
+        code_bytes = code.encode()
+        parts.append(bytes([len(code_bytes)]) + code_bytes + AUTH_CODE.pack(int(record['discord_id']), record['expires_at']))
+
+    body = b''.join(parts)
+    return body + COUNT.pack(zlib.crc32(body))
+
+def decode_arrays(data):
+    """Unpack bytes written by encode_snapshot into SnapshotArrays, one array copy per column"""
+    if len(data) < HEADER.size + COUNT.size:
+        raise SnapshotFormatError("Snapshot is truncated")
+
+    body = memoryview(data)[:-COUNT.size]
+    (checksum,) = COUNT.unpack_from(data, len(data) - COUNT.size)
+    if zlib.crc32(body) != checksum:
+        raise SnapshotFormatError("Snapshot checksum mismatch")
+
+    magic, version, seq = HEADER.unpack_from(body, 0)
+    if magic != MAGIC:
+        raise SnapshotFormatError("Not a binary snapshot")
+    if version != VERSION:
+        raise SnapshotFormatError(f"Unsupported snapshot version {version}")
+    offset = HEADER.size
+
+    (user_count,) = COUNT.unpack_from(body, offset)
+    offset += COUNT.size
+    columns = []
+    for typecode, width in (('Q', 8), ('q', 8), ('i', 4)):
+        columns.append(_from_little_endian(typecode, body[offset:offset + user_count * width]))
+        offset += user_count * width
+    ids, links, server_counts = columns
+
+    (server_count,) = COUNT.unpack_from(body, offset)
+    offset += COUNT.size
+    servers = _from_little_endian('q', body[offset:offset + server_count * 8])
+    offset += server_count * 8
+    server_start = array('I', accumulate((max(count, 0) for count in server_counts), initial=0))
+
+    (code_count,) = COUNT.unpack_from(body, offset)
+    offset += COUNT.size
+    auth_codes = {}
+    for _ in range(code_count):
+        length = body[offset]
+        code = bytes(body[offset + 1:offset + 1 + length]).decode()
+        offset += 1 + length
+        discord_id, expires_at = AUTH_CODE.unpack_from(body, offset)
+        offset += AUTH_CODE.size
+        auth_codes[code] = {'discord_id': str(discord_id), 'expires_at': expires_at}
+
+    return SnapshotArrays(seq, ids, links, server_counts, server_start, servers, auth_codes)
+
+def decode_snapshot(data):
+    """Unpack bytes written by encode_snapshot into a snapshot dict with string Discord IDs"""
+    arrays = decode_arrays(data)
+    keys = list(map(str, arrays.ids))
+
+    pterodactyl_users = {key: link for key, link in zip(keys, arrays.links) if link != NOT_LINKED}
+    user_servers = {}
+    servers = arrays.servers
+    for key, count, start in zip(keys, arrays.server_counts, arrays.server_start):
+        if count != NO_SERVER_RECORD:
+            user_servers[key] = servers[start:start + count].tolist()
+
+    return {
+        'seq': arrays.seq,
+        'user_servers': user_servers,
+        'auth_codes': arrays.auth_codes,
+        'pterodactyl_users': pterodactyl_users,
+    }
+
+def write_snapshot(file_path, state):
+    """Write a binary snapshot atomically (temp file, fsync, rename)"""
+    data = encode_snapshot(state)
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+def _read(file_path, decode):
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'rb') as f:
+        return decode(f.read())
+
+def read_snapshot(file_path):
+    """Read a binary snapshot as a snapshot dict in one read, or None if the file does not exist"""
+    return _read(file_path, decode_snapshot)
+
+def read_snapshot_arrays(file_path):
+    """Read a binary snapshot as SnapshotArrays in one read, or None if the file does not exist"""
+    return _read(file_path, decode_arrays)
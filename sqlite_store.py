@@ -0,0 +1,204 @@
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS user_links (
+    discord_id TEXT PRIMARY KEY,
+    pterodactyl_user_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_links_pterodactyl_user ON user_links (pterodactyl_user_id);
+CREATE TABLE IF NOT EXISTS server_owners (
+    discord_id TEXT NOT NULL,
+    server_id INTEGER NOT NULL,
+    PRIMARY KEY (discord_id, server_id)
+);
+CREATE INDEX IF NOT EXISTS idx_server_owners_server ON server_owners (server_id);
+CREATE TABLE IF NOT EXISTS known_users (
+    discord_id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS auth_codes (
+    code TEXT PRIMARY KEY,
+    discord_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_auth_codes_discord ON auth_codes (discord_id);
+"""
+
+INSERT_AUTH_CODE = "INSERT OR REPLACE INTO auth_codes (code, discord_id, created_at, expires_at) VALUES (?, ?, ?, ?)"
+
+class SQLiteBackend:
+    """Persistence backend storing links, server ownership and auth codes in SQLite (WAL mode)
+
+    Every change is a single-row write instead of a rewrite of a whole JSON document.
+    Each thread gets its own connection; WAL lets the bot and web server read while one writes.
+    With a writer, changes are queued and committed in one transaction per flush window.
+    """
+    def __init__(self, path, writer=None):
+        self.path = path
+        self.writer = writer
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._queued = []  # Statements waiting for the writer thread
+        self._queue_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self, conn):
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(auth_codes)")]
+        if 'expires_at' not in columns:
+            # Codes stored before expiry tracking can never be checked, drop them
+            with conn:
+                conn.execute("ALTER TABLE auth_codes ADD COLUMN expires_at REAL NOT NULL DEFAULT 0")
+                conn.execute("DELETE FROM auth_codes")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_auth_codes_expiry ON auth_codes (expires_at)")
+
+    def _write(self, statements):
+        """Commit (sql, params) statements now, or queue them for the writer thread"""
+        if self.writer is None:
+            return self._commit(statements)
+
+        with self._queue_lock:
+            self._queued.extend(statements)
+        self.writer.mark_dirty(self.path, self._commit_queued)
+        return True
+
+    def _commit_queued(self):
+        with self._queue_lock:
+            statements, self._queued = self._queued, []
+        if statements and not self._commit(statements):
+            # Keep the batch ahead of anything queued since, the writer retries it
+            with self._queue_lock:
+                self._queued[:0] = statements
+            return False
+        return True
+
+    def _commit(self, statements):
+        """Run (sql, params) statements in one transaction"""
+        with self._write_lock:
+            try:
+                conn = self._connect()
+                with conn:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+                return True
+            except Exception as e:
+                print(f"Error writing to {self.path}: {e}")
+                return False
+
+    def import_json(self, user_servers_file, auth_codes_file, pterodactyl_users_file, load_data):
+        """Import the JSON data files once, the first time the database is opened"""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+            return False
+
+        user_servers = load_data(user_servers_file)
+        auth_codes = load_data(auth_codes_file)
+        pterodactyl_users = load_data(pterodactyl_users_file)
+        now = time.time()
+
+        statements = []
+        for discord_id, pterodactyl_user_id in pterodactyl_users.items():
+            statements.append(("INSERT OR REPLACE INTO user_links VALUES (?, ?)", (str(discord_id), pterodactyl_user_id)))
+        for discord_id, server_ids in user_servers.items():
+            statements.append(("INSERT OR IGNORE INTO known_users VALUES (?)", (str(discord_id),)))
+            for server_id in server_ids:
+                statements.append(("INSERT OR IGNORE INTO server_owners VALUES (?, ?)", (str(discord_id), server_id)))
+        for code, record in auth_codes.items():
+            # Plain Discord IDs from before expiry tracking are not imported
+            if isinstance(record, dict):
+                statements.append((INSERT_AUTH_CODE, (code, str(record['discord_id']), now, record['expires_at'])))
+        statements.append(("INSERT OR REPLACE INTO meta VALUES ('json_imported', ?)", (json.dumps(now),)))
+
+        if not self._commit(statements):
+            return False
+        print(f"Imported {len(pterodactyl_users)} linked users, {len(user_servers)} user server records "
+              f"and {len(auth_codes)} auth codes from JSON into {self.path}")
+        return True
+
+    def load_user_servers(self):
+        conn = self._connect()
+        user_servers = {discord_id: [] for (discord_id,) in conn.execute("SELECT discord_id FROM known_users")}
+        for discord_id, server_id in conn.execute("SELECT discord_id, server_id FROM server_owners ORDER BY rowid"):
+            user_servers.setdefault(discord_id, []).append(server_id)
+        return user_servers
+
+    def load_user_auth_codes(self):
+        conn = self._connect()
+        return {
+            code: {'discord_id': discord_id, 'expires_at': expires_at}
+            for code, discord_id, expires_at in conn.execute("SELECT code, discord_id, expires_at FROM auth_codes")
+        }
+
+    def load_pterodactyl_users(self):
+        conn = self._connect()
+        return {discord_id: user_id for discord_id, user_id in conn.execute("SELECT discord_id, pterodactyl_user_id FROM user_links")}
+
+    def add_user_server(self, discord_id, server_id):
+        return self._write([
+            ("INSERT OR IGNORE INTO known_users VALUES (?)", (str(discord_id),)),
+            ("INSERT OR IGNORE INTO server_owners VALUES (?, ?)", (str(discord_id), server_id)),
+        ])
+
+    def remove_server(self, server_id):
+        return self._write([("DELETE FROM server_owners WHERE server_id = ?", (server_id,))])
+
+    def set_user_servers(self, discord_id, server_ids):
+        statements = [
+            ("INSERT OR IGNORE INTO known_users VALUES (?)", (str(discord_id),)),
+            ("DELETE FROM server_owners WHERE discord_id = ?", (str(discord_id),)),
+        ]
+        statements += [("INSERT OR IGNORE INTO server_owners VALUES (?, ?)", (str(discord_id), server_id))
+                       for server_id in server_ids]
+        return self._write(statements)
+
+    def link_user(self, discord_id, pterodactyl_user_id):
+        return self._write([("INSERT OR REPLACE INTO user_links VALUES (?, ?)", (str(discord_id), pterodactyl_user_id))])
+
+    def add_auth_code(self, code, discord_id, expires_at):
+        return self._write([(INSERT_AUTH_CODE, (code, str(discord_id), time.time(), expires_at))])
+
+    def remove_auth_codes(self, codes):
+        return self._write([("DELETE FROM auth_codes WHERE code = ?", (code,)) for code in codes])
+
+    def save_user_servers(self, user_servers):
+        statements = [("DELETE FROM server_owners", ()), ("DELETE FROM known_users", ())]
+        for discord_id, server_ids in user_servers.items():
+            statements.append(("INSERT OR IGNORE INTO known_users VALUES (?)", (str(discord_id),)))
+            statements += [("INSERT OR IGNORE INTO server_owners VALUES (?, ?)", (str(discord_id), server_id))
+                           for server_id in server_ids]
+        return self._write(statements)
+
+    def save_user_auth_codes(self, user_auth_codes):
+        now = time.time()
+        statements = [("DELETE FROM auth_codes", ())]
+        statements += [(INSERT_AUTH_CODE, (code, str(record['discord_id']), now, record['expires_at']))
+                       for code, record in user_auth_codes.items()]
+        return self._write(statements)
+
+    def save_pterodactyl_users(self, pterodactyl_users):
+        statements = [("DELETE FROM user_links", ())]
+        statements += [("INSERT OR REPLACE INTO user_links VALUES (?, ?)", (str(discord_id), user_id))
+                       for discord_id, user_id in pterodactyl_users.items()]
+        return self._write(statements)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
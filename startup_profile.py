@@ -0,0 +1,63 @@
+import builtins
+import sys
+import time
+from contextlib import contextmanager
+
+class StartupProfiler:
+    """Records how long each startup stage and each first-time module import takes"""
+    def __init__(self):
+        self.stages = []   # Format: [(stage_name, seconds)]
+        self.imports = {}  # Format: {module_name: (inclusive_seconds, self_seconds)}
+        self._nested = []  # Time spent in nested imports, one entry per import in progress
+        self._original_import = None
+
+    def install(self):
+        """Start timing imports"""
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        """Stop timing imports"""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Only absolute imports of modules not loaded yet cost anything worth reporting
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        self._nested.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            self.imports.setdefault(name, (elapsed, elapsed - nested))
+
+    @contextmanager
+    def stage(self, name):
+        """Time a startup stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - started))
+
+    def report(self, top=20):
+        """Print stage times and the slowest imports"""
+        print("Startup stages:")
+        for name, seconds in self.stages:
+            print(f"  {name:<30} {seconds * 1000:9.1f} ms")
+        print(f"  {'total':<30} {sum(seconds for _, seconds in self.stages) * 1000:9.1f} ms")
+
+        if self.imports:
+            print(f"Slowest imports (top {top} by self time):")
+            print(f"  {'module':<40} {'self':>9} {'inclusive':>12}")
+            slowest = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            for name, (inclusive, own) in slowest:
+                print(f"  {name:<40} {own * 1000:6.1f} ms {inclusive * 1000:9.1f} ms")
@@ -0,0 +1,206 @@
+import json
+import threading
+import time
+import traceback
+
+class StateBackend:
+    """Key-value store shared by every bot and web server process
+
+    Values are JSON-serializable. compare_and_set is the only way to change a value
+    that several processes may update at once; publish/subscribe carries cache
+    invalidations between processes.
+    """
+    def get(self, key):
+        """Get a value, or None if the key does not exist"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """Set a value, optionally expiring after ttl seconds"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Delete a key"""
+        raise NotImplementedError
+
+    def compare_and_set(self, key, expected, value, ttl=None):
+        """Set key to value only if it currently holds expected (None = must not exist), deleting it if value is None"""
+        raise NotImplementedError
+
+    def scan(self, prefix):
+        """Iterate (key, value) for every key starting with prefix"""
+        raise NotImplementedError
+
+    def publish(self, channel, message):
+        """Send a message to every subscriber of a channel, in every process"""
+        raise NotImplementedError
+
+    def subscribe(self, channel, callback):
+        """Call callback(message) for every message published on a channel"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class LocalStateBackend(StateBackend):
+    """In-process stand-in for a shared store, for a single process and for testing offline"""
+    def __init__(self):
+        self._data = {}         # Format: {key: (value, expires_at or None)}
+        self._subscribers = {}  # Format: {channel: [callback, ...]}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        # Caller must hold the lock
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return json.loads(entry[0]) if entry is not None else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (json.dumps(value), time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def compare_and_set(self, key, expected, value, ttl=None):
+        with self._lock:
+            entry = self._live(key)
+            current = json.loads(entry[0]) if entry is not None else None
+            if current != expected:
+                return False
+            if value is None:
+                self._data.pop(key, None)
+            else:
+                self._data[key] = (json.dumps(value), time.time() + ttl if ttl else None)
+            return True
+
+    def scan(self, prefix):
+        with self._lock:
+            keys = [key for key in self._data if key.startswith(prefix)]
+            entries = [(key, self._live(key)) for key in keys]
+        return [(key, json.loads(entry[0])) for key, entry in entries if entry is not None]
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception as e:
+                print(f"Error handling message on {channel}: {e}")
+                traceback.print_exc()
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+# Sets KEYS[1] to ARGV[2] only if it holds ARGV[1]; an empty ARGV[1] means the key must not exist,
+# an empty ARGV[2] deletes the key, and ARGV[3] is an optional expiry in milliseconds
+COMPARE_AND_SET_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if ARGV[1] == '' then
+    if current then return 0 end
+elseif current ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] == '' then
+    redis.call('DEL', KEYS[1])
+elseif ARGV[3] ~= '' then
+    redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+else
+    redis.call('SET', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+class RedisStateBackend(StateBackend):
+    """Shared store on a Redis server (needs the optional redis package)"""
+    def __init__(self, url, namespace="pterobot:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a Redis state backend: pip install redis")
+
+        self.namespace = namespace
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._compare_and_set = self._client.register_script(COMPARE_AND_SET_SCRIPT)
+        self._pubsub = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(value):
+        # Canonical form so compare_and_set can compare encoded values
+        return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+    def get(self, key):
+        value = self._client.get(self.namespace + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.namespace + key, self._encode(value), px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key):
+        self._client.delete(self.namespace + key)
+
+    def compare_and_set(self, key, expected, value, ttl=None):
+        # Re-encode what is stored so formatting differences don't fail the comparison
+        stored = self._client.get(self.namespace + key)
+        if stored is not None and json.loads(stored) != expected:
+            return False
+        if stored is None and expected is not None:
+            return False
+        return bool(self._compare_and_set(
+            keys=[self.namespace + key],
+            args=[stored or '', self._encode(value) if value is not None else '', int(ttl * 1000) if ttl else ''],
+        ))
+
+    def scan(self, prefix):
+        keys = list(self._client.scan_iter(match=self.namespace + prefix + '*', count=1000))
+        entries = []
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            for key, value in zip(batch, self._client.mget(batch)):
+                if value is not None:
+                    entries.append((key[len(self.namespace):], json.loads(value)))
+        return entries
+
+    def publish(self, channel, message):
+        self._client.publish(self.namespace + channel, json.dumps(message))
+
+    def subscribe(self, channel, callback):
+        def handler(raw):
+            try:
+                callback(json.loads(raw['data']))
+            except Exception as e:
+                print(f"Error handling message on {channel}: {e}")
+                traceback.print_exc()
+
+        with self._lock:
+            if self._pubsub is None:
+                self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(**{self.namespace + channel: handler})
+            if self._listener is None:
+                self._listener = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+        if self._pubsub is not None:
+            self._pubsub.close()
+        self._client.close()
+
+def create_state_backend(url):
+    """Create the state backend for a URL: 'local' or a redis:// / rediss:// URL"""
+    if not url or url == 'local':
+        return LocalStateBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStateBackend(url)
+    raise ValueError(f"Unsupported state backend URL: {url}")
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from allocation_index import AllocationIndex, MISS_REBUILD_INTERVAL
+
+class FakePanel:
+    """Stands in for PterodactylAPI: two nodes with two allocations each"""
+    def __init__(self):
+        self.allocations = {
+            1: [{'attributes': {'id': 11, 'assigned': False}}, {'attributes': {'id': 12, 'assigned': True}}],
+            2: [{'attributes': {'id': 21, 'assigned': False}}, {'attributes': {'id': 22, 'assigned': False}}],
+        }
+        self.node_fetches = 0
+        self.failing = set()
+
+    async def get_nodes(self, fresh=False):
+        return [{'attributes': {'id': node_id, 'name': f"node-{node_id}"}} for node_id in self.allocations]
+
+    async def get_node_allocations(self, node_id):
+        self.node_fetches += 1
+        await asyncio.sleep(0.01)
+        if node_id in self.failing:
+            return None
+        return self.allocations[node_id]
+
+def test_concurrent_misses_share_one_rebuild():
+    async def main():
+        panel = FakePanel()
+        index = AllocationIndex(panel)
+        await index.ensure_built()
+        index.built_at = time.monotonic() - MISS_REBUILD_INTERVAL
+        panel.allocations[1].append({'attributes': {'id': 13, 'assigned': True}})
+        panel.node_fetches = 0
+
+        results = await asyncio.gather(*(index.resolve(allocation_id) for allocation_id in (13, 99, 98, 97)))
+        return panel, results
+
+    panel, results = asyncio.run(main())
+    assert results[0] == {'id': 13, 'assigned': True, 'node': 1}
+    assert results[1:] == [None, None, None]
+    # One rebuild fetches each node once
+    assert panel.node_fetches == 2
+
+def test_pop_rotates_between_nodes_and_release_returns():
+    async def main():
+        index = AllocationIndex(FakePanel())
+        await index.ensure_built()
+        first, second = index.pop(), index.pop()
+        index.release(first['allocation']['id'])
+        return index, first, second
+
+    index, first, second = asyncio.run(main())
+    assert first['node']['id'] != second['node']['id']
+    assert first['allocation']['id'] in index.free[first['node']['id']]
+
+def test_failed_node_fetch_keeps_its_allocations():
+    async def main():
+        panel = FakePanel()
+        index = AllocationIndex(panel)
+        await index.ensure_built()
+        panel.failing.add(2)
+        panel.allocations[1].append({'attributes': {'id': 13, 'assigned': False}})
+        await index.build()
+        return index
+
+    index = asyncio.run(main())
+    assert set(index.allocations) == {11, 12, 13, 21, 22}
+    assert set(index.free[2]) == {21, 22}
+    assert index.lookup(21)['node'] == 2
+
+def test_build_does_not_change_panel_responses():
+    async def main():
+        panel = FakePanel()
+        index = AllocationIndex(panel)
+        await index.ensure_built()
+        allocation = index.pop()['allocation']
+        index.confirm(allocation['id'])
+        return panel, allocation
+
+    panel, allocation = asyncio.run(main())
+    fetched = [item['attributes'] for items in panel.allocations.values() for item in items]
+    assert allocation['assigned'] is True
+    assert all(item['assigned'] is False for item in fetched if item['id'] == allocation['id'])
@@ -0,0 +1,54 @@
+import time
+import pytest
+import persistence
+from auth_code_store import AuthCodeStore
+
+@pytest.fixture
+def stored(monkeypatch):
+    """Record what the store writes to persistence instead of writing it"""
+    writes = {'added': [], 'removed': []}
+    monkeypatch.setattr(persistence, 'add_auth_code', lambda code, discord_id, expires_at: writes['added'].append(code))
+    monkeypatch.setattr(persistence, 'remove_auth_codes', lambda codes: writes['removed'].extend(codes))
+    return writes
+
+def test_code_expires_after_its_ttl(stored):
+    store = AuthCodeStore(ttl=0.1, per_user_limit=3)
+    store.issue("ABC123", 111)
+    assert store["ABC123"] == "111"
+
+    time.sleep(0.15)
+    with pytest.raises(KeyError):
+        store["ABC123"]
+    assert store.expires_at("ABC123") is None
+    assert stored == {'added': ["ABC123"], 'removed': ["ABC123"]}
+
+def test_expired_records_are_dropped_on_load(stored):
+    now = time.time()
+    store = AuthCodeStore(600, 3, {
+        "LIVE01": {'discord_id': "111", 'expires_at': now + 60},
+        "OLD001": {'discord_id': "111", 'expires_at': now - 60},
+        "PLAIN1": "111",  # From before expiry tracking
+    })
+    assert list(store) == ["LIVE01"]
+    assert sorted(stored['removed']) == ["OLD001", "PLAIN1"]
+
+def test_third_code_evicts_the_users_oldest(stored):
+    store = AuthCodeStore(ttl=600, per_user_limit=2)
+    store.issue("FIRST1", 111)
+    store.issue("SECND2", 111)
+    store.issue("OTHER3", 222)
+    store.issue("THIRD3", 111)
+
+    assert sorted(store) == ["OTHER3", "SECND2", "THIRD3"]
+    assert stored['removed'] == ["FIRST1"]
+
+def test_purger_drops_expired_codes(stored):
+    store = AuthCodeStore(ttl=600, per_user_limit=3)
+    store.issue("SHORT1", 111, ttl=0.05)
+    store.issue("LONG01", 111)
+    store.start_purger(0.1)
+
+    time.sleep(0.3)
+    # The purger removed it without any lookup
+    assert stored['removed'] == ["SHORT1"]
+    assert store._codes.keys() == {"LONG01"}
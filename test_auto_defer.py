@@ -0,0 +1,75 @@
+import asyncio
+import auto_defer
+from auto_defer import CommandLatency, LATENCY_MIN_SAMPLES, auto_defer as auto_defer_command, responder_for
+
+class FakeResponse:
+    def __init__(self, log):
+        self.log = log
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, ephemeral, thinking):
+        self.done = True
+        self.log.append(('defer', None))
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        self.log.append(('response', content or kwargs.get('embed')))
+
+class FakeFollowup:
+    def __init__(self, log):
+        self.log = log
+
+    async def send(self, content=None, **kwargs):
+        self.log.append(('followup', content or kwargs.get('embed')))
+
+class FakeInteraction:
+    """Records what a command sends; edit_original_response edits the response or the deferred placeholder"""
+    def __init__(self):
+        self.log = []
+        self.extras = {}
+        self.response = FakeResponse(self.log)
+        self.followup = FakeFollowup(self.log)
+
+    async def edit_original_response(self, content=None, **kwargs):
+        self.log.append(('edit_original', content or kwargs.get('embed')))
+
+def run_command(monkeypatch, delay, budget=0.1, path='panel', latency=None):
+    monkeypatch.setattr(auto_defer, 'AUTO_DEFER_BUDGET', budget)
+    monkeypatch.setattr(auto_defer, 'command_latency', latency or CommandLatency(95))
+
+    @auto_defer_command()
+    async def create(interaction):
+        responder = responder_for(interaction)
+        await responder.follow_path(path)
+        await asyncio.sleep(delay)
+        await responder.send(embed='progress')
+        await responder.edit(embed='done')
+        await responder.send('extra')
+
+    interaction = FakeInteraction()
+    asyncio.run(create(interaction))
+    return interaction.log
+
+def test_fast_command_answers_inline(monkeypatch):
+    log = run_command(monkeypatch, delay=0)
+    assert log == [('response', 'progress'), ('edit_original', 'done'), ('followup', 'extra')]
+
+def test_late_command_is_deferred_and_edits_the_same_message(monkeypatch):
+    log = run_command(monkeypatch, delay=0.2)
+    # The first send fills the deferred placeholder, so later edits change that message
+    assert log == [('defer', None), ('edit_original', 'progress'), ('edit_original', 'done'), ('followup', 'extra')]
+
+def test_slow_path_is_deferred_before_running(monkeypatch):
+    latency = CommandLatency(95)
+    for _ in range(LATENCY_MIN_SAMPLES):
+        latency.record('create', 'panel', 5.0)
+        latency.record('create', 'cached', 0.01)
+
+    log = run_command(monkeypatch, delay=0, budget=2, latency=latency)
+    assert log[0] == ('defer', None)
+
+    log = run_command(monkeypatch, delay=0, budget=2, path='cached', latency=latency)
+    assert log[0] == ('response', 'progress')
@@ -0,0 +1,38 @@
+from autocomplete_index import AutocompleteIndex
+
+def make_index():
+    index = AutocompleteIndex()
+    index.add(1, "mc-survival (abc)", "1")
+    index.add(2, "web hosting (def)", "2")
+    index.add(3, "python bot (ghi)", "3")
+    index.add(4, "nodejs api", "4")
+    return index
+
+def test_prefix_and_multi_word_search():
+    index = make_index()
+    assert index.search("surv") == [("mc-survival (abc)", "1")]
+    assert index.search("web h") == [("web hosting (def)", "2")]
+    assert index.search("bot py") == [("python bot (ghi)", "3")]
+    assert len(index.search("")) == 4
+
+def test_typos_match_fuzzily():
+    index = make_index()
+    assert index.search("survivl") == [("mc-survival (abc)", "1")]
+    assert index.search("pyhton") == [("python bot (ghi)", "3")]
+    assert index.search("nodjs") == [("nodejs api", "4")]
+
+def test_unmatched_first_word_counts_against_the_score():
+    index = make_index()
+    # Only one of two words matches, which meets the threshold; two unmatched words out of three don't
+    assert index.search("zzzz python") == [("python bot (ghi)", "3")]
+    assert index.search("zzzz qqqq python") == []
+
+def test_replace_and_remove_prune_the_index():
+    index = make_index()
+    index.add(1, "mc-creative", "1")
+    assert index.search("surv") == []
+    assert index.search("creat") == [("mc-creative", "1")]
+    for key in (1, 2, 3, 4):
+        index.remove(key)
+    assert len(index) == 0
+    assert index._root.children == {} and index._grams == {}
@@ -0,0 +1,42 @@
+from compact_registry import CompactRegistry
+from lazy_state import LazyMapping
+from ownership_index import OwnershipIndex
+
+def make_registry(users=1000):
+    user_servers = {str(10 ** 17 + index): [index * 10, index * 10 + 1] for index in range(users)}
+    pterodactyl_users = {str(10 ** 17 + index): index + 1 for index in range(users)}
+    return CompactRegistry.from_mappings(user_servers, pterodactyl_users)
+
+def test_reads_stay_in_columns():
+    registry = make_registry()
+    assert registry.pterodactyl_users[str(10 ** 17 + 5)] == 6
+    assert str(10 ** 17 + 5) in registry.user_servers
+    assert len(registry.user_servers) == 1000
+    assert registry.overlay == {}
+
+def test_changes_go_to_the_overlay():
+    registry = make_registry()
+    discord_id = str(10 ** 17 + 7)
+    registry.user_servers[discord_id].append(999)
+    del registry.pterodactyl_users[str(10 ** 17 + 8)]
+
+    assert list(registry.user_servers[discord_id]) == [70, 71, 999]
+    assert str(10 ** 17 + 8) not in registry.pterodactyl_users
+    assert len(registry.pterodactyl_users) == 999
+    assert set(registry.overlay) == {10 ** 17 + 7, 10 ** 17 + 8}
+    assert dict(registry.user_servers.readonly_items())[discord_id].tolist() == [70, 71, 999]
+
+def test_ownership_index_does_not_fill_the_overlay():
+    registry = make_registry()
+    user_servers = LazyMapping(lambda: registry.user_servers, "user server records")
+    pterodactyl_users = LazyMapping(lambda: registry.pterodactyl_users, "linked Pterodactyl users")
+    ownership = OwnershipIndex(user_servers, pterodactyl_users)
+
+    assert ownership.owner_of(421) == str(10 ** 17 + 42)
+    assert ownership.discord_id_for(43) == str(10 ** 17 + 42)
+    assert registry.overlay == {}
+
+    ownership.add_server(str(10 ** 17 + 1), 421)
+    assert ownership.owner_of(421) == str(10 ** 17 + 1)
+    assert 421 not in registry.user_servers[str(10 ** 17 + 42)]
+    assert len(registry.overlay) == 2
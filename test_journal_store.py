@@ -0,0 +1,123 @@
+import json
+from journal_store import JournalBackend
+
+def open_backend(tmp_path, compact_every=1000):
+    backend = JournalBackend(str(tmp_path / "snapshot.json"), str(tmp_path / "journal.log"), compact_every)
+    missing = str(tmp_path / "missing.json")
+    backend.open(missing, missing, missing)
+    return backend
+
+class FailingJournal:
+    """Journal file that writes half of the next line, then fails like a full disk"""
+    def __init__(self, journal):
+        self.journal = journal
+
+    def tell(self):
+        return self.journal.tell()
+
+    def write(self, data):
+        self.journal.write(data[:len(data) // 2])
+        self.journal.flush()
+        raise OSError("No space left on device")
+
+    def close(self):
+        self.journal.close()
+
+def test_changes_are_replayed_after_a_restart(tmp_path):
+    backend = open_backend(tmp_path)
+    backend.link_user("111", 7)
+    backend.add_user_server("111", 1001)
+    backend.add_user_server("111", 1002)
+    backend.remove_server(1001)
+
+    reopened = open_backend(tmp_path)
+    assert reopened.load_pterodactyl_users() == {"111": 7}
+    assert reopened.load_user_servers() == {"111": [1002]}
+
+def test_torn_last_line_is_skipped_and_trimmed(tmp_path):
+    backend = open_backend(tmp_path)
+    backend.add_user_server("111", 1001)
+    backend._journal.close()
+    journal_path = tmp_path / "journal.log"
+    with open(journal_path, 'a') as f:
+        # A crash mid-append leaves half a line behind
+        f.write('{"seq": 2, "op": "add_user_ser')
+
+    reopened = open_backend(tmp_path)
+    assert reopened.load_user_servers() == {"111": [1001]}
+    assert journal_path.read_text().endswith('\n')
+
+    reopened.add_user_server("111", 1002)
+    lines = journal_path.read_text().splitlines()
+    assert [json.loads(line)['seq'] for line in lines] == [1, 2]
+    assert open_backend(tmp_path).load_user_servers() == {"111": [1001, 1002]}
+
+def test_failed_append_leaves_memory_and_journal_unchanged(tmp_path):
+    backend = open_backend(tmp_path)
+    backend.add_user_server("111", 1001)
+    backend._journal = FailingJournal(backend._journal)
+
+    assert backend.add_user_server("111", 1002) is False
+    assert backend.load_user_servers() == {"111": [1001]}
+
+    # The half-written line was cut off, so the next append is readable
+    assert backend.add_user_server("111", 1003) is True
+    assert open_backend(tmp_path).load_user_servers() == {"111": [1001, 1003]}
+
+def test_compaction_folds_the_journal_into_the_snapshot(tmp_path):
+    backend = open_backend(tmp_path, compact_every=3)
+    for server_id in range(1001, 1005):
+        backend.add_user_server("111", server_id)
+    backend._compactor.join()
+
+    reopened = open_backend(tmp_path, compact_every=3)
+    assert reopened.load_user_servers() == {"111": [1001, 1002, 1003, 1004]}
+    assert json.loads((tmp_path / "snapshot.json").read_text())['seq'] == 3
+
+def open_compact_backend(tmp_path, compact_every=1000):
+    backend = JournalBackend(str(tmp_path / "snapshot.bin"), str(tmp_path / "journal.log"), compact_every, compact=True)
+    missing = str(tmp_path / "missing.json")
+    backend.open(missing, missing, missing)
+    return backend
+
+def test_compact_load_reads_the_binary_snapshot_and_journal(tmp_path):
+    backend = open_compact_backend(tmp_path)
+    # First start has no binary snapshot yet, so the data is loaded into dicts
+    assert backend.load_compact_registry() is None
+    backend.link_user("111", 7)
+    backend.add_user_server("111", 1001)
+    backend.add_user_server("222", 2001)
+    backend.close()
+
+    backend = open_compact_backend(tmp_path)
+    backend.add_user_server("111", 1002)
+    backend.remove_server(2001)
+    backend.link_user("333", 9)
+    backend._journal.close()
+
+    reopened = open_compact_backend(tmp_path)
+    registry = reopened.load_compact_registry()
+    assert dict(registry.pterodactyl_users) == {"111": 7, "333": 9}
+    assert {discord_id: list(servers) for discord_id, servers in registry.user_servers.readonly_items()} == \
+        {"111": [1001, 1002], "222": []}
+    assert reopened.load_user_servers() == {"111": [1001, 1002], "222": []}
+    # Only the users the journal changed were copied out of the snapshot's columns
+    assert set(reopened.registry.overlay) == {111, 222, 333}
+
+    # The registry handed out is a copy, changing it leaves the backend alone
+    registry.user_servers["111"].append(1003)
+    assert reopened.load_user_servers()["111"] == [1001, 1002]
+
+def test_compact_backend_compacts_into_the_binary_snapshot(tmp_path):
+    backend = open_compact_backend(tmp_path, compact_every=3)
+    backend.add_user_server("111", 1001)
+    backend.close()
+
+    backend = open_compact_backend(tmp_path, compact_every=3)
+    for server_id in range(1002, 1006):
+        backend.add_user_server("111", server_id)
+    backend._compactor.join()
+    backend._journal.close()
+
+    reopened = open_compact_backend(tmp_path, compact_every=3)
+    assert reopened.load_user_servers() == {"111": [1001, 1002, 1003, 1004, 1005]}
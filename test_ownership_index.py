@@ -0,0 +1,30 @@
+import asyncio
+import importlib
+import json
+from ownership_index import OwnershipIndex
+from panel_http import PanelResponse
+
+def test_relinked_panel_user_maps_to_the_latest_discord_user():
+    index = OwnershipIndex({}, {"111": 7})
+    assert index.discord_id_for(7) == "111"
+    index.link("222", 7)
+    index.link("111", 8)
+    assert index.discord_id_for(7) == "222"
+    assert index.discord_id_for(8) == "111"
+
+def test_panel_fallback_checks_the_linked_discord_user(monkeypatch):
+    monkeypatch.setenv('PTERODACTYL_URL', 'http://panel')
+    monkeypatch.setenv('PTERODACTYL_API_KEY', 'key')
+    pterodactyl_api = importlib.import_module('pterodactyl_api')
+    # Server 1001 is not in anyone's list, so the panel is asked who owns it
+    monkeypatch.setattr(pterodactyl_api, 'OWNERSHIP', OwnershipIndex({}, {"111": 7, "222": 8}))
+    api = pterodactyl_api.PterodactylAPI.__new__(pterodactyl_api.PterodactylAPI)
+    api.base_url = 'http://panel'
+
+    async def fake_request(method, url, params=None, json_body=None):
+        return PanelResponse(200, json.dumps({'attributes': {'id': 1001, 'user': 7}}), {})
+
+    api._request = fake_request
+    is_owner, server_data = asyncio.run(api.check_server_owner(1001, "111"))
+    assert is_owner and server_data['user'] == 7
+    assert asyncio.run(api.check_server_owner(1001, "222")) == (False, None)
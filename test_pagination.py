@@ -0,0 +1,62 @@
+import asyncio
+import importlib
+import pytest
+from panel_http import PanelResponse
+
+ITEM_COUNT = 250
+
+@pytest.fixture
+def api(monkeypatch):
+    """PterodactylAPI on a fake panel listing ITEM_COUNT users, paginated like the application API"""
+    monkeypatch.setenv('PTERODACTYL_URL', 'http://panel')
+    monkeypatch.setenv('PTERODACTYL_API_KEY', 'key')
+    pterodactyl_api = importlib.import_module('pterodactyl_api')
+    api = pterodactyl_api.PterodactylAPI.__new__(pterodactyl_api.PterodactylAPI)
+    api.pages = []
+
+    async def fake_request(method, url, params=None, json=None):
+        per_page, page = params['per_page'], params['page']
+        api.pages.append(page)
+        await asyncio.sleep(0.01)
+        total_pages = -(-ITEM_COUNT // per_page)
+        items = [{'attributes': {'id': index}} for index in range((page - 1) * per_page, min(page * per_page, ITEM_COUNT))]
+        body = {'data': items, 'meta': {'pagination': {'current_page': page, 'total_pages': total_pages}}}
+        return PanelResponse(200, pterodactyl_api.json.dumps(body), {})
+
+    api._request = fake_request
+    return api
+
+def test_list_all_walks_every_page(api):
+    items = asyncio.run(api.list_all('http://panel/api/application/users'))
+    assert [item['attributes']['id'] for item in items] == list(range(ITEM_COUNT))
+    assert api.pages == [1, 2, 3]
+
+def test_find_first_stops_at_the_first_match(api):
+    async def main():
+        item = await api.find_first('http://panel/api/application/users', lambda user: user['attributes']['id'] == 5)
+        # Let a cancelled prefetch settle before checking what was requested
+        await asyncio.sleep(0.05)
+        return item
+
+    assert asyncio.run(main()) == {'attributes': {'id': 5}}
+    # At most the prefetch of the second page went out, the third was never requested
+    assert api.pages in ([1], [1, 2])
+
+def test_find_first_without_a_match_reads_every_page(api):
+    assert asyncio.run(api.find_first('http://panel/api/application/users', lambda user: False)) is None
+    assert api.pages == [1, 2, 3]
+
+def test_connection_errors_leave_nodes_and_locations_empty(api, monkeypatch):
+    import aiohttp
+
+    async def reset_request(method, url, params=None, json=None):
+        raise aiohttp.ClientConnectionError("Connection reset by peer")
+
+    api._request = reset_request
+    api.base_url = 'http://panel'
+    api.catalog = importlib.import_module('catalog_cache').CatalogCache(16, 60)
+
+    async def main():
+        return await api.get_nodes(), await api.get_locations(), await api.get_node_allocations(1)
+
+    assert asyncio.run(main()) == ([], [], None)
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+import deadlines
+import panel_http
+from panel_http import PanelResponse, PanelTimeoutError, SingleFlight
+from request_scheduler import BACKGROUND, RequestScheduler, run_with_priority
+
+PANEL_DELAY = 0.3
+
+@pytest.fixture
+def panel(monkeypatch):
+    """Fresh coalescing and scheduling state, with a fake panel that answers GETs after PANEL_DELAY"""
+    sent = []
+
+    async def fake_attempt(method, url, headers, params, json_body):
+        # Bounded like the real _attempt: request timeout capped by the current deadline
+        timeout = deadlines.timeout_for(panel_http.PTERODACTYL_REQUEST_TIMEOUT)
+        sent.append(url)
+        try:
+            await asyncio.wait_for(asyncio.sleep(PANEL_DELAY), timeout)
+        except asyncio.TimeoutError:
+            raise PanelTimeoutError(f"Panel did not answer {method} {url} within {timeout:.1f}s")
+        return PanelResponse(200, '{"ok": true}', {})
+
+    scheduler = RequestScheduler(limit_per_minute=600)
+    monkeypatch.setattr(panel_http, '_attempt', fake_attempt)
+    monkeypatch.setattr(panel_http, 'scheduler', scheduler)
+    monkeypatch.setattr(panel_http, 'single_flight', SingleFlight(scheduler))
+    return sent
+
+def test_joined_interactive_caller_promotes_a_background_get(panel):
+    scheduler = panel_http.scheduler
+    scheduler.tokens = 0  # Background requests now wait for the reserve to refill, about 15s
+
+    async def main():
+        background = asyncio.ensure_future(run_with_priority(panel_http.request('GET', 'http://panel/nodes'), BACKGROUND))
+        await asyncio.sleep(0.01)
+        with deadlines.deadline(2):
+            interactive = await panel_http.request('GET', 'http://panel/nodes')
+        return interactive, await background
+
+    interactive, background = asyncio.run(main())
+    assert interactive is background
+    assert scheduler.granted == {0: 1, 1: 0, 2: 0}
+    assert len(panel) == 1
+
+def test_identical_gets_are_coalesced(panel):
+    async def main():
+        return await asyncio.gather(*(panel_http.request('GET', 'http://panel/nests') for _ in range(5)))
+
+    responses = asyncio.run(main())
+    assert len(panel) == 1
+    assert all(response is responses[0] for response in responses)
+
+def test_joined_caller_keeps_its_own_deadline(panel):
+    async def short():
+        with deadlines.deadline(PANEL_DELAY / 3):
+            return await panel_http.request('GET', 'http://panel/nests')
+
+    async def long():
+        await asyncio.sleep(0.01)
+        with deadlines.deadline(30):
+            return await panel_http.request('GET', 'http://panel/nests')
+
+    async def main():
+        return await asyncio.gather(short(), long(), return_exceptions=True)
+
+    short_result, long_result = asyncio.run(main())
+    assert isinstance(short_result, PanelTimeoutError)
+    assert isinstance(long_result, PanelResponse) and long_result.json() == {'ok': True}
+    assert len(panel) == 1
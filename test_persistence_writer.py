@@ -0,0 +1,49 @@
+from persistence_writer import PersistenceWriter
+from sqlite_store import SQLiteBackend
+
+# Long enough that the writer thread never fires during a test, which calls flush() itself
+FLUSH_WINDOW = 60
+
+def test_failed_write_stays_pending_until_it_succeeds():
+    writer = PersistenceWriter(FLUSH_WINDOW)
+    results = [False, True]
+    calls = []
+
+    def write():
+        calls.append(1)
+        return results[len(calls) - 1]
+
+    writer.mark_dirty('file', write)
+    assert writer.flush() is False
+    assert writer.stats()['pending'] == 1
+    assert writer.flush() is True
+    assert len(calls) == 2
+    assert writer.stats() == {'notifications': 1, 'writes': 1, 'failures': 1, 'pending': 0}
+
+def test_newer_write_replaces_a_failed_one():
+    writer = PersistenceWriter(FLUSH_WINDOW)
+    written = []
+
+    def failing():
+        raise OSError("disk full")
+
+    writer.mark_dirty('file', failing)
+    assert writer.flush() is False
+    writer.mark_dirty('file', lambda: written.append('newer'))
+    assert writer.flush() is True
+    assert written == ['newer']
+
+def test_sqlite_batch_is_kept_when_its_commit_fails(tmp_path, monkeypatch):
+    writer = PersistenceWriter(FLUSH_WINDOW)
+    backend = SQLiteBackend(str(tmp_path / "bot.db"), writer)
+    commit = backend._commit
+    monkeypatch.setattr(backend, '_commit', lambda statements: False)
+
+    backend.add_user_server("111", 1001)
+    assert writer.flush() is False
+
+    backend.add_user_server("111", 1002)
+    monkeypatch.setattr(backend, '_commit', commit)
+    assert writer.flush() is True
+    assert backend.load_user_servers() == {"111": [1001, 1002]}
+    backend.close()
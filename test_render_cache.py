@@ -0,0 +1,26 @@
+from render_cache import RenderCache
+
+def test_entries_are_rebuilt_for_a_new_version():
+    cache = RenderCache()
+    builds = []
+    build = lambda: builds.append(1) or len(builds)
+    assert cache.get('list', 'v1', build) == 1
+    assert cache.get('list', 'v1', build) == 1
+    assert cache.get('list', 'v2', build) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_templates_version_is_hashed_once(monkeypatch):
+    import config
+    # Restored after the test, like the patched templates
+    monkeypatch.setattr(config, '_templates_version', config._templates_version)
+    hashed = []
+    monkeypatch.setattr(config, 'content_version', lambda data: hashed.append(1) or f"v{len(hashed)}")
+    monkeypatch.setitem(config.SERVER_TEMPLATES, 'extra', {'name': 'Extra'})
+
+    version = config.templates_version()
+    # Autocomplete asks on every keystroke, which must not hash the templates again
+    assert all(config.templates_version() == version for _ in range(10))
+    assert hashed == []
+
+    config.refresh_templates_version()
+    assert config.templates_version() == "v1"
@@ -0,0 +1,53 @@
+import asyncio
+from request_scheduler import BACKGROUND, INTERACTIVE, OAUTH, PriorityTicket, RequestScheduler
+
+def test_grants_follow_priority():
+    async def main():
+        scheduler = RequestScheduler(limit_per_minute=600, background_reserve=0)
+        scheduler.tokens = 0
+        order = []
+
+        async def request(level, name):
+            await scheduler.acquire(level)
+            order.append(name)
+
+        await asyncio.gather(request(BACKGROUND, 'background'), request(OAUTH, 'oauth'), request(INTERACTIVE, 'interactive'))
+        return order
+
+    assert asyncio.run(main()) == ['interactive', 'oauth', 'background']
+
+def test_background_keeps_a_reserve_for_interactive_requests():
+    scheduler = RequestScheduler(limit_per_minute=100, background_reserve=0.25)
+    scheduler.tokens = 20
+    assert not scheduler.try_acquire(BACKGROUND)
+    assert scheduler.try_acquire(INTERACTIVE)
+
+def test_429_pauses_background_longer():
+    scheduler = RequestScheduler(limit_per_minute=600)
+    scheduler.observe(429, {'Retry-After': '2'})
+    scheduler.observe(429, {'Retry-After': '2'})
+    assert scheduler.tokens == 0
+    assert scheduler.background_paused_until - scheduler.paused_until >= 1.9
+    assert scheduler.throttled == 2
+
+def test_promoted_ticket_moves_ahead():
+    async def main():
+        scheduler = RequestScheduler(limit_per_minute=600, background_reserve=0)
+        scheduler.tokens = 0
+        order = []
+        ticket = PriorityTicket(BACKGROUND)
+
+        async def request(name, level=None, ticket=None):
+            await scheduler.acquire(level, ticket)
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(request('oauth', OAUTH)), asyncio.ensure_future(request('shared', ticket=ticket))]
+        await asyncio.sleep(0)
+        scheduler.promote(ticket, INTERACTIVE)
+        await asyncio.gather(*tasks)
+        return order, scheduler
+
+    order, scheduler = asyncio.run(main())
+    assert order == ['shared', 'oauth']
+    assert scheduler.granted[INTERACTIVE] == 1 and scheduler.granted[BACKGROUND] == 0
+    assert scheduler.stats()['queued'] == 0
@@ -0,0 +1,86 @@
+import time
+from shared_store import SharedBackend
+from state_backend import LocalStateBackend
+
+def test_two_processes():
+    # Two backends on one store stand in for two bot processes
+    store = LocalStateBackend()
+    first = SharedBackend(store)
+    second = SharedBackend(store)
+
+    received = []
+    second.watch(received.append)
+
+    first.link_user("111", 7)
+    first.add_user_server("111", 1001)
+    second.add_user_server("111", 1002)
+    first.add_auth_code("ABC123", "111", time.time() + 60)
+
+    print(f"Links seen by second process: {second.load_pterodactyl_users()}")
+    print(f"Servers seen by second process: {second.load_user_servers()}")
+    print(f"Changes received by second process: {[message['type'] for message in received]}")
+    assert second.load_pterodactyl_users() == {"111": 7}
+    assert second.load_user_servers() == {"111": [1001, 1002]}
+    assert "ABC123" in second.load_user_auth_codes()
+    # A process does not receive its own changes
+    assert [message['type'] for message in received] == ['link', 'user_servers', 'auth_code']
+
+    first.remove_server(1001)
+    print(f"Servers after delete: {second.load_user_servers()}")
+    assert second.load_user_servers() == {"111": [1002]}
+    assert store.get("server_owner:1001") is None
+    assert store.get("server_owner:1002") == "111"
+
+def test_compare_and_set():
+    store = LocalStateBackend()
+    assert store.compare_and_set("key", None, [1])
+    assert not store.compare_and_set("key", None, [2])
+    assert not store.compare_and_set("key", [2], [3])
+    assert store.compare_and_set("key", [1], [1, 2])
+    print(f"Value after compare-and-set: {store.get('key')}")
+    assert store.get("key") == [1, 2]
+
+def test_owner_is_not_taken_over_by_another_process(monkeypatch):
+    store = LocalStateBackend()
+    backend = SharedBackend(store)
+    compare_and_set = store.compare_and_set
+    owner_attempts = []
+
+    def racing_compare_and_set(key, expected, value, ttl=None):
+        if key == "server_owner:1001":
+            owner_attempts.append(expected)
+            if len(owner_attempts) == 1:
+                # Another process claims the server between our read and our write
+                store.set(key, "222")
+        return compare_and_set(key, expected, value, ttl)
+
+    monkeypatch.setattr(store, "compare_and_set", racing_compare_and_set)
+    backend.add_user_server("111", 1001)
+    # The lost race is seen on retry, and the other process keeps the server
+    assert owner_attempts == [None]
+    assert store.get("server_owner:1001") == "222"
+
+    backend.add_user_server("222", 1001)
+    assert store.get("server_owner:1001") == "222"
+
+def test_shared_backend_warns_about_local_state(monkeypatch, capsys):
+    import persistence
+    monkeypatch.setattr(persistence, "_backend", None)
+    monkeypatch.setattr(persistence, "_writer", None)
+    monkeypatch.setattr(persistence, "load_data", lambda path: {})
+    persistence.configure("shared", flush_window=0, state_url="local")
+    assert "LOST ON RESTART" in capsys.readouterr().out
+
+def test_auth_code_expiry():
+    store = LocalStateBackend()
+    backend = SharedBackend(store)
+    backend.add_auth_code("OLD", "111", time.time() + 0.1)
+    time.sleep(0.2)
+    print(f"Auth codes after expiry: {backend.load_user_auth_codes()}")
+    assert backend.load_user_auth_codes() == {}
+
+if __name__ == "__main__":
+    test_compare_and_set()
+    test_two_processes()
+    test_auth_code_expiry()
+    print("All shared state tests passed")
@@ -0,0 +1,74 @@
+import time
+from autocomplete_index import AutocompleteIndex
+
+class UserServerCache:
+    """Per-user view of owned servers (panel attributes), fresh for ttl seconds after a panel listing
+
+    Creates and deletes made by the bot are written through to a cached entry without
+    changing its age, so a listing is only needed once the entry goes stale. Each user's
+    server names are also kept in an autocomplete index, which answers even when stale.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}  # Format: {discord_user_id: ([server_attributes, ...], fetched_at)}
+        self._names = {}    # Format: {discord_user_id: AutocompleteIndex of server names}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, discord_id):
+        """Get a copy of a user's cached servers, or None if there is no fresh entry"""
+        entry = self._entries.get(discord_id)
+        if entry is None or time.monotonic() - entry[1] >= self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(entry[0])
+
+    def is_fresh(self, discord_id):
+        """Check if a user's servers can be answered without a panel listing"""
+        entry = self._entries.get(discord_id)
+        return entry is not None and time.monotonic() - entry[1] < self.ttl
+
+    @staticmethod
+    def _index_name(index, server):
+        identifier = server.get('identifier', server['id'])
+        index.add(server['id'], f"{server.get('name', identifier)} ({identifier})"[:100], str(server['id']),
+                  f"{server.get('name', '')} {identifier}")
+
+    def store(self, discord_id, servers):
+        """Store a user's servers as listed by the panel just now"""
+        self._entries[discord_id] = (list(servers), time.monotonic())
+        index = AutocompleteIndex()
+        for server in servers:
+            self._index_name(index, server)
+        self._names[discord_id] = index
+
+    def add(self, discord_id, server):
+        """Write a newly created server through to the user's entry"""
+        entry = self._entries.get(discord_id)
+        if entry is not None and all(cached['id'] != server['id'] for cached in entry[0]):
+            entry[0].append(server)
+            self._index_name(self._names[discord_id], server)
+
+    def remove(self, discord_id, server_id):
+        """Write a deleted server through to its owner's entry"""
+        entry = self._entries.get(discord_id)
+        if entry is not None:
+            entry[0][:] = [server for server in entry[0] if server['id'] != server_id]
+            self._names[discord_id].remove(server_id)
+
+    def search_names(self, discord_id, query, limit=25):
+        """Autocomplete a user's server names: (label, server_id) pairs, or None if the user's servers were never listed"""
+        index = self._names.get(discord_id)
+        if index is None:
+            return None
+        return index.search(query, limit)
+
+    def invalidate(self, discord_id=None):
+        """Drop one user's entry, or every entry"""
+        if discord_id is None:
+            self._entries.clear()
+            self._names.clear()
+        else:
+            self._entries.pop(discord_id, None)
+            self._names.pop(discord_id, None)
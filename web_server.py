@@ -1,66 +1,22 @@
-from flask import Flask, render_template, redirect, url_for, request, session, jsonify
+from flask import Flask, render_template, redirect, request, session
+import asyncio
 import os
+import signal
+import sys
 import uuid
 import threading
 import secrets
-import requests
 from requests_oauthlib import OAuth2Session
+import persistence
+from link_waiters import LINK_WAITERS
+from pterodactyl_api import PterodactylAPI
 from config import (FLASK_SECRET_KEY, WEB_HOST, WEB_PORT, USER_AUTH_CODES,
                    DISCORD_CLIENT_ID, DISCORD_CLIENT_SECRET, DISCORD_REDIRECT_URI,
-                   PTERODACTYL_USERS)
-import persistence
+                   WEB_REQUEST_TIMEOUT, AUTH_CODE_TTL, watch_state)
 
 app = Flask(__name__)
 app.secret_key = FLASK_SECRET_KEY
 
-# Create templates directory if it doesn't exist
-os.makedirs('templates', exist_ok=True)
-
-# Create a simple HTML template for displaying the auth code
-with open('templates/auth_code.html', 'w') as f:
-    f.write("""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Discord Bot Authentication</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            max-width: 600px;
-            margin: 0 auto;
-            padding: 20px;
-            text-align: center;
-        }
-        .code-box {
-            font-size: 24px;
-            font-weight: bold;
-            padding: 15px;
-            margin: 20px 0;
-            background-color: #f0f0f0;
-            border-radius: 5px;
-            border: 1px solid #ddd;
-        }
-        .instructions {
-            margin-bottom: 20px;
-        }
-    </style>
-</head>
-<body>
-    <h1>Discord Bot Authentication</h1>
-    <div class="instructions">
-        <p>Your authentication code is:</p>
-    </div>
-    <div class="code-box">
-        {{ auth_code }}
-    </div>
-    <div class="instructions">
-        <p>Please copy this code and paste it in Discord where prompted.</p>
-        <p>This code will expire in 10 minutes.</p>
-    </div>
-</body>
-</html>
-    """)
-
 # Discord OAuth2 Configuration
 DISCORD_API_BASE_URL = 'https://discord.com/api'
 DISCORD_AUTHORIZATION_BASE_URL = DISCORD_API_BASE_URL + '/oauth2/authorize'
@@ -83,6 +39,14 @@ def set_pterodactyl_api(api_instance):
     global pterodactyl_api
     pterodactyl_api = api_instance
 
+def describe_duration(seconds):
+    """Describe a duration the way the auth code page shows it, e.g. '10 minutes' or '45 seconds'"""
+    if seconds >= 60 and seconds % 60 == 0:
+        value, unit = seconds // 60, "minute"
+    else:
+        value, unit = seconds, "second"
+    return f"{value} {unit}{'' if value == 1 else 's'}"
+
 @app.route('/')
 def index():
     return "Pterodactyl Discord Bot Authentication Server"
@@ -92,18 +56,15 @@ def auth(discord_id):
     # Generate a unique authentication code
     auth_code = secrets.token_hex(3).upper()  # 6 character hex code
 
-    # Store the auth code with the Discord ID
-    USER_AUTH_CODES[auth_code] = discord_id
-
-    # Save the updated auth codes to disk
-    persistence.save_user_auth_codes(USER_AUTH_CODES)
+    # Store the auth code with the Discord ID; it expires after AUTH_CODE_TTL
+    USER_AUTH_CODES.issue(auth_code, discord_id)
     print(f"Saved auth code for Discord user {discord_id}")
 
     # Set a session variable to track this auth code
     session['auth_code'] = auth_code
     session['discord_id'] = discord_id
 
-    return render_template('auth_code.html', auth_code=auth_code)
+    return render_template('auth_code.html', auth_code=auth_code, expires_in=describe_duration(AUTH_CODE_TTL))
 
 @app.route('/oauth')
 def oauth():
@@ -146,11 +107,12 @@ def callback():
         token = oauth.fetch_token(
             DISCORD_TOKEN_URL,
             client_secret=DISCORD_CLIENT_SECRET,
-            authorization_response=request.url
+            authorization_response=request.url,
+            timeout=WEB_REQUEST_TIMEOUT
         )
 
         # Get user info
-        user_response = oauth.get(DISCORD_API_BASE_URL + '/users/@me')
+        user_response = oauth.get(DISCORD_API_BASE_URL + '/users/@me', timeout=WEB_REQUEST_TIMEOUT)
         user_data = user_response.json()
 
         # Extract user information
@@ -171,7 +133,7 @@ def callback():
 
         # Server membership check removed
         # We still get the guilds data for potential future use
-        guilds_response = oauth.get(DISCORD_API_BASE_URL + '/users/@me/guilds')
+        guilds_response = oauth.get(DISCORD_API_BASE_URL + '/users/@me/guilds', timeout=WEB_REQUEST_TIMEOUT)
         guilds_data = guilds_response.json()
 
         # Link user to Pterodactyl
@@ -204,6 +166,9 @@ def callback():
             )
 
             if user:
+                # Wake up the /link command waiting for this user
+                LINK_WAITERS.resolve(discord_id, user)
+
                 # Create a more detailed success message
                 success_message = "Your Discord account has been successfully linked to your Pterodactyl account!"
                 if new_account:
@@ -235,3 +200,20 @@ def run_web_server_in_thread():
     thread.daemon = True
     thread.start()
     return thread
+
+if __name__ == "__main__":
+    # Run the OAuth server as its own process; with PERSISTENCE_BACKEND=shared it shares state with the bot processes
+    # Without the bot, panel calls run on a loop of our own
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="panel-loop", daemon=True).start()
+    api = PterodactylAPI()
+    api.bind_loop(loop)
+    set_pterodactyl_api(api)
+    watch_state()
+    # Stopping the process by SIGTERM unwinds like Ctrl+C, so the finally below runs
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        start_web_server()
+    finally:
+        # Write out changes still waiting in the persistence writer
+        persistence.close()